@@ -0,0 +1,191 @@
+"""
+Local read-only JSON API over the bot's database, for dashboards and notebooks.
+
+Runs inside the bot process (see main.py; enabled by setting ANALYTICS_API_PORT), so
+it shares the process-wide result cache with the bot and answers repeated queries
+from memory. Cache misses are served by a pool of read-only connections on a WAL
+database, so readers never block the ingest writer.
+
+    GET /api/placements?game=<name>[&source=steam|ps]   daily placements (90 days)
+    GET /api/ranks[?source=steam|ps][&timestamp=YYYY-MM-DD HH]   one capture (default: latest)
+    GET /api/short-interest?company=<name>[&start=YYYY-MM-DD]    short position timeseries
+    GET /api/holders?company=<name>                    latest holder positions
+    GET /api/stats                                     result cache counters
+
+Every response carries an ETag derived from the data versions of the tables it reads
+(result_cache.py), so `If-None-Match` revalidation costs no database access until
+the bot writes to one of them.
+"""
+
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+
+from aiohttp import web
+
+from async_database import ReaderPool
+from database import Database
+from result_cache import data_versions
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_READERS = 2
+
+PLACEMENT_SOURCES = {
+    # source -> (getter, tables it reads)
+    'steam': ('get_gts_placements_with_minmax', ('SteamTopGames', 'GameTranslation')),
+    'ps': ('get_last_month_ps_placements', ('PSTopGames', 'PSGameTranslation')),
+}
+RANK_TABLES = {'steam': 'SteamTopGames', 'ps': 'PSTopGames'}
+
+
+class AnalyticsAPI:
+    def __init__(self, db_name, host=DEFAULT_HOST, port=DEFAULT_PORT, readers=DEFAULT_READERS, **db_options):
+        # db_options are passed on to every reader Database, e.g. rank_shards='rank_shards'
+        self.db_name = db_name
+        self.host = host
+        self.port = port
+        self.readers = ReaderPool(db_name, readers, **db_options)
+        self._db_key = None
+        self._runner = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/placements', self.placements)
+        app.router.add_get('/api/ranks', self.ranks)
+        app.router.add_get('/api/short-interest', self.short_interest)
+        app.router.add_get('/api/holders', self.holders)
+        app.router.add_get('/api/stats', self.stats)
+        return app
+
+    async def start(self):
+        # Readers only stay out of the writer's way in WAL mode (the setting persists).
+        with Database(self.db_name, cache_results=False) as db:
+            db.conn.execute("PRAGMA journal_mode=WAL")
+            self._db_key = db._process_cache_key()
+        self.readers.open()
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self.readers.close()
+
+    # -- helpers --------------------------------------------------------------
+
+    def _etag(self, request, tables, daily=False):
+        # Taken before the read: a write racing the request can only make the body
+        # newer than its tag, never older.
+        state = (request.path, sorted(request.query.items()), data_versions(self._db_key, tables),
+                 date.today().isoformat() if daily else None)
+        return '"' + hashlib.sha1(repr(state).encode()).hexdigest()[:20] + '"'
+
+    @staticmethod
+    def _not_modified(request, etag):
+        return etag in request.headers.get('If-None-Match', '')
+
+    @staticmethod
+    def _json(payload, etag, status=200):
+        response = web.json_response(payload, status=status, dumps=lambda data: json.dumps(data, default=str))
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    async def _respond(self, request, tables, produce, daily=False):
+        etag = self._etag(request, tables, daily)
+        if self._not_modified(request, etag):
+            return web.Response(status=304, headers={'ETag': etag})
+        payload = await produce()
+        if payload is None:
+            return self._json({'error': 'not found'}, etag, status=404)
+        return self._json(payload, etag)
+
+    @staticmethod
+    def _required(request, name):
+        value = request.query.get(name, '').strip()
+        if not value:
+            raise web.HTTPBadRequest(text=f"Missing query parameter: {name}")
+        return value
+
+    @staticmethod
+    def _choice(request, name, choices, default):
+        value = request.query.get(name, default)
+        if value not in choices:
+            raise web.HTTPBadRequest(text=f"Invalid {name}: {value} (expected one of {', '.join(choices)})")
+        return value
+
+    async def _company(self, request):
+        return await self.readers.call('find_company', self._required(request, 'company'))
+
+    # -- endpoints ------------------------------------------------------------
+
+    async def placements(self, request):
+        game = self._required(request, 'game')
+        source = self._choice(request, 'source', PLACEMENT_SOURCES, 'steam')
+        getter, tables = PLACEMENT_SOURCES[source]
+
+        async def produce():
+            title = await self.readers.call('match_game_name', source, game)
+            if title is None:
+                return None
+            data = await self.readers.call(getter, title)
+            return {'game': title, 'source': source, **data} if data else None
+
+        return await self._respond(request, tables, produce, daily=True)
+
+    async def ranks(self, request):
+        source = self._choice(request, 'source', RANK_TABLES, 'steam')
+        table = RANK_TABLES[source]
+        timestamp = request.query.get('timestamp')
+        if timestamp:
+            try:
+                datetime.strptime(timestamp, '%Y-%m-%d %H')
+            except ValueError:
+                raise web.HTTPBadRequest(text="timestamp must be 'YYYY-MM-DD HH'") from None
+
+        async def produce():
+            capture_ts = timestamp or await self.readers.call('get_latest_timestamp', table)
+            if not capture_ts:
+                return None
+            capture = await self.readers.call('get_capture', capture_ts, table)
+            if not capture:
+                return None
+            return {'source': source, 'timestamp': capture_ts,
+                    'ranks': [{'place': place, 'id': item_id} for place, item_id in capture]}
+
+        return await self._respond(request, (table,), produce)
+
+    async def short_interest(self, request):
+        start = request.query.get('start') or (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
+
+        async def produce():
+            company = await self._company(request)
+            if company is None:
+                return None
+            history = await self.readers.call('get_short_position_history', company['lei'], start)
+            return {**company, 'start': start, 'history': history.to_dict('records')}
+
+        return await self._respond(request, ('ShortPositions', 'Companies'), produce,
+                                   daily='start' not in request.query)
+
+    async def holders(self, request):
+        async def produce():
+            company = await self._company(request)
+            if company is None:
+                return None
+            return {**company, 'holders': await self.readers.call('get_company_holders', company['lei'])}
+
+        return await self._respond(request, ('PositionHolders', 'Companies'), produce)
+
+    async def stats(self, request):
+        return web.json_response({'result_cache': await self.readers.call('cache_stats')})
+
+
+async def start_analytics_api(db_name, host=DEFAULT_HOST, port=DEFAULT_PORT, readers=DEFAULT_READERS, **db_options):
+    """Starts the API on host:port and returns the running AnalyticsAPI."""
+    api = AnalyticsAPI(db_name, host, port, readers, **db_options)
+    await api.start()
+    return api
@@ -0,0 +1,277 @@
+"""
+Non-blocking facade over database.Database for code running on the Discord event loop.
+
+AsyncDatabase exposes the same methods as Database, but every call returns an
+awaitable and the SQLite work happens off the event loop:
+
+  * the file is switched to WAL so readers never block the writer (or vice versa),
+  * all writes are funnelled through one writer thread, which drains its queue and
+    commits everything it picked up in a single transaction (group commit); every
+    queued call runs inside its own savepoint so one failing write does not discard
+    the others,
+  * reads are served by a small pool of read-only connections.
+
+    db = AsyncDatabase('steam_top_games.db')
+    await db.start()
+    await db.insert_bulk_data(games)
+    data = await db.get_gts_placements('Wuchang: Fallen Feathers')
+    await db.close()
+
+Attributes of Database that are not methods (`conn`, `cursor`) are intentionally not
+exposed; code that needs raw SQL should go through a Database method (or read_frame).
+
+main.py runs the bot on one AsyncDatabase: the scrapers, pipelines and command handlers
+await it. The nightly retention and maintenance passes open a Database of their own in
+a worker thread (db_name and db_options give them the same file and options).
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from database import Database
+
+# Database methods that modify the file. Everything else is served by the reader pool.
+WRITE_METHODS = {
+    'insert_bulk_data',
+    'insert_ccu',
+    'refresh_daily_rollup_date',
+    'sync_translations',
+    'update_appid',
+    'update_ps_appid',
+}
+
+# Calls that run alone on the writer thread, outside of a group commit: write methods
+# that manage their own transactions, the backfills (which read every rank shard of a
+# sharded database before their write transaction starts), attach_rank_cube and
+# load_rank_cube, which subscribe the cube to this file's change events in order with
+# queued writes, and release_rank_shards, which detaches shards from the writer's connection.
+STANDALONE_WRITE_METHODS = {
+    'attach_rank_cube',
+    'backfill_daily_rollup',
+    'backfill_rolling_rank_stats',
+    'backfill_snapshot_catalog',
+    'create_tables',
+    'load_rank_cube',
+    'release_rank_shards',
+    'run_migrations',
+}
+
+
+class _WriterThread(threading.Thread):
+    """Owns the only read-write connection and applies queued writes in batches."""
+
+    def __init__(self, db_name, max_batch, db_options):
+        super().__init__(name='db-writer', daemon=True)
+        self.db_name = db_name
+        self.db_options = db_options
+        self.max_batch = max_batch
+        self.ready = threading.Event()
+        self.startup_error = None
+        self._jobs = queue.Queue()
+
+    def submit(self, method, args, kwargs):
+        future = Future()
+        self._jobs.put((future, method, args, kwargs))
+        return future
+
+    def stop(self):
+        self._jobs.put(None)
+
+    def run(self):
+        try:
+            db = Database(self.db_name, **self.db_options)
+            db.conn.execute("PRAGMA journal_mode=WAL")
+            db.conn.execute("PRAGMA synchronous=NORMAL")
+        except Exception as e:
+            self.startup_error = e
+            self.ready.set()
+            return
+        self.ready.set()
+
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+
+                if job[1] in STANDALONE_WRITE_METHODS:
+                    self._run_standalone(db, job)
+                    continue
+
+                batch = [job]
+                stopping = False
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    if job[1] in STANDALONE_WRITE_METHODS:
+                        # Keep ordering: flush the group first, then run this one alone.
+                        self._run_batch(db, batch)
+                        batch = []
+                        self._run_standalone(db, job)
+                        continue
+                    batch.append(job)
+
+                if batch:
+                    self._run_batch(db, batch)
+                if stopping:
+                    break
+        finally:
+            db.close()
+
+    @staticmethod
+    def _run_standalone(db, job):
+        future, method, args, kwargs = job
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(getattr(db, method)(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    @staticmethod
+    def _run_batch(db, batch):
+        outcomes = []
+        db.defer_commit = True
+        db.conn.isolation_level = None  # transactions are managed explicitly below
+        try:
+            db.cursor.execute("BEGIN IMMEDIATE")
+            for future, method, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                db.cursor.execute("SAVEPOINT queued_write")
+                try:
+                    result = getattr(db, method)(*args, **kwargs)
+                except Exception as e:
+                    db.cursor.execute("ROLLBACK TO queued_write")
+                    db.cursor.execute("RELEASE queued_write")
+                    outcomes.append((future, None, e))
+                else:
+                    db.cursor.execute("RELEASE queued_write")
+                    outcomes.append((future, result, None))
+            db.cursor.execute("COMMIT")
+            db._publish_changes()
+        except Exception as e:
+            if db.conn.in_transaction:
+                db.cursor.execute("ROLLBACK")
+            db._discard_changes()
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            db.defer_commit = False
+            db.conn.isolation_level = ''
+
+        # Only report success once the whole group is durable.
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class ReaderPool:
+    """
+    Read-only Database connections served from a thread pool. Used by AsyncDatabase,
+    and on its own by code that only reads (e.g. analytics_api).
+    """
+
+    def __init__(self, db_name, readers=4, **db_options):
+        self.db_name = db_name
+        self.db_options = db_options
+        self.reader_count = readers
+        self._readers = queue.Queue()
+        self._executor = None
+
+    def open(self):
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.reader_count, thread_name_prefix='db-reader')
+        for _ in range(self.reader_count):
+            self._readers.put(Database(self.db_name, read_only=True, **self.db_options))
+
+    def close(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+    def _read(self, method, args, kwargs):
+        reader = self._readers.get()
+        try:
+            return getattr(reader, method)(*args, **kwargs)
+        finally:
+            self._readers.put(reader)
+
+    async def call(self, method, *args, **kwargs):
+        """Runs Database.<method> on a free reader connection."""
+        if self._executor is None:
+            raise RuntimeError("ReaderPool.open() must be called before use")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._read, method, args, kwargs)
+
+
+class AsyncDatabase:
+    """Awaitable Database with a WAL writer thread and a read-only connection pool."""
+
+    def __init__(self, db_name, readers=4, max_write_batch=64, **db_options):
+        # db_options are passed on to every Database, e.g. rank_storage='both'
+        self.db_name = db_name
+        self.db_options = db_options
+        self.reader_count = readers
+        self.max_write_batch = max_write_batch
+        self._writer = None
+        self._readers = ReaderPool(db_name, readers, **db_options)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        """Starts the writer thread (which enables WAL) and opens the reader pool."""
+        if self._writer is not None:
+            return
+        writer = _WriterThread(self.db_name, self.max_write_batch, self.db_options)
+        writer.start()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, writer.ready.wait)
+        if writer.startup_error:
+            raise writer.startup_error
+        self._writer = writer
+        self._readers.open()
+
+    async def close(self):
+        """Flushes queued writes, stops the writer and closes every reader."""
+        if self._writer is None:
+            return
+        loop = asyncio.get_running_loop()
+        self._writer.stop()
+        await loop.run_in_executor(None, self._writer.join)
+        self._writer = None
+        self._readers.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(Database, name, None)) or name == 'close':
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        async def call(*args, **kwargs):
+            if self._writer is None:
+                raise RuntimeError("AsyncDatabase.start() must be awaited before use")
+            if name in WRITE_METHODS or name in STANDALONE_WRITE_METHODS:
+                return await asyncio.wrap_future(self._writer.submit(name, args, kwargs))
+            return await self._readers.call(name, *args, **kwargs)
+
+        call.__name__ = name
+        return call
@@ -0,0 +1,147 @@
+"""
+In-process notifications of committed database writes.
+
+Database write methods describe what they changed and, once their transaction has
+committed, publish one ChangeEvent per (table, kind) to the process-wide CHANGE_BUS.
+Caches, precomputed charts and alert loops subscribe to the tables they depend on
+instead of polling the database:
+
+    def on_change(event):
+        if event.kind == INSERTED:
+            refresh_chart(event.first_key, event.last_key)
+
+    unsubscribe = CHANGE_BUS.subscribe(on_change, tables=('SteamTopGames',))
+
+    # or, from a coroutine on the event loop
+    events, unsubscribe = CHANGE_BUS.subscribe_queue(tables=('ShortPositions',))
+    event = await events.get()
+
+Callbacks run synchronously on the thread that committed (the writer thread under
+AsyncDatabase), after the result cache versions have been bumped, so a callback that
+reads the database sees the new data. A failing callback is reported and does not
+affect the write or the other subscribers. Events of group commits are merged per
+(table, kind). Writes made by other processes are not seen.
+"""
+
+import asyncio
+import sys
+import threading
+import traceback
+from dataclasses import dataclass, field
+
+# Event kinds
+INSERTED = 'inserted'   # new rows; first_key/last_key span their timestamps (or ids)
+UPDATED = 'updated'     # existing rows changed, e.g. renamed translations
+REBUILT = 'rebuilt'     # derived data recomputed (rollup, catalog), optionally for one key range
+CHANGED = 'changed'     # anything else, e.g. raw SQL followed by Database.invalidate()
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    db_key: object
+    table: str
+    kind: str
+    version: int                  # the table's result_cache data version after the write
+    first_key: str = None         # smallest timestamp / id touched, None if unknown
+    last_key: str = None
+    rows: int = 0
+    keys: frozenset = frozenset()  # ids touched where the table has a natural key (LEI, ISIN, appid)
+    # In-process extras for subscribers that need the rows themselves, e.g. the
+    # (timestamp, id, place) placements of a rank capture. Must not be modified.
+    payload: tuple = field(default=(), repr=False)
+
+
+class PendingChanges:
+    """Collects the changes of one transaction, merged per (table, kind)."""
+
+    def __init__(self):
+        self._changes = {}
+
+    def note(self, table, kind, first_key=None, last_key=None, rows=0, keys=(), payload=()):
+        entry = self._changes.setdefault((table, kind), {
+            'first_key': None, 'last_key': None, 'rows': 0, 'keys': set(), 'payload': []})
+        if first_key is not None:
+            entry['first_key'] = first_key if entry['first_key'] is None else min(entry['first_key'], first_key)
+        if last_key is not None:
+            entry['last_key'] = last_key if entry['last_key'] is None else max(entry['last_key'], last_key)
+        entry['rows'] += rows
+        entry['keys'].update(keys)
+        entry['payload'].extend(payload)
+
+    def events(self, db_key, versions):
+        """Builds the events, given {table: version} of the tables changed by the transaction."""
+        noted = {table for table, _ in self._changes}
+        events = [
+            ChangeEvent(db_key, table, kind, versions.get(table, 0), entry['first_key'], entry['last_key'],
+                        entry['rows'], frozenset(entry['keys']), tuple(entry['payload']))
+            for (table, kind), entry in self._changes.items()
+        ]
+        events.extend(ChangeEvent(db_key, table, CHANGED, version)
+                      for table, version in versions.items() if table not in noted)
+        return events
+
+    def clear(self):
+        self._changes.clear()
+
+
+class ChangeBus:
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.published = 0
+        self.errors = 0
+
+    def subscribe(self, callback, tables=None, db_key=None):
+        """
+        Calls callback(event) for every event of `tables` (default: all) of the database
+        identified by db_key (default: all databases). Subscribing the same callback
+        twice has no effect. Returns a function that unsubscribes it.
+        """
+        subscriber = (callback, frozenset(tables) if tables else None, db_key)
+        with self._lock:
+            if subscriber not in self._subscribers:
+                self._subscribers.append(subscriber)
+
+        def unsubscribe():
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+        return unsubscribe
+
+    def subscribe_queue(self, tables=None, db_key=None, loop=None):
+        """
+        Delivers events into an asyncio.Queue owned by `loop` (default: the running
+        loop), for subscribers living on the event loop. Returns (queue, unsubscribe).
+        """
+        loop = loop or asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def deliver(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        return events, self.subscribe(deliver, tables, db_key)
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            self.published += 1
+            for callback, tables, db_key in subscribers:
+                if tables is not None and event.table not in tables:
+                    continue
+                if db_key is not None and event.db_key != db_key:
+                    continue
+                try:
+                    callback(event)
+                except Exception:
+                    self.errors += 1
+                    print(f"Change subscriber {getattr(callback, '__qualname__', callback)} failed "
+                          f"on {event.table}/{event.kind}:", file=sys.stderr)
+                    traceback.print_exc()
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'published': self.published, 'errors': self.errors}
+
+
+# Shared by every Database in the process.
+CHANGE_BUS = ChangeBus()
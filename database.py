@@ -1,6 +1,15 @@
 # database.py
+import bisect
 import sqlite3
 from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+import rank_snapshots
+from change_bus import CHANGE_BUS, INSERTED, REBUILT, UPDATED, PendingChanges
+from name_index import NameIndex, normalize_game_name_for_search
+from result_cache import RESULT_CACHE, bump_data_version, cached_read
 
 POSITION_HOLDERS_SCHEMA = '''
         CREATE TABLE IF NOT EXISTS PositionHolders (
@@ -69,6 +78,465 @@ REPORTED_ENTITIES_SCHEMA = '''
             position_date TEXT
         );
         '''
+
+DAILY_PLACEMENT_ROLLUP_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS DailyPlacementRollup (
+            source TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            reciprocal_sum REAL NOT NULL,
+            place_sum INTEGER NOT NULL,
+            sample_count INTEGER NOT NULL,
+            min_place INTEGER NOT NULL,
+            max_place INTEGER NOT NULL,
+            PRIMARY KEY (source, item_id, date)
+        ) WITHOUT ROWID;
+        '''
+
+RANK_SNAPSHOTS_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS RankSnapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            game_count INTEGER NOT NULL,
+            ids BLOB NOT NULL,
+            discounts BLOB NOT NULL,
+            ccus BLOB,
+            UNIQUE (source, timestamp)
+        );
+        '''
+
+# Catalog of every capture written by insert_bulk_data: one row per (table, timestamp)
+# with the number of rows it wrote. "Latest", "latest on a date" and "N days ago"
+# become point lookups on the (source, ts) index. Rows stay after retention archives
+# the capture itself.
+SNAPSHOTS_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS Snapshots (
+            snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            UNIQUE (source, ts)
+        );
+        '''
+
+# Tables whose captures are recorded in Snapshots (source = table name)
+CATALOG_TABLES = ('SteamTopGames', 'PSTopGames', 'ShortPositions', 'PositionHolders')
+
+SNAPSHOT_CATALOG_UPSERT_QUERY = '''
+        INSERT INTO Snapshots (source, ts, row_count)
+        VALUES (?, ?, ?)
+        ON CONFLICT (source, ts) DO UPDATE SET
+            row_count = Snapshots.row_count + excluded.row_count
+        '''
+
+# Rebuilds the catalog entries of one table from its rows
+SNAPSHOT_CATALOG_BACKFILL_QUERY = '''
+        INSERT OR REPLACE INTO Snapshots (source, ts, row_count)
+        SELECT '{table}', timestamp, COUNT(*)
+        FROM {table}
+        WHERE timestamp IS NOT NULL
+        GROUP BY timestamp
+        ORDER BY timestamp
+        '''
+
+# Company identity for the FI tables, keyed by LEI. CompanyAliases holds every
+# spelling seen in ShortPositions.company_name / PositionHolders.issuer_name and
+# CompanyIsins the ISINs PositionHolders reports for them; CompanySearch is an FTS5
+# trigram index over the aliases (substring matching, case-insensitive).
+COMPANIES_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS Companies (
+            lei TEXT PRIMARY KEY,
+            canonical_name TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT
+        )''',
+    '''CREATE TABLE IF NOT EXISTS CompanyAliases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alias TEXT NOT NULL,
+            lei TEXT NOT NULL,
+            UNIQUE (alias, lei)
+        )''',
+    '''CREATE TABLE IF NOT EXISTS CompanyIsins (
+            isin TEXT NOT NULL,
+            lei TEXT NOT NULL,
+            PRIMARY KEY (isin, lei)
+        ) WITHOUT ROWID''',
+    '''CREATE INDEX IF NOT EXISTS idx_companyaliases_alias_nocase
+           ON CompanyAliases (alias COLLATE NOCASE)''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS CompanySearch USING fts5(
+            alias, content='CompanyAliases', content_rowid='id', tokenize='trigram'
+        )''',
+    '''CREATE TRIGGER IF NOT EXISTS companyaliases_search_insert AFTER INSERT ON CompanyAliases BEGIN
+            INSERT INTO CompanySearch (rowid, alias) VALUES (new.id, new.alias);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS companyaliases_search_delete AFTER DELETE ON CompanyAliases BEGIN
+            INSERT INTO CompanySearch (CompanySearch, rowid, alias) VALUES ('delete', old.id, old.alias);
+        END''',
+]
+
+COMPANY_UPSERT_QUERY = '''
+        INSERT INTO Companies (lei, canonical_name, first_seen, last_seen)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (lei) DO UPDATE SET
+            canonical_name = CASE WHEN excluded.last_seen >= Companies.last_seen
+                                  THEN excluded.canonical_name ELSE Companies.canonical_name END,
+            first_seen = MIN(Companies.first_seen, excluded.first_seen),
+            last_seen = MAX(Companies.last_seen, excluded.last_seen)
+        '''
+
+# Hourly concurrent players of every app in the Steam charts table (see
+# steam_ccu.CCUPipeline), kept whether or not the app is a top seller. Hours are
+# epoch hours as in the v2 rank tables; the primary key doubles as the per-game index.
+STEAM_CCU_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS SteamCCU (
+            appid INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            ccu INTEGER NOT NULL,
+            PRIMARY KEY (appid, hour)
+        ) WITHOUT ROWID;
+        '''
+
+# Rolling placement statistics per ranked item, derived from DailyPlacementRollup.
+# as_of is the last rollup date the row was computed for: rows of items not ranked in
+# the 30 days up to the source's latest date keep an older as_of. Means are the
+# average place of all captures in the window; trend is 'new' (first seen within the
+# last 7 days), 'up' / 'down' / 'steady' (3-day vs 7-day mean) or 'out' (no place in
+# the last 3 days).
+ROLLING_RANK_STATS_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS RollingRankStats (
+            source TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            as_of TEXT NOT NULL,
+            mean_1d REAL,
+            mean_3d REAL,
+            mean_7d REAL,
+            mean_30d REAL,
+            days_7d INTEGER NOT NULL,
+            days_30d INTEGER NOT NULL,
+            first_seen TEXT NOT NULL,
+            trend TEXT NOT NULL,
+            PRIMARY KEY (source, item_id)
+        ) WITHOUT ROWID;
+        '''
+
+# Integer-keyed rank storage ("schema v2", installed by schema_v2.py). Timestamps
+# become epoch hours, Steam appids and PS ids integers (like the ids of the translation
+# tables), discount labels small-int codes. After the flip SteamTopGames / PSTopGames are views over these tables with
+# INSTEAD OF triggers, so code written against the v1 layout keeps working.
+RANK_V2_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS Discounts (
+            code INTEGER PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        )''',
+    '''CREATE TABLE IF NOT EXISTS SteamRanksV2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hour INTEGER NOT NULL,
+            place INTEGER NOT NULL,
+            appid INTEGER NOT NULL,
+            discount INTEGER,
+            ccu INTEGER
+        )''',
+    '''CREATE TABLE IF NOT EXISTS PSRanksV2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hour INTEGER NOT NULL,
+            place INTEGER NOT NULL,
+            ps_id INTEGER NOT NULL,
+            discount INTEGER
+        )''',
+    '''CREATE INDEX IF NOT EXISTS idx_steamranksv2_appid_hour ON SteamRanksV2 (appid, hour)''',
+    '''CREATE INDEX IF NOT EXISTS idx_steamranksv2_hour ON SteamRanksV2 (hour)''',
+    '''CREATE INDEX IF NOT EXISTS idx_psranksv2_psid_hour ON PSRanksV2 (ps_id, hour)''',
+    '''CREATE INDEX IF NOT EXISTS idx_psranksv2_hour ON PSRanksV2 (hour)''',
+]
+
+# The v1 rows of SteamTopGames / PSTopGames read straight from the v2 tables between
+# two hours (inclusive). The compatibility views compute timestamp with strftime(), so
+# a timestamp range through them scans every row; these bound the integer hour column,
+# which is indexed. See Database.rank_row_source().
+RANK_V2_RANGE_QUERIES = {
+    'SteamTopGames': '''
+        SELECT r.id AS id, strftime('%Y-%m-%d %H', r.hour * 3600, 'unixepoch') AS timestamp,
+               r.place AS place, CAST(r.appid AS TEXT) AS appid, d.label AS discount, r.ccu AS ccu
+        FROM SteamRanksV2 AS r
+        LEFT JOIN Discounts AS d ON d.code = r.discount
+        WHERE r.hour >= ? AND r.hour <= ?''',
+    'PSTopGames': '''
+        SELECT r.id AS id, strftime('%Y-%m-%d %H', r.hour * 3600, 'unixepoch') AS timestamp,
+               r.place AS place, CAST(r.ps_id AS TEXT) AS ps_id, d.label AS discount
+        FROM PSRanksV2 AS r
+        LEFT JOIN Discounts AS d ON d.code = r.discount
+        WHERE r.hour >= ? AND r.hour <= ?''',
+}
+RANK_V2_TABLES = {'SteamTopGames': 'SteamRanksV2', 'PSTopGames': 'PSRanksV2'}
+
+# Rank tables that feed DailyPlacementRollup: source -> (table, id column)
+RANK_SOURCES = {
+    'steam': ('SteamTopGames', 'appid'),
+    'ps': ('PSTopGames', 'ps_id'),
+}
+RANK_TABLE_SOURCES = {table: source for source, (table, _) in RANK_SOURCES.items()}
+
+# How insert_bulk_data stores rank captures: one row per rank, one packed
+# RankSnapshots row per capture, or both.
+RANK_STORAGE_MODES = ('rows', 'snapshots', 'both')
+
+# Translation tables: source -> (table, id column)
+TRANSLATION_TABLES = {
+    'steam': ('GameTranslation', 'appid'),
+    'ps': ('PSGameTranslation', 'ps_id'),
+}
+
+# Process-wide cache of translations already in the database, shared by every
+# Database instance on the same file: (database key, source) -> {str(id): title}.
+# Loaded from the table on first use and kept current by sync_translations().
+_KNOWN_TRANSLATIONS = {}
+
+# Process-wide NameIndex per translation table: (database key, source) -> NameIndex.
+# Built from the table on first use and kept current by sync_translations().
+_NAME_INDEXES = {}
+
+# Process-wide RankCube per rank source, set by attach_rank_cube so that every Database
+# on the same file (AsyncDatabase readers included) can serve analytics from it:
+# (database key, source) -> rank_cube.RankCube.
+_RANK_CUBES = {}
+
+DAILY_ROLLUP_BACKFILL_QUERY = '''
+        INSERT INTO DailyPlacementRollup
+            (source, item_id, date, reciprocal_sum, place_sum, sample_count, min_place, max_place)
+        SELECT ?, {id_column}, substr(timestamp, 1, 10),
+               SUM(1.0 / place), SUM(place), COUNT(place), MIN(place), MAX(place)
+        FROM {table}
+        WHERE place > 0{date_filter}
+        GROUP BY {id_column}, substr(timestamp, 1, 10)
+        '''
+
+# The SELECT of DAILY_ROLLUP_BACKFILL_QUERY on its own, for rank rows held in monthly
+# shards (rank_shards.py); the rows are written with DAILY_ROLLUP_UPSERT_QUERY.
+DAILY_ROLLUP_AGGREGATE_QUERY = '''
+        SELECT ?, {id_column}, substr(timestamp, 1, 10),
+               SUM(1.0 / place), SUM(place), COUNT(place), MIN(place), MAX(place)
+        FROM {table}
+        WHERE place > 0{date_filter}
+        GROUP BY {id_column}, substr(timestamp, 1, 10)
+        '''
+
+DAILY_ROLLUP_UPSERT_QUERY = '''
+        INSERT INTO DailyPlacementRollup
+            (source, item_id, date, reciprocal_sum, place_sum, sample_count, min_place, max_place)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (source, item_id, date) DO UPDATE SET
+            reciprocal_sum = reciprocal_sum + excluded.reciprocal_sum,
+            place_sum = place_sum + excluded.place_sum,
+            sample_count = sample_count + excluded.sample_count,
+            min_place = MIN(min_place, excluded.min_place),
+            max_place = MAX(max_place, excluded.max_place)
+        '''
+
+# Recomputes the RollingRankStats rows of every item of :source ranked in the 30 days up
+# to :as_of (None: the source's latest rollup date). first_seen only ever moves back.
+ROLLING_RANK_STATS_REFRESH_QUERY = '''
+        WITH bounds AS (
+            SELECT as_of,
+                   date(as_of, '-2 days') AS since_3d,
+                   date(as_of, '-6 days') AS since_7d,
+                   date(as_of, '-29 days') AS since_30d
+            FROM (SELECT COALESCE(:as_of, (SELECT MAX(date) FROM DailyPlacementRollup WHERE source = :source)) AS as_of)
+        ),
+        windows AS (
+            SELECT rollup.item_id, bounds.as_of, bounds.since_7d,
+                   SUM(CASE WHEN rollup.date = bounds.as_of THEN place_sum END) * 1.0
+                       / SUM(CASE WHEN rollup.date = bounds.as_of THEN sample_count END) AS mean_1d,
+                   SUM(CASE WHEN rollup.date >= bounds.since_3d THEN place_sum END) * 1.0
+                       / SUM(CASE WHEN rollup.date >= bounds.since_3d THEN sample_count END) AS mean_3d,
+                   SUM(CASE WHEN rollup.date >= bounds.since_7d THEN place_sum END) * 1.0
+                       / SUM(CASE WHEN rollup.date >= bounds.since_7d THEN sample_count END) AS mean_7d,
+                   SUM(place_sum) * 1.0 / SUM(sample_count) AS mean_30d,
+                   COUNT(CASE WHEN rollup.date >= bounds.since_7d THEN 1 END) AS days_7d,
+                   COUNT(*) AS days_30d,
+                   MIN(rollup.date) AS first_in_window
+            FROM DailyPlacementRollup AS rollup, bounds
+            WHERE rollup.source = :source AND rollup.date >= bounds.since_30d AND rollup.date <= bounds.as_of
+            GROUP BY rollup.item_id
+        ),
+        ranked AS (
+            SELECT windows.*, MIN(first_in_window, COALESCE(stats.first_seen, first_in_window)) AS first_seen
+            FROM windows
+            LEFT JOIN RollingRankStats AS stats ON stats.source = :source AND stats.item_id = windows.item_id
+        )
+        INSERT OR REPLACE INTO RollingRankStats
+            (source, item_id, as_of, mean_1d, mean_3d, mean_7d, mean_30d, days_7d, days_30d, first_seen, trend)
+        SELECT :source, item_id, as_of, mean_1d, mean_3d, mean_7d, mean_30d, days_7d, days_30d, first_seen,
+               CASE
+                   WHEN first_seen >= since_7d THEN 'new'
+                   WHEN mean_3d IS NULL THEN 'out'
+                   WHEN ABS(mean_3d - mean_7d) <= 1 THEN 'steady'
+                   WHEN mean_3d < mean_7d THEN 'up'
+                   ELSE 'down'
+               END
+        FROM ranked
+        '''
+
+# Seeds first_seen (and an as_of of the last ranked date) for every item ever ranked,
+# before ROLLING_RANK_STATS_REFRESH_QUERY fills in the items of the current window.
+ROLLING_RANK_STATS_SEED_QUERY = '''
+        INSERT INTO RollingRankStats (source, item_id, as_of, days_7d, days_30d, first_seen, trend)
+        SELECT source, item_id, MAX(date), 0, 0, MIN(date), 'out'
+        FROM DailyPlacementRollup
+        GROUP BY source, item_id
+        '''
+
+SCHEMA_MIGRATIONS_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS SchemaMigrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        );
+        '''
+
+# Versioned schema changes, applied in order by Database.run_migrations().
+# Each entry is (version, description, steps) where a step is a SQL statement
+# or a (sql, params) tuple.
+# Entries are append-only: never edit or renumber a migration that has shipped.
+MIGRATIONS = [
+    (1, 'Rank history indexes', [
+        '''CREATE INDEX IF NOT EXISTS idx_steamtopgames_appid_timestamp
+           ON SteamTopGames (appid, timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_steamtopgames_timestamp
+           ON SteamTopGames (timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_pstopgames_psid_timestamp
+           ON PSTopGames (ps_id, timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_pstopgames_timestamp
+           ON PSTopGames (timestamp)''',
+        # Getters resolve names with LOWER(game_name) = LOWER(?)
+        '''CREATE INDEX IF NOT EXISTS idx_gametranslation_lower_name
+           ON GameTranslation (LOWER(game_name))''',
+        '''CREATE INDEX IF NOT EXISTS idx_psgametranslation_lower_name
+           ON PSGameTranslation (LOWER(game_name))''',
+    ]),
+    (2, 'Daily placement rollup with backfill from rank history', [
+        DAILY_PLACEMENT_ROLLUP_SCHEMA,
+        ("DELETE FROM DailyPlacementRollup",),
+        (DAILY_ROLLUP_BACKFILL_QUERY.format(table='SteamTopGames', id_column='appid', date_filter=''), ('steam',)),
+        (DAILY_ROLLUP_BACKFILL_QUERY.format(table='PSTopGames', id_column='ps_id', date_filter=''), ('ps',)),
+    ]),
+    (3, 'Packed rank snapshots', [
+        RANK_SNAPSHOTS_SCHEMA,
+    ]),
+    (4, 'Indexes for retention and range exports', [
+        '''CREATE INDEX IF NOT EXISTS idx_shortpositions_timestamp
+           ON ShortPositions (timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_positionholders_timestamp
+           ON PositionHolders (timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_dailyplacementrollup_source_date
+           ON DailyPlacementRollup (source, date)''',
+    ]),
+    # normalize_game_name() is registered on every connection by Database.__init__
+    (5, 'Normalized game names for name matching', [
+        "ALTER TABLE GameTranslation ADD COLUMN normalized_name TEXT",
+        "ALTER TABLE PSGameTranslation ADD COLUMN normalized_name TEXT",
+        "UPDATE GameTranslation SET normalized_name = normalize_game_name(game_name) WHERE game_name IS NOT NULL",
+        "UPDATE PSGameTranslation SET normalized_name = normalize_game_name(game_name) WHERE game_name IS NOT NULL",
+    ]),
+    (6, 'Company identity tables with FTS5 alias search', COMPANIES_SCHEMA + [
+        '''CREATE INDEX IF NOT EXISTS idx_shortpositions_lei_timestamp
+           ON ShortPositions (lei, timestamp)''',
+        '''INSERT INTO Companies (lei, canonical_name, first_seen, last_seen)
+           SELECT lei,
+                  (SELECT TRIM(latest.company_name) FROM ShortPositions AS latest
+                   WHERE latest.lei = ShortPositions.lei
+                   ORDER BY latest.timestamp DESC LIMIT 1),
+                  MIN(timestamp), MAX(timestamp)
+           FROM ShortPositions
+           WHERE lei IS NOT NULL AND lei != ''
+           GROUP BY lei''',
+        '''INSERT OR IGNORE INTO CompanyAliases (alias, lei)
+           SELECT DISTINCT TRIM(company_name), lei FROM ShortPositions
+           WHERE lei IS NOT NULL AND lei != '' ''',
+        '''INSERT OR IGNORE INTO CompanyIsins (isin, lei)
+           SELECT DISTINCT PositionHolders.isin, CompanyAliases.lei
+           FROM PositionHolders
+           JOIN CompanyAliases ON CompanyAliases.alias = TRIM(PositionHolders.issuer_name)
+           WHERE PositionHolders.isin IS NOT NULL AND PositionHolders.isin != '' ''',
+        '''INSERT OR IGNORE INTO CompanyAliases (alias, lei)
+           SELECT DISTINCT TRIM(PositionHolders.issuer_name), CompanyIsins.lei
+           FROM PositionHolders
+           JOIN CompanyIsins ON CompanyIsins.isin = PositionHolders.isin''',
+    ]),
+    (7, 'Snapshot catalog', [
+        SNAPSHOTS_SCHEMA,
+        *(SNAPSHOT_CATALOG_BACKFILL_QUERY.format(table=table) for table in CATALOG_TABLES),
+        # Captures stored only as packed RankSnapshots
+        '''INSERT OR IGNORE INTO Snapshots (source, ts, row_count)
+           SELECT CASE source WHEN 'steam' THEN 'SteamTopGames' ELSE 'PSTopGames' END, timestamp, game_count
+           FROM RankSnapshots
+           ORDER BY timestamp''',
+    ]),
+    (8, 'PositionHolders ISIN index', [
+        '''CREATE INDEX IF NOT EXISTS idx_positionholders_isin_timestamp
+           ON PositionHolders (isin, timestamp)''',
+    ]),
+    (9, 'Hourly Steam CCU with backfill from the top seller captures', [
+        STEAM_CCU_SCHEMA,
+        '''INSERT OR IGNORE INTO SteamCCU (appid, hour, ccu)
+           SELECT CAST(appid AS INTEGER),
+                  CAST(strftime('%s', substr(timestamp, 1, 13) || ':00') AS INTEGER) / 3600,
+                  ccu
+           FROM SteamTopGames
+           WHERE ccu > 0''',
+    ]),
+    (10, 'Rolling rank statistics with backfill from the daily placement rollup', [
+        ROLLING_RANK_STATS_SCHEMA,
+        '''CREATE INDEX IF NOT EXISTS idx_rollingrankstats_source_asof_mean7d
+           ON RollingRankStats (source, as_of, mean_7d)''',
+        ROLLING_RANK_STATS_SEED_QUERY,
+        *((ROLLING_RANK_STATS_REFRESH_QUERY, {'source': source, 'as_of': None}) for source in RANK_SOURCES),
+    ]),
+]
+
+def day_range_bounds(start_date, end_date):
+    """
+    Returns (lower, upper) bounds covering whole days start_date..end_date
+    (inclusive, 'YYYY-MM-DD') for use as `timestamp >= lower AND timestamp < upper`.
+
+    Timestamps are stored as 'YYYY-MM-DD HH' (or 'YYYY-MM-DD HH:MM' for the FI
+    tables), which sort lexicographically, so a plain range on the column can use
+    an index where `substr(timestamp, 1, 10)` cannot.
+    """
+    upper = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return start_date, upper
+
+# Per-connection tuning applied by every Database: a 64 MiB page cache and up to
+# 256 MiB of the file memory-mapped, so command reads hit mapped pages instead of
+# read() syscalls. File-level settings (page_size, auto_vacuum) are in db_maintenance.py.
+CONNECTION_PRAGMAS = {
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+def epoch_hour(timestamp):
+    """Converts a 'YYYY-MM-DD HH' timestamp to the hour number the v2 rank tables store."""
+    return int((datetime.strptime(timestamp[:13], '%Y-%m-%d %H') - EPOCH).total_seconds()) // 3600
+
+def hour_bounds(start, end):
+    """
+    Inclusive epoch-hour bounds of the 'YYYY-MM-DD HH' timestamps with start <= timestamp
+    <= end. Either bound may be a bare date, which sorts before all of that day's hours
+    (so an end date excludes its own day), or None for no bound.
+    """
+    lower = 0 if start is None else epoch_hour(start if len(start) >= 13 else f"{start[:10]} 00")
+    if end is None:
+        upper = 2 ** 40
+    elif len(end) >= 13:
+        upper = epoch_hour(end)
+    else:
+        upper = epoch_hour(f"{end[:10]} 00") - 1
+    return lower, upper
+
 class Database:
     def __enter__(self):
         return self
@@ -76,9 +544,193 @@ class Database:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
         
-    def __init__(self, db_name):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name, read_only=False, rank_storage='rows', snapshot_codec='raw', cache_results=True,
+                 rank_shards=None):
+        if rank_storage not in RANK_STORAGE_MODES:
+            raise ValueError(f"Invalid rank storage mode: {rank_storage}")
+        if snapshot_codec not in rank_snapshots.CODECS:
+            raise ValueError(f"Invalid snapshot codec: {snapshot_codec}")
+        self.db_name = db_name
+        self.rank_storage = rank_storage
+        self.snapshot_codec = snapshot_codec
+        if read_only:
+            # Read-only connections may be handed between threads by a reader pool.
+            uri = f"{Path(db_name).absolute().as_uri()}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_name)
+        self.conn.create_function('normalize_game_name', 1, normalize_game_name_for_search, deterministic=True)
+        for pragma, value in CONNECTION_PRAGMAS.items():
+            self.conn.execute(f"PRAGMA {pragma} = {value}")
         self.cursor = self.conn.cursor()
+        # When set, write methods leave committing to the caller (see async_database's
+        # writer thread, which commits several queued writes in one transaction).
+        self.defer_commit = False
+        # Read getters go through the process-wide result cache (see result_cache.py);
+        # tables written since the last commit are published to it by _commit(), and
+        # what was written to them to the change bus (see change_bus.py).
+        self.result_cache = RESULT_CACHE if cache_results else None
+        self._changed_tables = set()
+        self._pending_changes = PendingChanges()
+        # In-process state to update once the open transaction has committed
+        self._after_commit = []
+        # 'v2' once schema_v2.py has replaced the rank tables with views; the hottest
+        # raw-row getters then query the integer-keyed tables directly.
+        self.rank_schema = self._detect_rank_schema()
+        # With a shard directory, rank rows live in one attached file per month
+        # (see rank_shards.py) and rank queries are routed through self.rank_shards.
+        self.rank_shards = None
+        if rank_shards:
+            if self.rank_schema == 'v2':
+                raise ValueError("Rank shards hold v1 rank rows; revert the v2 rank schema first")
+            from rank_shards import ShardRouter
+            self.rank_shards = ShardRouter(self.conn, rank_shards, read_only=read_only)
+
+    def _detect_rank_schema(self):
+        self.cursor.execute("SELECT type FROM sqlite_master WHERE name = 'SteamTopGames'")
+        row = self.cursor.fetchone()
+        return 'v2' if row and row[0] == 'view' else 'v1'
+
+    def _commit(self):
+        if not self.defer_commit:
+            self.conn.commit()
+            self._publish_changes()
+
+    def _rollback(self):
+        # With deferred commits the caller owns the transaction and rolls back the
+        # failed write (to its savepoint) when the exception propagates.
+        if not self.defer_commit:
+            self.conn.rollback()
+            self._discard_changes()
+
+    def _publish_changes(self):
+        # Versions are bumped only after the commit, so a reader can never cache data
+        # from before the write under the version that follows it.
+        after_commit, self._after_commit = self._after_commit, []
+        for callback in after_commit:
+            callback()
+        if self._changed_tables:
+            db_key = self._process_cache_key()
+            versions = bump_data_version(db_key, *self._changed_tables)
+            events = self._pending_changes.events(db_key, versions)
+            self._changed_tables.clear()
+            self._pending_changes.clear()
+            CHANGE_BUS.publish(events)
+
+    def _discard_changes(self):
+        self._changed_tables.clear()
+        self._pending_changes.clear()
+        self._after_commit.clear()
+
+    def _note_change(self, table, kind, first_key=None, last_key=None, rows=0, keys=(), payload=()):
+        """Records a write to `table` for the change bus; published by _commit()."""
+        self._changed_tables.add(table)
+        self._pending_changes.note(table, kind, first_key, last_key, rows, keys, payload)
+
+    def release_rank_shards(self):
+        """Detaches the closed, unsealed rank shards so db_maintenance.py can seal them."""
+        if self.rank_shards is not None:
+            self.rank_shards.release_unsealed()
+
+    def rank_schemas(self, start=None, end=None):
+        """
+        Yields the schemas holding rank rows between start and end (inclusive, None =
+        unbounded): main, then the overlapping monthly shards, attached as they are reached.
+        """
+        yield 'main'
+        if self.rank_shards is not None:
+            yield from self.rank_shards.schemas(start, end)
+
+    def rank_row_source(self, table, start=None, end=None, schema='main'):
+        """
+        Returns (sql, params) of a subquery to select FROM holding the rows of `table` with
+        start <= timestamp <= end (None = unbounded; bounds may be dates, see hour_bounds),
+        with the table's v1 columns. Under the v2 rank schema the range is applied to the
+        indexed hour column of the v2 table instead of to the view's computed timestamp.
+        """
+        if self.rank_schema == 'v2' and table in RANK_V2_RANGE_QUERIES:
+            return f"({RANK_V2_RANGE_QUERIES[table]})", hour_bounds(start, end)
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            params.append(end)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f"(SELECT * FROM {schema}.{table}{where})", tuple(params)
+
+    def _rank_rows(self, table, columns, start, end, where='', params=(), order_by=None):
+        """
+        Returns `SELECT columns FROM table WHERE timestamp BETWEEN start AND end {where}`
+        over the rank rows, wherever they are stored. `where` starts with ' AND '.
+        """
+        if self.rank_shards is not None:
+            return self.rank_shards.select(table, columns, start, end, where, params, order_by)
+        order = f" ORDER BY {order_by}" if order_by else ''
+        source, source_params = self.rank_row_source(table, start, end)
+        where = f" WHERE {where[len(' AND '):]}" if where else ''
+        self.cursor.execute(f"SELECT {columns} FROM {source}{where}{order}", (*source_params, *params))
+        return self.cursor.fetchall()
+
+    def iter_rank_rows(self, source, start_date, chunk_size=50000):
+        """
+        Yields lists of (timestamp, appid / ps_id, place) rows of one source from start_date
+        ('YYYY-MM-DD') on, oldest month first, e.g. for loading a rank_cube.RankCube.
+        """
+        table, id_column = RANK_SOURCES[source]
+        for schema in self.rank_schemas(start_date):
+            source, source_params = self.rank_row_source(table, start_date, None, schema)
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(f"SELECT timestamp, {id_column}, place FROM {source}", source_params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+
+    def attach_rank_cube(self, cube):
+        """
+        Keeps `cube` (a rank_cube.RankCube) current with every capture committed to this
+        database file by this process, through a change bus subscription, and makes it
+        the cube rank_cube() returns for its source.
+        """
+        table, _ = RANK_SOURCES[cube.source]
+        db_key = self._process_cache_key()
+        unsubscribe = CHANGE_BUS.subscribe(cube.on_change, tables=(table,), db_key=db_key)
+        _RANK_CUBES[(db_key, cube.source)] = cube
+        return unsubscribe
+
+    def load_rank_cube(self, source='steam', start_date=None):
+        """
+        Loads a rank_cube.RankCube of `source` from start_date on and attaches it. Run on
+        the connection that writes the captures (AsyncDatabase's writer thread), no
+        capture can be committed between the load and the subscription. Returns the cube.
+        """
+        from rank_cube import RankCube
+        cube = RankCube.load(self, source, start_date)
+        self.attach_rank_cube(cube)
+        return cube
+
+    def rank_cube(self, source='steam'):
+        """The RankCube attached to this database file for `source`, or None."""
+        return _RANK_CUBES.get((self._process_cache_key(), source))
+
+    def invalidate(self, *tables):
+        """
+        Marks `tables` as changed for the result cache and the change bus. Only needed
+        after committing writes made with raw SQL on `conn`; the write methods of this
+        class do it themselves.
+        """
+        db_key = self._process_cache_key()
+        CHANGE_BUS.publish(PendingChanges().events(db_key, bump_data_version(db_key, *tables)))
+
+    def cache_stats(self):
+        """Returns the result cache counters (hits, misses, evictions, size, ...)."""
+        return self.result_cache.stats() if self.result_cache else None
         
     def create_tables(self):
         self.cursor.execute(GAME_TRANSLATION_SCHEMA)
@@ -88,16 +740,309 @@ class Database:
         self.cursor.execute(SHORT_POSITIONS_SCHEMA)
         self.cursor.execute(REPORTED_ENTITIES_SCHEMA)
         self.cursor.execute(POSITION_HOLDERS_SCHEMA)
+        self.cursor.execute(SCHEMA_MIGRATIONS_SCHEMA)
         self.conn.commit()
+        self.run_migrations()
+
+    def run_migrations(self):
+        """
+        Applies every migration in MIGRATIONS newer than the recorded schema version.
+        Each migration runs in its own transaction together with its SchemaMigrations row,
+        so a failed migration leaves the database at the previous version.
+        Returns the list of versions that were applied.
+        """
+        self.cursor.execute("SELECT COALESCE(MAX(version), 0) FROM SchemaMigrations")
+        current_version = self.cursor.fetchone()[0]
+
+        applied = []
+        for version, description, steps in MIGRATIONS:
+            if version <= current_version:
+                continue
+            try:
+                self.cursor.execute("BEGIN")
+                for step in steps:
+                    if isinstance(step, tuple):
+                        self.cursor.execute(*step)
+                    else:
+                        self.cursor.execute(step)
+                self.cursor.execute(
+                    "INSERT INTO SchemaMigrations (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            applied.append(version)
+        return applied
+
+    def backfill_daily_rollup(self):
+        """
+        Rebuilds DailyPlacementRollup from the SteamTopGames/PSTopGames history.
+        The rollup is normally maintained by insert_bulk_data; this is the one-off
+        repair path (also run by migration 2) for data written outside of it. Only the
+        dates that still have ranked rows are rebuilt: once retention.py has archived a
+        day, its rollup rows are the only daily record left and are kept as they are.
+        """
+        if self.rank_shards is not None:
+            rollup_rows = [row for source in RANK_SOURCES for row in self._shard_rollup_rows(source)]
+        try:
+            if self.rank_shards is not None:
+                self.cursor.executemany(
+                    "DELETE FROM DailyPlacementRollup WHERE source = ? AND date = ?",
+                    {(source, date) for source, _, date, *_ in rollup_rows})
+                self.cursor.executemany(DAILY_ROLLUP_UPSERT_QUERY, rollup_rows)
+            else:
+                for source, (table, id_column) in RANK_SOURCES.items():
+                    self.cursor.execute(f'''
+                        DELETE FROM DailyPlacementRollup
+                        WHERE source = ? AND date IN (
+                            SELECT DISTINCT substr(timestamp, 1, 10) FROM {table} WHERE place > 0)
+                    ''', (source,))
+                    self.cursor.execute(
+                        DAILY_ROLLUP_BACKFILL_QUERY.format(table=table, id_column=id_column, date_filter=''),
+                        (source,))
+            self._rebuild_rolling_rank_stats()
+            for table, _ in RANK_SOURCES.values():
+                self._note_change(table, REBUILT)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+
+    def refresh_daily_rollup_date(self, source, date):
+        """
+        Recomputes the DailyPlacementRollup rows of one source and date from the raw rank
+        rows if they disagree on the number of samples. A date without ranked rows (e.g.
+        archived by retention.py) is left alone. Returns True if it rebuilt them.
+        """
+        table, id_column = RANK_SOURCES[source]
+        lower, upper = day_range_bounds(date, date)
+        # upper is the next date ('YYYY-MM-DD'), which sorts before all of its hours
+        raw_count = sum(count for count, in self._rank_rows(table, 'COUNT(*)', lower, upper, ' AND place > 0'))
+        if not raw_count:
+            return False
+        self.cursor.execute(
+            "SELECT COALESCE(SUM(sample_count), 0) FROM DailyPlacementRollup WHERE source = ? AND date = ?",
+            (source, date))
+        if self.cursor.fetchone()[0] == raw_count:
+            return False
+
+        if self.rank_shards is not None:
+            rollup_rows = self._shard_rollup_rows(source, lower, upper)
+        try:
+            self.cursor.execute(
+                "DELETE FROM DailyPlacementRollup WHERE source = ? AND date = ?", (source, date))
+            if self.rank_shards is not None:
+                self.cursor.executemany(DAILY_ROLLUP_UPSERT_QUERY, rollup_rows)
+            else:
+                rank_source, source_params = self.rank_row_source(table, lower, upper)
+                self.cursor.execute(
+                    DAILY_ROLLUP_BACKFILL_QUERY.format(table=rank_source, id_column=id_column, date_filter=''),
+                    (source, *source_params))
+            self._refresh_rolling_rank_stats(source)
+            self._note_change(table, REBUILT, date, date)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return True
+
+    def backfill_rolling_rank_stats(self):
+        """
+        Rebuilds RollingRankStats from DailyPlacementRollup. The table is normally kept
+        current by insert_bulk_data and the rollup rebuilds; this is the repair path.
+        """
+        try:
+            self._rebuild_rolling_rank_stats()
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+
+    def _rebuild_rolling_rank_stats(self):
+        """Recomputes every RollingRankStats row inside the caller's transaction."""
+        self.cursor.execute("DELETE FROM RollingRankStats")
+        self.cursor.execute(ROLLING_RANK_STATS_SEED_QUERY)
+        for source in RANK_SOURCES:
+            self.cursor.execute(ROLLING_RANK_STATS_REFRESH_QUERY, {'source': source, 'as_of': None})
+        self._note_change('RollingRankStats', REBUILT)
+
+    def _refresh_rolling_rank_stats(self, source):
+        """
+        Updates the RollingRankStats rows of one source to its latest rollup date, inside
+        the caller's transaction. One aggregate over the last 30 days of the rollup.
+        """
+        self.cursor.execute(ROLLING_RANK_STATS_REFRESH_QUERY, {'source': source, 'as_of': None})
+        self._note_change('RollingRankStats', REBUILT, rows=self.cursor.rowcount)
+
+    def _shard_rollup_rows(self, source, lower=None, upper=None):
+        """
+        DailyPlacementRollup rows of one source computed from the main table and the rank
+        shards (optionally only timestamp >= lower and < upper). Read before the write
+        transaction starts: a shard read inside it stays locked, and attached, until the
+        commit. A day split between two schemas yields two rows, which the upsert sums.
+        """
+        table, id_column = RANK_SOURCES[source]
+        date_filter = ' AND timestamp >= ? AND timestamp < ?' if lower else ''
+        rows = []
+        for schema in self.rank_schemas(lower, upper):
+            self.cursor.execute(
+                DAILY_ROLLUP_AGGREGATE_QUERY.format(
+                    table=f'{schema}.{table}', id_column=id_column, date_filter=date_filter),
+                (source, lower, upper) if lower else (source,))
+            rows.extend(self.cursor.fetchall())
+        return rows
+
+    def _get_daily_placements(self, source, item_id, start_date, end_date=None):
+        """
+        Reads per-day placement aggregates for one appid/ps_id from DailyPlacementRollup.
+        Dates are inclusive 'YYYY-MM-DD' strings; end_date=None means up to today.
+        Returns rows of (date, harmonic_mean_place, avg_place, min_place, max_place).
+        """
+        query = """
+            SELECT date,
+                   sample_count / reciprocal_sum AS harmonic_mean_place,
+                   CAST(place_sum AS REAL) / sample_count AS avg_place,
+                   min_place,
+                   max_place
+            FROM DailyPlacementRollup
+            WHERE source = ? AND item_id = ? AND date >= ? AND date <= ?
+            ORDER BY date ASC
+        """
+        self.cursor.execute(query, (source, str(item_id), start_date, end_date or '9999-12-31'))
+        return self.cursor.fetchall()
         
+    def backfill_snapshot_catalog(self):
+        """
+        Rebuilds the Snapshots catalog entries from the rows of CATALOG_TABLES. Like
+        backfill_daily_rollup, only needed for data written outside insert_bulk_data.
+        """
+        shard_rows = []
+        if self.rank_shards is not None:
+            # Read before the write transaction, see _shard_rollup_rows
+            for table in RANK_TABLE_SOURCES:
+                for schema in self.rank_shards.schemas():
+                    self.cursor.execute(f'''
+                        SELECT ?, timestamp, COUNT(*) FROM {schema}.{table}
+                        WHERE timestamp IS NOT NULL GROUP BY timestamp
+                    ''', (table,))
+                    shard_rows.extend(self.cursor.fetchall())
+        try:
+            for table in CATALOG_TABLES:
+                self.cursor.execute(SNAPSHOT_CATALOG_BACKFILL_QUERY.format(table=table))
+            if shard_rows:
+                self.cursor.executemany(
+                    "INSERT OR REPLACE INTO Snapshots (source, ts, row_count) VALUES (?, ?, ?)", shard_rows)
+            for table in CATALOG_TABLES:
+                self._note_change(table, REBUILT)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+
+    def reconcile_rank_shards(self, months=None):
+        """
+        Repair path for the rank shards. A capture written to a shard commits the shard
+        file and the main file one after the other (attached WAL databases do not commit
+        atomically), so a crash in between leaves shard rows without their Snapshots and
+        DailyPlacementRollup entries, or the reverse. Compares the rows per timestamp of
+        `months` ('YYYY_MM', default: every unsealed shard) with Snapshots, rewrites the
+        entries that disagree and rebuilds the rollup of their days. Returns the number
+        of timestamps repaired.
+        """
+        if self.rank_shards is None or self.rank_storage == 'snapshots':
+            return 0
+        if months is None:
+            months = [month for month in self.rank_shards.months() if not self.rank_shards.is_sealed(month)]
+
+        repaired = []
+        for month in months:
+            start = datetime.strptime(month, '%Y_%m')
+            lower = start.strftime('%Y-%m-%d')
+            upper = (start.replace(day=28) + timedelta(days=4)).replace(day=1).strftime('%Y-%m-%d')
+            for table in RANK_TABLE_SOURCES:
+                counts = {}
+                for schema in self.rank_schemas(lower, lower):
+                    self.cursor.execute(f'''
+                        SELECT timestamp, COUNT(*) FROM {schema}.{table}
+                        WHERE timestamp >= ? AND timestamp < ? GROUP BY timestamp
+                    ''', (lower, upper))
+                    for timestamp, count in self.cursor.fetchall():
+                        counts[timestamp] = counts.get(timestamp, 0) + count
+                self.cursor.execute(
+                    "SELECT ts, row_count FROM Snapshots WHERE source = ? AND ts >= ? AND ts < ?",
+                    (table, lower, upper))
+                catalog = dict(self.cursor.fetchall())
+                repaired.extend(
+                    (table, timestamp, counts.get(timestamp, 0))
+                    for timestamp in sorted(counts.keys() | catalog.keys())
+                    if counts.get(timestamp, 0) != catalog.get(timestamp, 0))
+        if not repaired:
+            return 0
+
+        try:
+            for table, timestamp, count in repaired:
+                if count:
+                    self.cursor.execute(
+                        "INSERT OR REPLACE INTO Snapshots (source, ts, row_count) VALUES (?, ?, ?)",
+                        (table, timestamp, count))
+                else:
+                    self.cursor.execute("DELETE FROM Snapshots WHERE source = ? AND ts = ?", (table, timestamp))
+            for table in {table for table, _, _ in repaired}:
+                self._note_change(table, REBUILT)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        for table, date in sorted({(table, timestamp[:10]) for table, timestamp, _ in repaired}):
+            self.refresh_daily_rollup_date(RANK_TABLE_SOURCES[table], date)
+        return len(repaired)
+
     def get_latest_timestamp(self, table):
         if not table.isidentifier():
             raise ValueError(f"Invalid table name: {table}")
 
+        if table in CATALOG_TABLES:
+            self.cursor.execute(
+                "SELECT ts FROM Snapshots WHERE source = ? ORDER BY ts DESC LIMIT 1", (table,))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+
         query = f"SELECT MAX(timestamp) FROM {table}"
         self.cursor.execute(query)
         return self.cursor.fetchone()[0]
+
+    def get_latest_timestamp_on(self, table, date):
+        """Returns the last capture timestamp of `table` on date ('YYYY-MM-DD'), or None."""
+        day_start, day_end = day_range_bounds(date, date)
+        self.cursor.execute('''
+            SELECT ts FROM Snapshots
+            WHERE source = ? AND ts >= ? AND ts < ?
+            ORDER BY ts DESC LIMIT 1
+        ''', (table, day_start, day_end))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def get_timestamp_days_ago(self, table, days, timestamp=None):
+        """
+        Returns the last capture of `table` at or before `days` days before `timestamp`
+        (default: the latest capture), or None.
+        """
+        timestamp = timestamp or self.get_latest_timestamp(table)
+        if not timestamp:
+            return None
+        time_format = '%Y-%m-%d %H:%M' if len(timestamp) > 13 else '%Y-%m-%d %H'
+        target = (datetime.strptime(timestamp, time_format) - timedelta(days=days)).strftime(time_format)
+        self.cursor.execute('''
+            SELECT ts FROM Snapshots
+            WHERE source = ? AND ts <= ?
+            ORDER BY ts DESC LIMIT 1
+        ''', (table, target))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
     
+    @cached_read('SteamTopGames', 'GameTranslation', daily=True)
     def get_gts_placements(self, game_name):
         """
         Retrieves aggregated GTS placement data for the given game over the last 90 days.
@@ -126,33 +1071,22 @@ class Database:
         
         appid = row[0]
         
-        # Calculate the threshold timestamp: 90 days ago.
-        from datetime import datetime, timedelta
-        threshold_dt = datetime.now() - timedelta(days=90)
-        threshold_str = threshold_dt.strftime('%Y-%m-%d %H')
+        # Calculate the threshold date: 90 days ago.
+        threshold_str = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
         
-        # Query SteamTopGames for records with this appid from the last 90 days.
-        # We extract the date part (YYYY-MM-DD) from the timestamp (which is stored as "YYYY-MM-DD HH").
+        # Per-day aggregates come from DailyPlacementRollup, which insert_bulk_data keeps
+        # up to date, so this reads one row per day instead of every hourly capture.
         # Use harmonic mean for better ranking aggregation (gives more weight to better/lower ranks)
-        query = """
-            SELECT substr(timestamp, 1, 10) AS date, 
-                   COUNT(place) / SUM(1.0 / place) AS harmonic_mean_place
-            FROM SteamTopGames
-            WHERE appid = ? AND timestamp >= ?
-            GROUP BY date
-            ORDER BY date ASC
-        """
-        self.cursor.execute(query, (appid, threshold_str))
-        rows = self.cursor.fetchall()
+        rows = self._get_daily_placements('steam', appid, threshold_str)
         
         if not rows:
-            return None  # No placement data available for the last 30 days.
+            return None  # No placement data available for the last 90 days.
         
         aggregated_labels = []
         placements = []
         positions = []
         
-        for index, (date_label, harmonic_mean_place) in enumerate(rows):
+        for index, (date_label, harmonic_mean_place, _, _, _) in enumerate(rows):
             aggregated_labels.append(date_label)
             placements.append(harmonic_mean_place)
             positions.append(index)
@@ -165,6 +1099,7 @@ class Database:
         
         return aggregated_data
     
+    @cached_read('SteamTopGames', 'GameTranslation', daily=True)
     def get_gts_placements_with_minmax(self, game_name):
         """
         Retrieves aggregated GTS placement data for the given game over the last 90 days,
@@ -180,23 +1115,8 @@ class Database:
         
         appid = row[0]
         
-        from datetime import datetime, timedelta
-        threshold_dt = datetime.now() - timedelta(days=90)
-        threshold_str = threshold_dt.strftime('%Y-%m-%d %H')
-        
-        query = """
-            SELECT
-                substr(timestamp, 1, 10) AS date,
-                COUNT(place) / SUM(1.0 / place) AS harmonic_mean_place,
-                MIN(place) AS min_place,
-                MAX(place) AS max_place
-            FROM SteamTopGames
-            WHERE appid = ? AND timestamp >= ?
-            GROUP BY date
-            ORDER BY date ASC
-        """
-        self.cursor.execute(query, (appid, threshold_str))
-        rows = self.cursor.fetchall()
+        threshold_str = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
+        rows = self._get_daily_placements('steam', appid, threshold_str)
         
         if not rows:
             return None
@@ -206,7 +1126,7 @@ class Database:
         min_placements = []
         max_placements = []
         
-        for date_label, harmonic_mean_place, min_place, max_place in rows:
+        for date_label, harmonic_mean_place, _, min_place, max_place in rows:
             aggregated_labels.append(date_label)
             harmonic_mean_placements.append(harmonic_mean_place)
             min_placements.append(min_place)
@@ -221,6 +1141,7 @@ class Database:
         
         return aggregated_data
 
+    @cached_read('PSTopGames', 'PSGameTranslation', daily=True)
     def get_last_month_ps_placements(self, game_name):
         """
         Retrieves aggregated GTS placement data for the given game over the last 30 days from PS Store.
@@ -246,31 +1167,20 @@ class Database:
         
         ps_id = row[0]
         
-        # Calculate the threshold timestamp: 30 days ago.
-        from datetime import datetime, timedelta
-        threshold_dt = datetime.now() - timedelta(days=90) # Changed to 90 days for consistency with steam
-        threshold_str = threshold_dt.strftime('%Y-%m-%d %H')
+        # Calculate the threshold date: 90 days ago.
+        threshold_str = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d') # Changed to 90 days for consistency with steam
         
-        # Query PSTopGames for records with this ps_id from the last 30 days.
-        # We extract the date part (YYYY-MM-DD) from the timestamp (which is stored as "YYYY-MM-DD HH").
-        query = """
-            SELECT substr(timestamp, 1, 10) AS date, AVG(place) AS avg_place
-            FROM PSTopGames
-            WHERE ps_id = ? AND timestamp >= ?
-            GROUP BY date
-            ORDER BY date ASC
-        """
-        self.cursor.execute(query, (ps_id, threshold_str))
-        rows = self.cursor.fetchall()
+        # Per-day aggregates for this ps_id from DailyPlacementRollup.
+        rows = self._get_daily_placements('ps', ps_id, threshold_str)
         
         if not rows:
-            return None  # No placement data available for the last 30 days.
+            return None  # No placement data available for the last 90 days.
         
         aggregated_labels = []
         placements = []
         positions = []
         
-        for index, (date_label, avg_place) in enumerate(rows):
+        for index, (date_label, _, avg_place, _, _) in enumerate(rows):
             aggregated_labels.append(date_label)
             placements.append(avg_place)
             positions.append(index)
@@ -283,6 +1193,7 @@ class Database:
         
         return aggregated_data
 
+    @cached_read('SteamTopGames', 'PSTopGames')
     def get_yesterday_top_games(self, timestamp, table='SteamTopGames'):
         if not timestamp:
             return {}
@@ -297,58 +1208,75 @@ class Database:
             yesterday_date = (current_dt - timedelta(days=1)).strftime('%Y-%m-%d')
             yesterday_timestamp_21 = f"{yesterday_date} 21"
             
-            self.cursor.execute('''
-            SELECT place, appid FROM SteamTopGames
-            WHERE timestamp = ?
-            ''', (yesterday_timestamp_21,))
+            if self.rank_schema == 'v2':
+                self.cursor.execute('''
+                SELECT place, CAST(appid AS TEXT) FROM SteamRanksV2
+                WHERE hour = ?
+                ''', (epoch_hour(yesterday_timestamp_21),))
+                rows = self.cursor.fetchall()
+            else:
+                rows = self._rank_rows('SteamTopGames', 'place, appid', yesterday_timestamp_21, yesterday_timestamp_21)
             
-            rows = self.cursor.fetchall()
             return {appid: place for place, appid in rows}
     
         elif table == 'PSTopGames':
             yesterday_date_str = (current_dt - timedelta(days=1)).strftime('%Y-%m-%d')
             
-            # Find the latest timestamp for yesterday's date in PSTopGames
-            query_latest_yesterday_ts = """
-                SELECT MAX(timestamp) 
-                FROM PSTopGames
-                WHERE SUBSTR(timestamp, 1, 10) = ?
-            """
-            self.cursor.execute(query_latest_yesterday_ts, (yesterday_date_str,))
-            latest_yesterday_timestamp_row = self.cursor.fetchone()
+            # Find the latest capture of yesterday's date in the snapshot catalog
+            latest_yesterday_timestamp = self.get_latest_timestamp_on('PSTopGames', yesterday_date_str)
 
-            if not latest_yesterday_timestamp_row or not latest_yesterday_timestamp_row[0]:
+            if not latest_yesterday_timestamp:
                 return {} # No data found for yesterday
 
-            latest_yesterday_timestamp = latest_yesterday_timestamp_row[0]
-
             # Fetch all games for that specific latest timestamp
-            self.cursor.execute('''
-                SELECT place, ps_id FROM PSTopGames
-                WHERE timestamp = ?
-            ''', (latest_yesterday_timestamp,))
+            if self.rank_schema == 'v2':
+                self.cursor.execute('''
+                    SELECT place, CAST(ps_id AS TEXT) FROM PSRanksV2
+                    WHERE hour = ?
+                ''', (epoch_hour(latest_yesterday_timestamp),))
+                rows = self.cursor.fetchall()
+            else:
+                rows = self._rank_rows('PSTopGames', 'place, ps_id', latest_yesterday_timestamp, latest_yesterday_timestamp)
             
-            rows = self.cursor.fetchall()
             return {ps_id: place for place, ps_id in rows}
         
         return {}
     
+    @cached_read('SteamTopGames')
     def get_last_week_ranks(self, timestamp, current_top_appids):
         # Calculate the date for 7 days ago and set the hour to 21
         last_week_date = (datetime.strptime(timestamp, '%Y-%m-%d %H') - timedelta(days=7)).strftime('%Y-%m-%d')
         last_week_timestamp_21 = f"{last_week_date} 21"
 
         placeholders = ','.join(['?'] * len(current_top_appids))
-        query = f'''
-            SELECT appid, GROUP_CONCAT(place) AS ranks
-            FROM SteamTopGames
-            WHERE timestamp BETWEEN ? AND ? AND appid IN ({placeholders})
-            GROUP BY appid
-        '''
-
-        self.cursor.execute(query, (last_week_timestamp_21, timestamp, *current_top_appids))
-
-        rows = self.cursor.fetchall()
+        if self.rank_schema == 'v2':
+            query = f'''
+                SELECT CAST(appid AS TEXT), GROUP_CONCAT(place) AS ranks
+                FROM SteamRanksV2
+                WHERE hour BETWEEN ? AND ? AND appid IN ({placeholders})
+                GROUP BY appid
+            '''
+            params = (epoch_hour(last_week_timestamp_21), epoch_hour(timestamp), *current_top_appids)
+            self.cursor.execute(query, params)
+            rows = self.cursor.fetchall()
+        elif self.rank_shards is not None:
+            # One week can span two shards: concatenate each appid's ranks across them
+            ranks_by_appid = {}
+            for appid, place in self._rank_rows(
+                    'SteamTopGames', 'appid, place', last_week_timestamp_21, timestamp,
+                    f' AND appid IN ({placeholders})', current_top_appids, order_by='timestamp'):
+                ranks_by_appid.setdefault(appid, []).append(str(place))
+            rows = [(appid, ','.join(ranks)) for appid, ranks in ranks_by_appid.items()]
+        else:
+            query = f'''
+                SELECT appid, GROUP_CONCAT(place) AS ranks
+                FROM SteamTopGames
+                WHERE timestamp BETWEEN ? AND ? AND appid IN ({placeholders})
+                GROUP BY appid
+            '''
+            params = (last_week_timestamp_21, timestamp, *current_top_appids)
+            self.cursor.execute(query, params)
+            rows = self.cursor.fetchall()
 
         last_week_ranks = {}
         for appid, ranks_str in rows:
@@ -357,24 +1285,289 @@ class Database:
 
         return last_week_ranks
 
+    @cached_read('RollingRankStats')
+    def get_rolling_rank_stats(self, source='steam', item_ids=None, trend=None, limit=None):
+        """
+        Current RollingRankStats of the items of `source` ranked in the last 30 days,
+        optionally only `item_ids` and/or one trend ('new', 'up', 'down', 'steady',
+        'out'), ordered by 7-day mean place (items without one last). Returns
+        {item_id: {'mean_1d', 'mean_3d', 'mean_7d', 'mean_30d', 'days_7d', 'days_30d',
+        'first_seen', 'trend'}}; means are None for windows the item was not ranked in.
+        """
+        query = '''
+            SELECT item_id, mean_1d, mean_3d, mean_7d, mean_30d, days_7d, days_30d, first_seen, trend
+            FROM RollingRankStats
+            WHERE source = ? AND as_of = (SELECT MAX(as_of) FROM RollingRankStats WHERE source = ?)
+        '''
+        params = [source, source]
+        if item_ids is not None:
+            item_ids = [str(item_id) for item_id in item_ids]
+            query += f" AND item_id IN ({','.join(['?'] * len(item_ids))})"
+            params.extend(item_ids)
+        if trend is not None:
+            query += " AND trend = ?"
+            params.append(trend)
+        query += " ORDER BY mean_7d IS NULL, mean_7d"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        self.cursor.execute(query, params)
+        columns = ('mean_1d', 'mean_3d', 'mean_7d', 'mean_30d', 'days_7d', 'days_30d', 'first_seen', 'trend')
+        return {row[0]: dict(zip(columns, row[1:])) for row in self.cursor.fetchall()}
+
+    @cached_read('SteamTopGames', 'PSTopGames')
+    def get_rank_snapshot(self, timestamp, table='SteamTopGames'):
+        """
+        Returns the packed capture stored for `timestamp` as a dict of int32 NumPy
+        arrays ('ids', 'discounts', 'ccus'), ordered by place, or None if absent.
+        """
+        self.cursor.execute('''
+            SELECT codec, ids, discounts, ccus FROM RankSnapshots
+            WHERE source = ? AND timestamp = ?
+        ''', (RANK_TABLE_SOURCES[table], timestamp))
+        row = self.cursor.fetchone()
+        return rank_snapshots.unpack_snapshot(*row) if row else None
+
+    @cached_read('SteamTopGames', 'PSTopGames')
+    def get_yesterday_top_games_from_snapshots(self, timestamp, table='SteamTopGames'):
+        """Snapshot-backed equivalent of get_yesterday_top_games."""
+        if not timestamp or table not in RANK_TABLE_SOURCES:
+            return {}
+        try:
+            current_dt = datetime.strptime(timestamp, '%Y-%m-%d %H')
+        except ValueError:
+            return {}
+
+        yesterday_date = (current_dt - timedelta(days=1)).strftime('%Y-%m-%d')
+        if table == 'SteamTopGames':
+            # Steam compares against yesterday's 21:00 capture
+            snapshot = self.get_rank_snapshot(f"{yesterday_date} 21", table)
+        else:
+            # PS compares against the last capture of yesterday
+            day_start, day_end = day_range_bounds(yesterday_date, yesterday_date)
+            self.cursor.execute('''
+                SELECT codec, ids, discounts, ccus FROM RankSnapshots
+                WHERE source = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp DESC LIMIT 1
+            ''', (RANK_TABLE_SOURCES[table], day_start, day_end))
+            row = self.cursor.fetchone()
+            snapshot = rank_snapshots.unpack_snapshot(*row) if row else None
+
+        if snapshot is None:
+            return {}
+        return {str(item_id): place for place, item_id in enumerate(snapshot['ids'].tolist(), 1)}
+
+    @cached_read('SteamTopGames')
+    def get_last_week_ranks_from_snapshots(self, timestamp, current_top_appids):
+        """Snapshot-backed equivalent of get_last_week_ranks."""
+        last_week_date = (datetime.strptime(timestamp, '%Y-%m-%d %H') - timedelta(days=7)).strftime('%Y-%m-%d')
+        last_week_timestamp_21 = f"{last_week_date} 21"
+
+        self.cursor.execute('''
+            SELECT codec, ids FROM RankSnapshots
+            WHERE source = 'steam' AND timestamp BETWEEN ? AND ?
+            ORDER BY timestamp ASC
+        ''', (last_week_timestamp_21, timestamp))
+
+        id_arrays = [rank_snapshots.unpack_int32(ids, codec) for codec, ids in self.cursor.fetchall()]
+        ranks = rank_snapshots.ranks_over_time(id_arrays, current_top_appids)
+        return {str(appid): places for appid, places in ranks.items()}
+
+    @cached_read('SteamTopGames', 'PSTopGames')
+    def get_capture(self, timestamp, table='SteamTopGames'):
+        """Returns one capture as [(place, appid / ps_id), ...] ordered by place ([] if absent)."""
+        if table not in RANK_TABLE_SOURCES:
+            raise ValueError(f"Invalid table name: {table}")
+        if self.rank_storage == 'snapshots':
+            snapshot = self.get_rank_snapshot(timestamp, table)
+            if snapshot is None:
+                return []
+            return [(place, str(item_id)) for place, item_id in enumerate(snapshot['ids'].tolist(), 1)]
+
+        if self.rank_schema == 'v2' and table == 'SteamTopGames':
+            self.cursor.execute('''
+                SELECT place, CAST(appid AS TEXT) FROM SteamRanksV2
+                WHERE hour = ? ORDER BY place
+            ''', (epoch_hour(timestamp),))
+        elif self.rank_schema == 'v2':
+            self.cursor.execute('''
+                SELECT place, CAST(ps_id AS TEXT) FROM PSRanksV2
+                WHERE hour = ? ORDER BY place
+            ''', (epoch_hour(timestamp),))
+        else:
+            _, id_column = RANK_SOURCES[RANK_TABLE_SOURCES[table]]
+            return self._rank_rows(table, f'place, {id_column}', timestamp, timestamp, order_by='place')
+        return self.cursor.fetchall()
+
+    @cached_read('SteamCCU', 'GameTranslation', daily=True)
+    def get_ccu_summary(self, game_name, days=30):
+        """
+        Hourly concurrent players of one Steam game over the last `days` days, read with a
+        single range scan of the SteamCCU primary key. Returns None if the game is unknown
+        or has no counts, otherwise a dict with:
+            - "appid", "timestamps" ('YYYY-MM-DD HH') and "ccu" (one entry per stored hour)
+            - "current": the latest count and "latest": its timestamp
+            - "peak" and "average" over the period
+            - "delta_24h" / "delta_7d": current minus the count 24 hours / 7 days before
+              the latest hour (the closest earlier hour if that one is missing, None if
+              there is none)
+        """
+        self.cursor.execute("""
+            SELECT appid FROM GameTranslation
+            WHERE LOWER(game_name) = LOWER(?)
+        """, (game_name,))
+        row = self.cursor.fetchone()
+        if row is None or not str(row[0]).isdigit():
+            return None
+        appid = int(row[0])
+
+        # Read at least 8 days so the 7-day delta has something to compare with
+        now_hour = epoch_hour(datetime.now().strftime('%Y-%m-%d %H'))
+        self.cursor.execute('''
+            SELECT hour, ccu FROM SteamCCU
+            WHERE appid = ? AND hour > ?
+            ORDER BY hour
+        ''', (appid, now_hour - max(days, 8) * 24))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return None
+
+        hours = [hour for hour, _ in rows]
+        latest_hour, current = rows[-1]
+
+        def delta(hours_back):
+            index = bisect.bisect_right(hours, latest_hour - hours_back) - 1
+            return current - rows[index][1] if index >= 0 else None
+
+        period = [(hour, ccu) for hour, ccu in rows if hour > now_hour - days * 24]
+        return {
+            'appid': str(appid),
+            'timestamps': [(EPOCH + timedelta(hours=hour)).strftime('%Y-%m-%d %H') for hour, _ in period],
+            'ccu': [ccu for _, ccu in period],
+            'latest': (EPOCH + timedelta(hours=latest_hour)).strftime('%Y-%m-%d %H'),
+            'current': current,
+            'peak': max((ccu for _, ccu in period), default=current),
+            'average': sum(ccu for _, ccu in period) / len(period) if period else float(current),
+            'delta_24h': delta(24),
+            'delta_7d': delta(24 * 7),
+        }
+
+    def _process_cache_key(self):
+        """Key identifying this database file in process-wide caches."""
+        if self.db_name == ':memory:' or not self.db_name:
+            return id(self.conn)  # every in-memory database is distinct
+        return str(Path(self.db_name).absolute())
+
+    def _known_translations(self, source):
+        key = (self._process_cache_key(), source)
+        known = _KNOWN_TRANSLATIONS.get(key)
+        if known is None:
+            table, id_column = TRANSLATION_TABLES[source]
+            self.cursor.execute(f"SELECT {id_column}, game_name FROM {table}")
+            known = {str(item_id): title for item_id, title in self.cursor.fetchall()}
+            _KNOWN_TRANSLATIONS[key] = known
+        return known
+
+    def _name_index(self, source):
+        key = (self._process_cache_key(), source)
+        index = _NAME_INDEXES.get(key)
+        if index is None:
+            table, id_column = TRANSLATION_TABLES[source]
+            index = NameIndex()
+            self.cursor.execute(f"SELECT {id_column}, game_name, normalized_name FROM {table} ORDER BY rowid")
+            for item_id, title, normalized in self.cursor.fetchall():
+                index.add(item_id, title, normalized)
+            _NAME_INDEXES[key] = index
+        return index
+
+    def match_game_name(self, source, user_query, fuzzy=True):
+        """
+        Returns the GameTranslation (source='steam') or PSGameTranslation (source='ps')
+        title that best matches user_query, or None. See name_index.NameIndex.match.
+        """
+        if source not in TRANSLATION_TABLES:
+            raise ValueError(f"Invalid translation source: {source}")
+        return self._name_index(source).match(user_query, fuzzy)
+
+    def sync_translations(self, source, pairs):
+        """
+        Brings GameTranslation (source='steam') or PSGameTranslation (source='ps') in line
+        with an iterable of (id, title) pairs using a single transaction.
+
+        Ids already known to this process are skipped without touching SQLite; unseen ids
+        go through one INSERT OR IGNORE executemany, and known ids whose title changed are
+        renamed in the same transaction. Returns (inserted, renamed) counts.
+        """
+        if source not in TRANSLATION_TABLES:
+            raise ValueError(f"Invalid translation source: {source}")
+        table, id_column = TRANSLATION_TABLES[source]
+        known = self._known_translations(source)
+
+        new_titles = {}
+        changed_titles = {}
+        for item_id, title in pairs:
+            key = str(item_id)
+            if key not in known:
+                new_titles[key] = (item_id, title, normalize_game_name_for_search(title) if title else None)
+            elif title and known[key] != title:
+                changed_titles[key] = (title, normalize_game_name_for_search(title), item_id)
+
+        if not new_titles and not changed_titles:
+            return 0, 0
+
+        try:
+            if new_titles:
+                self.cursor.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({id_column}, game_name, normalized_name) VALUES (?, ?, ?)",
+                    list(new_titles.values()))
+            if changed_titles:
+                self.cursor.executemany(
+                    f"UPDATE {table} SET game_name = ?, normalized_name = ? WHERE {id_column} = ?",
+                    list(changed_titles.values()))
+            if new_titles:
+                self._note_change(table, INSERTED, min(new_titles), max(new_titles), len(new_titles), new_titles)
+            if changed_titles:
+                self._note_change(
+                    table, UPDATED, min(changed_titles), max(changed_titles), len(changed_titles), changed_titles)
+
+            def remember():
+                # Only once committed: an id marked known would never be written again
+                name_index = _NAME_INDEXES.get((self._process_cache_key(), source))
+                for key, (_, title, normalized) in new_titles.items():
+                    known[key] = title
+                    if name_index is not None:
+                        name_index.add(key, title, normalized)
+                for key, (title, normalized, _) in changed_titles.items():
+                    known[key] = title
+                    if name_index is not None:
+                        name_index.add(key, title, normalized)
+            self._after_commit.append(remember)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return len(new_titles), len(changed_titles)
+
     def update_appid(self, appid, title):
-        self.cursor.execute("SELECT game_name FROM GameTranslation WHERE appid = ?", (appid,))
-        if self.cursor.fetchone() is None:
-            self.cursor.execute("INSERT INTO GameTranslation (appid, game_name) VALUES (?, ?)", (appid, title))
-            self.conn.commit()
+        self.sync_translations('steam', [(appid, title)])
             
     def update_ps_appid(self, ps_id, game_name):
-        self.cursor.execute("SELECT game_name FROM PsGameTranslation WHERE ps_id = ?", (ps_id,))
-        result = self.cursor.fetchone()
-        if result is None:
-            self.cursor.execute("INSERT INTO PsGameTranslation (ps_id, game_name) VALUES (?, ?)",
-                              (ps_id, game_name))
-            self.conn.commit()
+        self.sync_translations('ps', [(ps_id, game_name)])
             
     def insert_bulk_data(self, input, table='SteamTopGames'):
         ''' 
-        Insert multiple rows in a single transaction
+        Insert multiple rows in a single transaction.
+        Rank captures also update DailyPlacementRollup in that same transaction and,
+        depending on rank_storage, are written as rows, as a RankSnapshots row, or both.
         '''
+        rollup_rows = []
+        snapshot_rows = []
+        placements = []
+        company_rows = []
+        alias_rows = []
+        isin_rows = []
+        timestamps = []
+        change_keys = ()
         
         if table == 'SteamTopGames':
             query = '''
@@ -382,6 +1575,10 @@ class Database:
             VALUES (?, ?, ?, ?, ?)
             '''
             data = [(game['timestamp'], game['count'], game['appid'], game['discount'], game['ccu']) for game in input]
+            placements = [(game['timestamp'], game['appid'], game['count']) for game in input]
+            timestamps = [game['timestamp'] for game in input]
+            rollup_rows = self._daily_rollup_rows('steam', placements)
+            snapshot_rows = self._snapshot_rows('steam', input, 'appid', 'count', 'ccu')
 
         elif table == 'PSTopGames':
             query = '''
@@ -389,6 +1586,10 @@ class Database:
             VALUES (?, ?, ?, ?)
             '''
             data = [(game['timestamp'], game['place'], game['ps_id'], game['discount']) for game in input]
+            placements = [(game['timestamp'], game['ps_id'], game['place']) for game in input]
+            timestamps = [game['timestamp'] for game in input]
+            rollup_rows = self._daily_rollup_rows('ps', placements)
+            snapshot_rows = self._snapshot_rows('ps', input, 'ps_id', 'place')
 
 
         elif table == 'ShortPositions':
@@ -397,6 +1598,9 @@ class Database:
             VALUES (?, ?, ?, ?, ?);
             '''
             data = [(row['timestamp'],row['company_name'], row['lei'], row['position_percent'], row['latest_position_date']) for _, row in input.iterrows()]
+            company_rows, alias_rows = self._company_rows(data)
+            timestamps = [row[0] for row in data]
+            change_keys = {lei for _, _, lei, *_ in data if isinstance(lei, str) and lei}
             
         elif table == 'PositionHolders':
             query = '''
@@ -404,14 +1608,137 @@ class Database:
             VALUES (?, ?, ?, ?, ?, ?);
             '''
             data = [(row['entity_name'], row['issuer_name'], row['isin'], row['position_percent'], row['position_date'], row['timestamp']) for _, row in input.iterrows()]
+            timestamps = [row[5] for row in data]
+            change_keys = {isin for _, _, isin, *_ in data if isinstance(isin, str) and isin}
+            isin_rows = list({
+                (isin, issuer_name.strip()) for _, issuer_name, isin, *_ in data
+                if isinstance(isin, str) and isin and isinstance(issuer_name, str)
+            })
 
         else:
             raise ValueError(f"Invalid table name: {table}")
 
-        self.cursor.executemany(query, data)
-        self.conn.commit()
+        if table in RANK_TABLE_SOURCES and self.rank_storage == 'snapshots':
+            data = []
+
+        try:
+            if data and table in RANK_TABLE_SOURCES and self.rank_shards is not None:
+                self.rank_shards.insert(table, data)
+            elif data:
+                self.cursor.executemany(query, data)
+            if snapshot_rows:
+                self.cursor.executemany('''
+                    INSERT OR REPLACE INTO RankSnapshots
+                        (source, timestamp, codec, game_count, ids, discounts, ccus)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', snapshot_rows)
+            if rollup_rows:
+                self.cursor.executemany(DAILY_ROLLUP_UPSERT_QUERY, rollup_rows)
+                self._refresh_rolling_rank_stats(RANK_TABLE_SOURCES[table])
+            if timestamps:
+                catalog_rows = {}
+                for timestamp in timestamps:
+                    catalog_rows[timestamp] = catalog_rows.get(timestamp, 0) + 1
+                self.cursor.executemany(
+                    SNAPSHOT_CATALOG_UPSERT_QUERY, [(table, ts, count) for ts, count in catalog_rows.items() if ts])
+            if company_rows:
+                self.cursor.executemany(COMPANY_UPSERT_QUERY, company_rows)
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO CompanyAliases (alias, lei) VALUES (?, ?)", alias_rows)
+                self._note_change('Companies', UPDATED, rows=len(company_rows), keys=[row[0] for row in company_rows])
+            if isin_rows:
+                # PositionHolders has no LEI: link ISINs through the issuer name, then
+                # record the issuer spellings of every linked ISIN as aliases.
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO CompanyIsins (isin, lei) SELECT ?, lei FROM CompanyAliases WHERE alias = ?",
+                    isin_rows)
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO CompanyAliases (alias, lei) SELECT ?, lei FROM CompanyIsins WHERE isin = ?",
+                    [(issuer_name, isin) for isin, issuer_name in isin_rows])
+                self._note_change('Companies', UPDATED)
+            captured = [ts for ts in timestamps if ts]
+            self._note_change(
+                table, INSERTED, min(captured, default=None), max(captured, default=None), len(timestamps),
+                change_keys, placements)
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+
+    def insert_ccu(self, timestamp, ccus):
+        """
+        Stores one hour of concurrent player counts ({appid: ccu}) in SteamCCU. A second
+        write for the same hour replaces its counts. Returns the number of rows written.
+        """
+        hour = epoch_hour(timestamp)
+        rows = [(int(appid), hour, int(ccu)) for appid, ccu in ccus.items() if str(appid).isdigit()]
+        if not rows:
+            return 0
+        try:
+            self.cursor.executemany("INSERT OR REPLACE INTO SteamCCU (appid, hour, ccu) VALUES (?, ?, ?)", rows)
+            self._note_change('SteamCCU', INSERTED, timestamp[:13], timestamp[:13], len(rows))
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return len(rows)
+
+    def _snapshot_rows(self, source, games, id_key, place_key, ccu_key=None):
+        """Packs a rank capture into RankSnapshots rows (one per timestamp in the batch)."""
+        if self.rank_storage == 'rows':
+            return []
+        by_timestamp = {}
+        for game in games:
+            by_timestamp.setdefault(game['timestamp'], []).append(game)
+        return [
+            (source, timestamp, self.snapshot_codec,
+             *rank_snapshots.pack_snapshot(captured, id_key, place_key, ccu_key, self.snapshot_codec))
+            for timestamp, captured in by_timestamp.items()
+        ]
+
+    @staticmethod
+    def _company_rows(short_positions):
+        """
+        Folds ShortPositions rows (timestamp, company_name, lei, ...) into Companies upsert
+        rows (lei, latest name, first seen, last seen) and CompanyAliases rows (alias, lei).
+        """
+        companies = {}
+        aliases = set()
+        for timestamp, company_name, lei, *_ in short_positions:
+            if not isinstance(lei, str) or not lei or not isinstance(company_name, str):
+                continue
+            company_name = company_name.strip()
+            aliases.add((company_name, lei))
+            if lei in companies:
+                name, first_seen, last_seen = companies[lei]
+                if timestamp >= last_seen:
+                    name, last_seen = company_name, timestamp
+                companies[lei] = (name, min(first_seen, timestamp), last_seen)
+            else:
+                companies[lei] = (company_name, timestamp, timestamp)
+        return [(lei, *values) for lei, values in companies.items()], list(aliases)
+
+    @staticmethod
+    def _daily_rollup_rows(source, placements):
+        """
+        Folds (timestamp, item_id, place) tuples into DailyPlacementRollup upsert rows,
+        one per (item_id, date) present in the batch.
+        """
+        totals = {}
+        for timestamp, item_id, place in placements:
+            if not place or place <= 0:
+                continue
+            key = (str(item_id), timestamp[:10])
+            if key in totals:
+                reciprocal_sum, place_sum, count, min_place, max_place = totals[key]
+                totals[key] = (reciprocal_sum + 1.0 / place, place_sum + place, count + 1,
+                               min(min_place, place), max(max_place, place))
+            else:
+                totals[key] = (1.0 / place, place, 1, place, place)
+        return [(source, item_id, date, *values) for (item_id, date), values in totals.items()]
     
     # TODO: Not used currently
+    @cached_read('ShortPositions')
     def fetch_current_short_position(self, company_name):
         query = '''
                 SELECT * FROM ShortPositions
@@ -435,6 +1762,7 @@ class Database:
             return None   
     
     # TODO: Not used currently    
+    @cached_read('ShortPositions')
     def fetch_historical_short_positions(self, company_name):
         query = '''
                 SELECT * FROM ShortPositions
@@ -456,9 +1784,95 @@ class Database:
         else:
             return None
     
+    @cached_read('Companies')
+    def find_company(self, query):
+        """
+        Resolves a company from any of its FI spellings (case-insensitive substring match
+        over CompanyAliases). Exact alias matches win, then aliases starting with the
+        query, then the shortest alias; ties go to the most recently reported company.
+        Returns {'lei', 'name'} with the canonical (latest) name, or None.
+        """
+        query = query.strip()
+        if not query:
+            return None
+        if len(query) >= 3:
+            # The trigram index needs at least three characters.
+            candidates = """
+                SELECT CompanyAliases.alias, CompanyAliases.lei
+                FROM CompanySearch
+                JOIN CompanyAliases ON CompanyAliases.id = CompanySearch.rowid
+                WHERE CompanySearch MATCH ?
+            """
+            params = ('"' + query.replace('"', '""') + '"',)
+        else:
+            candidates = "SELECT alias, lei FROM CompanyAliases WHERE alias LIKE ?"
+            params = (f"%{query}%",)
+
+        self.cursor.execute(f"""
+            SELECT Companies.lei, Companies.canonical_name
+            FROM ({candidates}) AS matched
+            JOIN Companies ON Companies.lei = matched.lei
+            ORDER BY matched.alias = ? COLLATE NOCASE DESC,
+                     matched.alias LIKE ? DESC,
+                     LENGTH(matched.alias),
+                     Companies.last_seen DESC
+            LIMIT 1
+        """, (*params, query, f"{query}%"))
+        row = self.cursor.fetchone()
+        return {'lei': row[0], 'name': row[1]} if row else None
+
+    @cached_read('ShortPositions')
+    def get_short_position_history(self, lei, start_date):
+        """
+        Returns a DataFrame of (timestamp, position_percent) for one company (by LEI),
+        starting at its last FI update on or before start_date so the series has an
+        opening value.
+        """
+        return self.read_frame("""
+            SELECT timestamp, position_percent
+            FROM ShortPositions
+            WHERE lei = ?
+            AND timestamp >= COALESCE((
+                SELECT MAX(timestamp)
+                FROM ShortPositions
+                WHERE lei = ? AND timestamp <= ?
+            ), ?)
+            ORDER BY timestamp
+        """, (lei, lei, start_date, start_date))
+
+    @cached_read('PositionHolders', 'Companies')
+    def get_company_holders(self, lei):
+        """
+        Returns the holder positions of the latest PositionHolders capture that covers the
+        company's ISINs, as a list of dicts (entity_name, issuer_name, isin,
+        position_percent, position_date, timestamp).
+        """
+        self.cursor.execute('''
+            SELECT entity_name, issuer_name, PositionHolders.isin, position_percent, position_date, timestamp
+            FROM PositionHolders
+            JOIN CompanyIsins ON CompanyIsins.isin = PositionHolders.isin
+            WHERE CompanyIsins.lei = ?
+            AND timestamp = (
+                SELECT MAX(timestamp) FROM PositionHolders
+                WHERE isin IN (SELECT isin FROM CompanyIsins WHERE lei = ?)
+            )
+            ORDER BY position_percent DESC
+        ''', (lei, lei))
+        columns = ('entity_name', 'issuer_name', 'isin', 'position_percent', 'position_date', 'timestamp')
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+
+    def read_frame(self, query, params=()):
+        """
+        Runs a read query and returns the result as a pandas DataFrame
+        (the replacement for calling pd.read_sql on db.conn directly).
+        """
+        import pandas as pd
+        return pd.read_sql_query(query, self.conn, params=params)
+
     def close(self):
         self.conn.close()
 
+    @cached_read('SteamTopGames', 'GameTranslation', daily=True)
     def get_gts_placements_with_minmax_delta_days(self, game_name, release_date_str):
         """
         Retrieves aggregated GTS placement data for the given game over the last 90 days,
@@ -478,22 +1892,8 @@ class Database:
         if row is None:
             return None
         appid = row[0]
-        from datetime import datetime, timedelta
-        threshold_dt = datetime.now() - timedelta(days=90)
-        threshold_str = threshold_dt.strftime('%Y-%m-%d %H')
-        query = """
-            SELECT
-                substr(timestamp, 1, 10) AS date,
-                COUNT(place) / SUM(1.0 / place) AS harmonic_mean_place,
-                MIN(place) AS min_place,
-                MAX(place) AS max_place
-            FROM SteamTopGames
-            WHERE appid = ? AND timestamp >= ?
-            GROUP BY date
-            ORDER BY date ASC
-        """
-        self.cursor.execute(query, (appid, threshold_str))
-        rows = self.cursor.fetchall()
+        threshold_str = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
+        rows = self._get_daily_placements('steam', appid, threshold_str)
         if not rows:
             return None
         release_date = datetime.strptime(release_date_str, '%Y-%m-%d')
@@ -501,7 +1901,7 @@ class Database:
         avg_placements = []
         min_placements = []
         max_placements = []
-        for date_label, harmonic_mean_place, min_place, max_place in rows:
+        for date_label, harmonic_mean_place, _, min_place, max_place in rows:
             date_obj = datetime.strptime(date_label, '%Y-%m-%d')
             delta = (date_obj - release_date).days
             delta_days.append(delta)
@@ -522,21 +1922,99 @@ class Database:
         For each game, gets data from specified days before release to release day.
         games_info: list of dicts with keys 'game_name' and 'release_date_str'
         days_before_release: number of days before release to look back (default: 90)
-        Returns a dict with game names as keys and placement data as values.
+        Returns a dict with game names as keys and placement data as values, in the
+        format of get_game_placements_delta_days (see get_games_placements_delta_days
+        for the array form this is built from).
         """
+        delta_days, placements = self.get_games_placements_delta_days(games_info, days_before_release)
+
         results = {}
-        
-        for game_info in games_info:
-            game_name = game_info['game_name']
-            release_date_str = game_info['release_date_str']
-            
-            # Use the new reusable function
-            game_data = self.get_game_placements_delta_days(game_name, release_date_str, days_before_release)
-            if game_data:
-                results[game_name] = game_data
-        
+        for game_name, game_placements in placements.items():
+            charted = ~np.isnan(game_placements)
+            results[game_name] = {
+                "delta_days": delta_days[charted].tolist(),
+                "avg_placements": game_placements[charted].tolist()
+            }
         return results
+
+    @cached_read('SteamTopGames', 'GameTranslation')
+    def get_games_placements_delta_days(self, games_info, days_before_release=90):
+        """
+        Batched form of get_game_placements_delta_days for comparison charts.
+
+        Resolves every game name with one GameTranslation query and reads all games'
+        daily harmonic mean placements with one DailyPlacementRollup query, each game
+        restricted to its own window of days_before_release days up to its release.
+        When a Steam RankCube is attached (see load_rank_cube) and holds every window,
+        the placements are sliced from the cube instead.
+
+        games_info: list of dicts with keys 'game_name' and 'release_date_str'
+        Returns (delta_days, placements): delta_days is an int array from
+        -days_before_release to 0 and placements maps each game name with data to a
+        float array aligned on it (NaN on days the game was not charted).
+        """
+        delta_days = np.arange(-days_before_release, 1)
+        if not games_info:
+            return delta_days, {}
+
+        names = [(index, game_info['game_name']) for index, game_info in enumerate(games_info)]
+        self.cursor.execute(f"""
+            WITH wanted(game_index, game_name) AS (VALUES {', '.join(['(?, ?)'] * len(names))})
+            SELECT wanted.game_index, GameTranslation.appid
+            FROM wanted
+            JOIN GameTranslation ON LOWER(GameTranslation.game_name) = LOWER(wanted.game_name)
+        """, [value for pair in names for value in pair])
+        appids = {}
+        for game_index, appid in self.cursor.fetchall():
+            appids.setdefault(game_index, appid)
+        if not appids:
+            return delta_days, {}
+
+        releases = {}
+        windows = []
+        for game_index, appid in appids.items():
+            release_date = datetime.strptime(games_info[game_index]['release_date_str'], '%Y-%m-%d')
+            releases[game_index] = release_date
+            start_date = (release_date - timedelta(days=days_before_release)).strftime('%Y-%m-%d')
+            windows.append((game_index, str(appid), start_date, release_date.strftime('%Y-%m-%d')))
+
+        cube = self.rank_cube('steam')
+        if cube is not None and all(start_date >= cube.start.strftime('%Y-%m-%d') for _, _, start_date, _ in windows):
+            _, aligned = cube.release_aligned(
+                [item_id for _, item_id, _, _ in windows], [end_date for _, _, _, end_date in windows],
+                days_before_release)
+            columns = {game_index: column for column, (game_index, _, _, _) in enumerate(windows)}
+            placements = {}
+            for game_index, game_info in enumerate(games_info):
+                if game_index in columns and not np.isnan(aligned[:, columns[game_index]]).all():
+                    placements[game_info['game_name']] = aligned[:, columns[game_index]]
+            return delta_days, placements
+
+        self.cursor.execute(f"""
+            WITH wanted(game_index, item_id, start_date, end_date) AS (VALUES {', '.join(['(?, ?, ?, ?)'] * len(windows))})
+            SELECT wanted.game_index,
+                   DailyPlacementRollup.date,
+                   DailyPlacementRollup.sample_count / DailyPlacementRollup.reciprocal_sum
+            FROM wanted
+            JOIN DailyPlacementRollup
+              ON DailyPlacementRollup.source = 'steam'
+             AND DailyPlacementRollup.item_id = wanted.item_id
+             AND DailyPlacementRollup.date >= wanted.start_date
+             AND DailyPlacementRollup.date <= wanted.end_date
+        """, [value for window in windows for value in window])
+
+        values = np.full((len(games_info), len(delta_days)), np.nan)
+        for game_index, date_label, harmonic_mean_place in self.cursor.fetchall():
+            delta = (datetime.strptime(date_label, '%Y-%m-%d') - releases[game_index]).days
+            values[game_index, delta + days_before_release] = harmonic_mean_place
+
+        placements = {}
+        for game_index, game_info in enumerate(games_info):
+            if game_index in appids and not np.isnan(values[game_index]).all():
+                placements[game_info['game_name']] = values[game_index]
+        return delta_days, placements
     
+    @cached_read('SteamTopGames', 'GameTranslation')
     def get_game_placements_delta_days(self, game_name, release_date_str, days_before_release=90):
         """
         Retrieves aggregated GTS placement data for a single game with delta days to release.
@@ -571,17 +2049,7 @@ class Database:
         start_date_str = start_date.strftime('%Y-%m-%d')
         end_date_str = end_date.strftime('%Y-%m-%d')
         
-        query = """
-            SELECT
-                substr(timestamp, 1, 10) AS date,
-                COUNT(place) / SUM(1.0 / place) AS harmonic_mean_place
-            FROM SteamTopGames
-            WHERE appid = ? AND substr(timestamp, 1, 10) >= ? AND substr(timestamp, 1, 10) <= ?
-            GROUP BY date
-            ORDER BY date ASC
-        """
-        self.cursor.execute(query, (appid, start_date_str, end_date_str))
-        rows = self.cursor.fetchall()
+        rows = self._get_daily_placements('steam', appid, start_date_str, end_date_str)
         
         if not rows:
             return None
@@ -589,7 +2057,7 @@ class Database:
         delta_days = []
         avg_placements = []
         
-        for date_label, harmonic_mean_place in rows:
+        for date_label, harmonic_mean_place, _, _, _ in rows:
             date_obj = datetime.strptime(date_label, '%Y-%m-%d')
             delta = (date_obj - release_date).days
             delta_days.append(delta)
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Query plan check and timing benchmark for the Database placement getters.
+
+Runs the getters behind `!gts <game>` / `!ps <game>` / `!ccu <game>` against a
+database (a synthetic one by default), captures the SQL they actually execute and
+verifies with EXPLAIN QUERY PLAN that none of it falls back to a full scan of the
+rank tables, DailyPlacementRollup, SteamCCU or RollingRankStats.
+
+Usage:
+    python db_benchmark.py                  # synthetic DB, 90 days of hourly ranks
+    python db_benchmark.py --days 365
+    python db_benchmark.py --db steam_top_games.db
+    python db_benchmark.py --compare-storage  # rows vs packed snapshots
+    python db_benchmark.py --cube             # RankCube vs SQL for multi-game analytics
+    python db_benchmark.py --suite --scales 30,180,365 --report benchmark.json
+                                              # every read method at several history sizes
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from database import Database, epoch_hour
+from rank_cube import RankCube
+
+CHECKED_TABLES = ('SteamTopGames', 'PSTopGames', 'DailyPlacementRollup', 'SteamCCU', 'RollingRankStats')
+FULL_SCAN_RE = re.compile(r'\bSCAN (?:TABLE )?(%s)\b' % '|'.join(CHECKED_TABLES))
+
+
+def synthetic_top_lists(days, ranks=500, churn=0.05, seed=42):
+    """
+    Yields (timestamp, appids) for `days` of hourly top lists ending now. Each hour a
+    `churn` fraction of the list is swapped for new titles and the rest is lightly
+    shuffled, which roughly matches how the real charts move. Ids start at 1 and
+    increase as new titles enter the chart.
+    """
+    rng = random.Random(seed)
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=days)
+    next_id = ranks + 1
+    current = list(range(1, ranks + 1))
+
+    for hour in range(days * 24):
+        ts = (start + timedelta(hours=hour)).strftime('%Y-%m-%d %H')
+        for i in range(len(current)):
+            if rng.random() < churn:
+                current[i] = next_id
+                next_id += 1
+        # Swap a few neighbours so ranks drift between hours.
+        for _ in range(ranks // 10):
+            i = rng.randrange(ranks - 1)
+            current[i], current[i + 1] = current[i + 1], current[i]
+        yield ts, list(current)
+
+
+def synthetic_steam_capture(ts, appids):
+    """Turns one synthetic top list into the game dicts update_steam_top_sellers produces."""
+    discounts = ('', '', '', '-10%', '-25%', '-50%', 'Free')
+    return [
+        {'timestamp': ts, 'count': place, 'appid': str(appid),
+         'discount': discounts[appid % len(discounts)], 'ccu': (appid * 7919) % 50000}
+        for place, appid in enumerate(appids, 1)
+    ]
+
+
+def populate_synthetic_ranks(db, days, ranks=500, churn=0.05, seed=42):
+    """
+    Fills SteamTopGames/PSTopGames (plus their translation tables, the daily rollup,
+    RollingRankStats and the snapshot catalog) with `days` of synthetic hourly top lists
+    (see synthetic_top_lists), and SteamCCU with an hourly count for every charted appid.
+    Returns the game names that are charted at the end of the period.
+    """
+    next_id = 1
+    current = []
+    for ts, current in synthetic_top_lists(days, ranks, churn, seed):
+        next_id = max(next_id, max(current) + 1)
+        steam_rows = [(ts, place, str(appid), '', 0) for place, appid in enumerate(current, 1)]
+        ps_rows = [(ts, place, str(appid)) for place, appid in enumerate(current[:100], 1)]
+        db.cursor.executemany(
+            "INSERT INTO SteamTopGames (timestamp, place, appid, discount, ccu) VALUES (?, ?, ?, ?, ?)",
+            steam_rows)
+        db.cursor.executemany(
+            "INSERT INTO PSTopGames (timestamp, place, ps_id, discount) VALUES (?, ?, ?, '')",
+            ps_rows)
+        hour = epoch_hour(ts)
+        db.cursor.executemany(
+            "INSERT INTO SteamCCU (appid, hour, ccu) VALUES (?, ?, ?)",
+            [(appid, hour, (appid * 7919 + hour * 31) % 50000) for appid in current])
+
+    db.cursor.executemany(
+        "INSERT OR IGNORE INTO GameTranslation (appid, game_name) VALUES (?, ?)",
+        [(str(i), f"Synthetic Game {i}") for i in range(1, next_id)])
+    db.cursor.executemany(
+        "INSERT OR IGNORE INTO PSGameTranslation (ps_id, game_name) VALUES (?, ?)",
+        [(i, f"Synthetic Game {i}") for i in range(1, next_id)])
+    db.conn.commit()
+    db.backfill_daily_rollup()
+    db.backfill_rolling_rank_stats()
+    db.backfill_snapshot_catalog()
+    return [f"Synthetic Game {appid}" for appid in current[:10]]
+
+
+def synthetic_fi_history(days, companies=234, updates_per_day=60, holders_per_day=8, funds=60, seed=42):
+    """
+    Yields (date, short_positions, position_holders) DataFrames per day, shaped like the
+    exported ShortPositions_*.csv / PositionHolders_*.csv: about 60 short position
+    updates a day spread over the day ('YYYY-MM-DD HH:MM'), skewed towards a few
+    heavily shorted companies, each a small random-walk step, and a handful of holder
+    disclosures.
+    """
+    rng = random.Random(seed)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    names = [f"Synthetic Company {i} AB" for i in range(companies)]
+    leis = [f"5493{i:016d}" for i in range(companies)]
+    isins = [f"SE{i:010d}" for i in range(companies)]
+    fund_names = [f"Synthetic Fund {i} LP" for i in range(funds)]
+    weights = [1 / (rank + 1) for rank in range(companies)]
+    positions = [rng.uniform(0.5, 8.0) for _ in range(companies)]
+
+    for day in range(days):
+        date = start + timedelta(days=day)
+        shorts = []
+        for minute in sorted(rng.randrange(24 * 60) for _ in range(updates_per_day)):
+            i = rng.choices(range(companies), weights)[0]
+            positions[i] = round(min(max(positions[i] + rng.gauss(0, 0.15), 0.5), 15.0), 2)
+            shorts.append({
+                'timestamp': (date + timedelta(minutes=minute)).strftime('%Y-%m-%d %H:%M'),
+                'company_name': names[i], 'lei': leis[i], 'position_percent': positions[i],
+                'latest_position_date': (date - timedelta(days=1)).strftime('%Y-%m-%d'),
+            })
+        holders = []
+        for minute in sorted(rng.randrange(8 * 60, 18 * 60) for _ in range(holders_per_day)):
+            i = rng.choices(range(companies), weights)[0]
+            holders.append({
+                'entity_name': rng.choice(fund_names), 'issuer_name': names[i], 'isin': isins[i],
+                'position_percent': round(rng.uniform(0.5, 3.0), 2),
+                'position_date': (date - timedelta(days=1)).strftime('%Y-%m-%d'),
+                'timestamp': (date + timedelta(minutes=minute)).strftime('%Y-%m-%d %H:%M'),
+            })
+        yield date.strftime('%Y-%m-%d'), pd.DataFrame(shorts), pd.DataFrame(holders)
+
+
+def populate_synthetic_fi(db, days, seed=42):
+    """
+    Writes `days` of synthetic FI history through insert_bulk_data (so the company
+    tables and the snapshot catalog are maintained as in production). Returns the name
+    of the most frequently reported company.
+    """
+    counts = {}
+    for _, shorts, holders in synthetic_fi_history(days, seed=seed):
+        db.insert_bulk_data(shorts, 'ShortPositions')
+        db.insert_bulk_data(holders, 'PositionHolders')
+        for name in shorts['company_name']:
+            counts[name] = counts.get(name, 0) + 1
+    return max(counts, key=counts.get)
+
+
+def placement_calls(db, game_name):
+    """Returns (label, callable) pairs for the read paths this benchmark covers."""
+    latest = db.get_latest_timestamp('SteamTopGames')
+    release = datetime.now().strftime('%Y-%m-%d')
+    top_appids = [appid for _, appid in db.get_capture(latest)[:25]]
+    return [
+        ('get_gts_placements', lambda: db.get_gts_placements(game_name)),
+        ('get_gts_placements_with_minmax', lambda: db.get_gts_placements_with_minmax(game_name)),
+        ('get_last_month_ps_placements', lambda: db.get_last_month_ps_placements(game_name)),
+        ('get_game_placements_delta_days', lambda: db.get_game_placements_delta_days(game_name, release, 90)),
+        ('get_games_placements_delta_days', lambda: db.get_games_placements_delta_days(
+            [{'game_name': game_name, 'release_date_str': release}], 90)),
+        ('get_yesterday_top_games(Steam)', lambda: db.get_yesterday_top_games(latest)),
+        ('get_yesterday_top_games(PS)', lambda: db.get_yesterday_top_games(latest, table='PSTopGames')),
+        ('get_ccu_summary', lambda: db.get_ccu_summary(game_name)),
+        ('get_rolling_rank_stats', lambda: db.get_rolling_rank_stats('steam', top_appids)),
+    ]
+
+
+def check_query_plans(db, game_name):
+    """
+    Executes every covered getter with SQL tracing enabled and runs EXPLAIN QUERY PLAN on
+    each traced statement. Returns a list of (label, sql, plan_detail) tuples for every
+    statement that performs a full scan of one of CHECKED_TABLES; an empty list means all good.
+    """
+    problems = []
+    for label, call in placement_calls(db, game_name):
+        statements = []
+        db.conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            db.conn.set_trace_callback(None)
+
+        for sql in statements:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = db.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            for row in plan:
+                if FULL_SCAN_RE.search(row[-1]):
+                    problems.append((label, ' '.join(sql.split()), row[-1]))
+    return problems
+
+
+def read_method_calls(db, game_name, company_name):
+    """
+    Returns (label, callable) pairs for every Database read method that applies to
+    row storage, plus the fi_blankning.create_timeseries read and resample (with
+    callable None when its dependencies are not installed). Snapshot-only getters are covered by --compare-storage.
+    """
+    latest = db.get_latest_timestamp('SteamTopGames')
+    latest_ps = db.get_latest_timestamp('PSTopGames')
+    release = datetime.now().strftime('%Y-%m-%d')
+    games_info = [{'game_name': game_name, 'release_date_str': release}]
+    top_appids = [appid for _, appid in db.get_capture(latest)[:25]]
+    company = db.find_company(company_name)
+    lei = company['lei']
+    start_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
+
+    calls = placement_calls(db, game_name) + [
+        ('get_gts_placements_with_minmax_delta_days',
+         lambda: db.get_gts_placements_with_minmax_delta_days(game_name, release)),
+        ('get_multiple_games_placements_delta_days', lambda: db.get_multiple_games_placements_delta_days(games_info)),
+        ('get_last_week_ranks', lambda: db.get_last_week_ranks(latest, top_appids)),
+        ('get_capture(Steam)', lambda: db.get_capture(latest)),
+        ('get_capture(PS)', lambda: db.get_capture(latest_ps, 'PSTopGames')),
+        ('get_latest_timestamp', lambda: db.get_latest_timestamp('SteamTopGames')),
+        ('get_latest_timestamp_on', lambda: db.get_latest_timestamp_on('PSTopGames', latest_ps[:10])),
+        ('get_timestamp_days_ago', lambda: db.get_timestamp_days_ago('SteamTopGames', 7)),
+        ('match_game_name(Steam)', lambda: db.match_game_name('steam', game_name.lower())),
+        ('match_game_name(Steam, fuzzy)', lambda: db.match_game_name('steam', game_name[:-1] + 'x')),
+        ('match_game_name(PS)', lambda: db.match_game_name('ps', game_name, fuzzy=False)),
+        ('find_company', lambda: db.find_company(company_name[:12])),
+        ('fetch_current_short_position', lambda: db.fetch_current_short_position(company_name)),
+        ('fetch_historical_short_positions', lambda: db.fetch_historical_short_positions(company_name)),
+        ('get_short_position_history', lambda: db.get_short_position_history(lei, start_date)),
+        ('get_company_holders', lambda: db.get_company_holders(lei)),
+    ]
+    try:
+        from fi_blankning import daily_timeseries
+    except ImportError:
+        calls.append(('fi_blankning.create_timeseries', None))
+    else:
+        calls.append(('fi_blankning.create_timeseries',
+                      lambda: daily_timeseries(db.get_short_position_history(lei, start_date))))
+    return calls
+
+
+def _time_call(call, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'best_ms': min(samples), 'median_ms': statistics.median(samples)}
+
+
+def run_suite(scales, repeat=20, ranks=500):
+    """
+    Builds one synthetic database per scale (days of rank and FI history), times every
+    read method on it and returns a JSON-serializable report. Entries are keyed by
+    scale and method label, so reports from different runs can be diffed directly;
+    methods that could not run are reported as null.
+    """
+    report = {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'parameters': {'ranks': ranks, 'repeat': repeat},
+        'scales': {},
+    }
+    for days in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            with Database(os.path.join(tmp, f'suite_{days}.db'), cache_results=False) as db:
+                db.create_tables()
+                start = time.perf_counter()
+                charted = populate_synthetic_ranks(db, days, ranks)
+                company_name = populate_synthetic_fi(db, days)
+                populate_s = time.perf_counter() - start
+
+                row_counts = {
+                    table: db.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ('SteamTopGames', 'PSTopGames', 'ShortPositions', 'PositionHolders')
+                }
+                methods = {}
+                for label, call in read_method_calls(db, charted[0], company_name):
+                    methods[label] = _time_call(call, repeat) if call else None
+                report['scales'][str(days)] = {
+                    'days': days,
+                    'populate_s': populate_s,
+                    'file_bytes': os.path.getsize(db.db_name),
+                    'rows': row_counts,
+                    'full_scans': len(check_query_plans(db, charted[0])),
+                    'methods': methods,
+                }
+    return report
+
+
+def time_queries(db, game_name, repeat=20):
+    """Times each covered getter and returns {label: best_ms}."""
+    timings = {}
+    for label, call in placement_calls(db, game_name):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best * 1000
+    return timings
+
+
+def table_sizes(db):
+    """Returns {table or index name: bytes on disk}, or {} if dbstat is unavailable."""
+    try:
+        rows = db.conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return dict(rows)
+
+
+def compare_snapshot_storage(days, codecs=('raw', 'zlib'), repeat=20):
+    """
+    Writes the same synthetic Steam history through insert_bulk_data once as rows and
+    once per snapshot codec, then reports storage size of the rank data and the speed
+    of get_yesterday_top_games / get_last_week_ranks against their snapshot equivalents.
+    """
+    captures = [synthetic_steam_capture(ts, appids) for ts, appids in synthetic_top_lists(days)]
+    latest = captures[-1][0]['timestamp']
+    top_appids = [game['appid'] for game in captures[-1][:25]]
+    report = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        layouts = [('rows', 'rows', 'raw')] + [(f'snapshots/{codec}', 'snapshots', codec) for codec in codecs]
+        for label, storage, codec in layouts:
+            with Database(os.path.join(tmp, f"{storage}_{codec}.db"), rank_storage=storage, snapshot_codec=codec,
+                          cache_results=False) as db:
+                db.create_tables()
+                start = time.perf_counter()
+                for capture in captures:
+                    db.insert_bulk_data(capture)
+                write_s = time.perf_counter() - start
+
+                sizes = table_sizes(db)
+                if storage == 'rows':
+                    names = ('SteamTopGames', 'idx_steamtopgames_appid_timestamp', 'idx_steamtopgames_timestamp')
+                    yesterday = lambda: db.get_yesterday_top_games(latest)
+                    last_week = lambda: db.get_last_week_ranks(latest, top_appids)
+                else:
+                    names = ('RankSnapshots', 'sqlite_autoindex_RankSnapshots_1')
+                    yesterday = lambda: db.get_yesterday_top_games_from_snapshots(latest)
+                    last_week = lambda: db.get_last_week_ranks_from_snapshots(latest, top_appids)
+
+                timings = {}
+                for name, call in (('yesterday_top_games', yesterday), ('last_week_ranks', last_week)):
+                    best = float('inf')
+                    for _ in range(repeat):
+                        t0 = time.perf_counter()
+                        call()
+                        best = min(best, time.perf_counter() - t0)
+                    timings[name] = best * 1000
+
+                report[label] = {
+                    'bytes': sum(sizes.get(name, 0) for name in names),
+                    'write_ms_per_capture': write_s / len(captures) * 1000,
+                    **{f'{name}_ms': ms for name, ms in timings.items()},
+                }
+    return report
+
+
+def compare_rank_cube(db, game_names, repeat=20):
+    """
+    Times release-aligned daily placements for several games through the SQL getter
+    (get_multiple_games_placements_delta_days) and through a RankCube loaded from db.
+    Returns {label: ms}.
+    """
+    release = datetime.now().strftime('%Y-%m-%d')
+    games_info = [{'game_name': name, 'release_date_str': release} for name in game_names]
+    placeholders = ','.join('?' * len(game_names))
+    appids = [appid for appid, in db.conn.execute(
+        f"SELECT appid FROM GameTranslation WHERE game_name IN ({placeholders})", game_names)]
+
+    start = time.perf_counter()
+    cube = RankCube.load(db, 'steam')
+    timings = {'RankCube.load': (time.perf_counter() - start) * 1000}
+
+    calls = (
+        ('get_multiple_games_placements_delta_days', lambda: db.get_multiple_games_placements_delta_days(games_info)),
+        ('RankCube.release_aligned', lambda: cube.release_aligned(appids, [release] * len(appids))),
+        ('RankCube.daily_stats', lambda: cube.daily_stats(appids)),
+        ('RankCube.rolling_mean(7d)', lambda: cube.rolling_mean(appids)),
+    )
+    for label, call in calls:
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            call()
+            best = min(best, time.perf_counter() - t0)
+        timings[label] = best * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Existing database to check (default: build a synthetic one)')
+    parser.add_argument('--game', help='Game name to query (default: a charted synthetic game)')
+    parser.add_argument('--days', type=int, default=90, help='Days of synthetic history')
+    parser.add_argument('--repeat', type=int, default=20, help='Timing repetitions per query')
+    parser.add_argument('--compare-storage', action='store_true',
+                        help='Compare row-per-rank and packed snapshot storage instead')
+    parser.add_argument('--cube', action='store_true',
+                        help='Also time multi-game analytics through a RankCube')
+    parser.add_argument('--suite', action='store_true',
+                        help='Time every read method on synthetic databases of several sizes')
+    parser.add_argument('--scales', default='30,180,365', help='Days of history per suite database')
+    parser.add_argument('--report', help='Write the suite results to this JSON file')
+    args = parser.parse_args()
+
+    if args.suite:
+        scales = [int(days) for days in args.scales.split(',')]
+        report = run_suite(scales, args.repeat)
+        for days, result in report['scales'].items():
+            print(f"\n{days} days ({result['rows']['SteamTopGames']} Steam rows, "
+                  f"{result['file_bytes'] / 2**20:.0f} MiB, {result['full_scans']} full scans), best / median:")
+            for label, timing in result['methods'].items():
+                if timing is None:
+                    print(f"  {label:<42} skipped (missing dependency)")
+                    continue
+                print(f"  {label:<42} {timing['best_ms']:8.2f} ms {timing['median_ms']:8.2f} ms")
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport written to {args.report}")
+        return
+
+    if args.compare_storage:
+        print(f"Comparing rank storage layouts over {args.days} days of hourly Steam captures...")
+        report = compare_snapshot_storage(args.days, repeat=args.repeat)
+        print(f"  {'layout':<16} {'size (MiB)':>10} {'write/cap':>10} {'yesterday':>10} {'last week':>10}")
+        for label, stats in report.items():
+            print(f"  {label:<16} {stats['bytes'] / 2**20:10.2f} {stats['write_ms_per_capture']:8.2f}ms "
+                  f"{stats['yesterday_top_games_ms']:8.2f}ms {stats['last_week_ranks_ms']:8.2f}ms")
+        return
+
+    tmp_dir = None
+    if args.db:
+        db_path = args.db
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp_dir.name, 'benchmark.db')
+
+    try:
+        # Timings measure SQLite, not the result cache.
+        with Database(db_path, cache_results=False) as db:
+            db.create_tables()
+            game_name = args.game
+            charted = []
+            if not args.db:
+                print(f"Generating {args.days} days of synthetic rank history...")
+                charted = populate_synthetic_ranks(db, args.days)
+                game_name = game_name or charted[0]
+            if not game_name:
+                raise SystemExit('--game is required when checking an existing database')
+
+            problems = check_query_plans(db, game_name)
+            if problems:
+                print("Full table scans found:")
+                for label, sql, detail in problems:
+                    print(f"  {label}: {detail}\n    {sql}")
+            else:
+                print(f"Query plans OK: no full scans of {', '.join(CHECKED_TABLES)}.")
+
+            print(f"\nTimings for '{game_name}' (best of {args.repeat}):")
+            for label, ms in time_queries(db, game_name, args.repeat).items():
+                print(f"  {label:<36} {ms:8.2f} ms")
+
+            if args.cube and charted:
+                print(f"\nMulti-game analytics for the {len(charted)} top charted games (best of {args.repeat}):")
+                for label, ms in compare_rank_cube(db, charted, args.repeat).items():
+                    print(f"  {label:<42} {ms:8.2f} ms")
+    finally:
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
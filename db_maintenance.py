@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Scheduled maintenance for steam_top_games.db.
+
+The file takes append-only writes around the clock and retention.py deletes old
+history every night, which leaves free pages behind and lets the planner statistics
+drift. Every night, after retention, daily_maintenance_task runs a pass in a worker
+thread on a connection of its own, so the bot's event loop keeps serving while it:
+
+  * rebuilds the file once if its layout differs from TARGET_PAGE_SIZE /
+    incremental auto-vacuum (VACUUM is the only way to change either). This needs
+    the file to itself, so while the bot runs it is postponed and logged; run
+    `db_maintenance.py rebuild` with the bot stopped,
+  * refreshes planner statistics with PRAGMA optimize (a full ANALYZE the first
+    time, when sqlite_stat1 does not exist yet),
+  * returns free pages to the file system with PRAGMA incremental_vacuum,
+  * checkpoints the WAL,
+  * repairs the Snapshots catalog and daily rollup of the unsealed rank shards where
+    a crash left them out of step with the shard rows, then seals the shards of
+    months that have ended (see rank_shards.py),
+  * logs the size, free space and fragmentation of the largest tables and indexes.
+
+Connection-level tuning (cache_size, mmap_size) is applied by Database itself, see
+CONNECTION_PRAGMAS in database.py.
+
+Usage:
+    python db_maintenance.py stats --db steam_top_games.db
+    python db_maintenance.py run --db steam_top_games.db
+    python db_maintenance.py rebuild --db steam_top_games.db    # with the bot stopped
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from database import Database
+from general_utils import log_message, get_seconds_until
+
+TARGET_PAGE_SIZE = 8192
+AUTO_VACUUM_INCREMENTAL = 2
+# Free pages are only given back once they make up this share of the file
+VACUUM_FREE_RATIO = 0.05
+ANALYSIS_LIMIT = 1000
+LOGGED_OBJECTS = 10
+
+
+def file_layout(db):
+    """Returns {'page_size', 'auto_vacuum', 'page_count', 'freelist_count', 'journal_mode'}."""
+    return {
+        pragma: db.conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        for pragma in ('page_size', 'auto_vacuum', 'page_count', 'freelist_count', 'journal_mode')
+    }
+
+
+def needs_rebuild(db, page_size=TARGET_PAGE_SIZE):
+    layout = file_layout(db)
+    return layout['page_size'] != page_size or layout['auto_vacuum'] != AUTO_VACUUM_INCREMENTAL
+
+
+def rebuild(db, page_size=TARGET_PAGE_SIZE):
+    """
+    Rewrites the file with the target page size and incremental auto-vacuum. A WAL
+    database is switched to a rollback journal for the VACUUM (page_size cannot change
+    in WAL mode) and back afterwards. Needs exclusive access to the file; raises
+    sqlite3.OperationalError if another connection holds it. Returns the elapsed seconds.
+    """
+    start = time.perf_counter()
+    db.conn.commit()
+    journal_mode = db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode == 'wal':
+        db.conn.execute("PRAGMA journal_mode = DELETE")
+    try:
+        db.conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        db.conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        db.conn.execute("VACUUM")
+    finally:
+        if journal_mode == 'wal':
+            db.conn.execute("PRAGMA journal_mode = WAL")
+    return time.perf_counter() - start
+
+
+def analyze(db):
+    """Refreshes planner statistics; returns 'analyze' or 'optimize' depending on what ran."""
+    has_stats = db.conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+    if not has_stats:
+        db.conn.execute("ANALYZE")
+        db.conn.commit()
+        return 'analyze'
+    db.conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    db.conn.execute("PRAGMA optimize")
+    db.conn.commit()
+    return 'optimize'
+
+
+def incremental_vacuum(db, free_ratio=VACUUM_FREE_RATIO):
+    """Releases free pages once they exceed free_ratio of the file. Returns the pages released."""
+    layout = file_layout(db)
+    if layout['auto_vacuum'] != AUTO_VACUUM_INCREMENTAL or not layout['page_count']:
+        return 0
+    if layout['freelist_count'] / layout['page_count'] < free_ratio:
+        return 0
+    # executescript steps the pragma to completion; execute() frees a single page.
+    db.conn.executescript("PRAGMA incremental_vacuum;")
+    return layout['freelist_count'] - file_layout(db)['freelist_count']
+
+
+def object_stats(db):
+    """
+    Returns [{'name', 'bytes', 'pages', 'unused_ratio', 'fragmentation'}, ...] for every
+    table and index, largest first. fragmentation is the share of pages, in b-tree
+    order, that do not directly follow the previous page in the file. Returns [] if
+    the dbstat virtual table is not compiled in.
+    """
+    try:
+        rows = db.conn.execute(
+            "SELECT name, pageno, pgsize, unused FROM dbstat ORDER BY name, path").fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+    stats = {}
+    previous = {}
+    for name, pageno, pgsize, unused in rows:
+        entry = stats.setdefault(name, {'name': name, 'bytes': 0, 'pages': 0, 'unused': 0, 'jumps': 0})
+        entry['bytes'] += pgsize
+        entry['pages'] += 1
+        entry['unused'] += unused
+        if name in previous and pageno != previous[name] + 1:
+            entry['jumps'] += 1
+        previous[name] = pageno
+
+    report = []
+    for entry in stats.values():
+        report.append({
+            'name': entry['name'],
+            'bytes': entry['bytes'],
+            'pages': entry['pages'],
+            'unused_ratio': entry['unused'] / entry['bytes'] if entry['bytes'] else 0.0,
+            'fragmentation': entry['jumps'] / (entry['pages'] - 1) if entry['pages'] > 1 else 0.0,
+        })
+    return sorted(report, key=lambda entry: entry['bytes'], reverse=True)
+
+
+def log_stats(db, limit=LOGGED_OBJECTS):
+    layout = file_layout(db)
+    size = layout['page_count'] * layout['page_size']
+    free = layout['freelist_count'] / layout['page_count'] if layout['page_count'] else 0.0
+    log_message(f"Database file: {size / 2**20:.1f} MiB, page size {layout['page_size']}, "
+                f"{free:.1%} free pages, journal {layout['journal_mode']}.")
+    for entry in object_stats(db)[:limit]:
+        log_message(f"  {entry['name']}: {entry['bytes'] / 2**20:.1f} MiB, "
+                    f"{entry['unused_ratio']:.0%} unused, {entry['fragmentation']:.0%} fragmented")
+
+
+def run_maintenance(db, page_size=TARGET_PAGE_SIZE):
+    """
+    One maintenance pass: rebuild if the layout is off (skipped while other connections
+    hold the file), rank shard repair and sealing, statistics, incremental vacuum and
+    a WAL checkpoint.
+    Returns a summary dict.
+    """
+    summary = {'rebuilt_s': None, 'rebuild_error': None}
+    if needs_rebuild(db, page_size):
+        try:
+            summary['rebuilt_s'] = rebuild(db, page_size)
+        except sqlite3.OperationalError as e:
+            # Retried on the next run.
+            summary['rebuild_error'] = str(e)
+    if db.rank_shards is not None:
+        summary['shard_timestamps_repaired'] = db.reconcile_rank_shards()
+        summary['shards_sealed'] = db.rank_shards.seal()
+    summary['statistics'] = analyze(db)
+    summary['pages_released'] = incremental_vacuum(db)
+    if file_layout(db)['journal_mode'] == 'wal':
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return summary
+
+
+def maintenance_pass(db_name, page_size=TARGET_PAGE_SIZE, rank_shards=None):
+    """
+    run_maintenance and log_stats on a Database connection of its own, for a worker
+    thread. Returns the run_maintenance summary.
+    """
+    with Database(db_name, rank_shards=rank_shards) as db:
+        summary = run_maintenance(db, page_size)
+        if summary['rebuilt_s'] is not None:
+            log_message(f"Rebuilt the database with {page_size}-byte pages in {summary['rebuilt_s']:.1f} s.")
+        if summary['rebuild_error']:
+            log_message(f"Database rebuild postponed ({summary['rebuild_error']}); "
+                        "run `python db_maintenance.py rebuild` with the bot stopped.")
+        log_message(f"Database maintenance: {summary['statistics']}, "
+                    f"{summary['pages_released']} free pages released.")
+        if summary.get('shard_timestamps_repaired'):
+            log_message(f"Repaired the catalog and rollup of {summary['shard_timestamps_repaired']} "
+                        "rank shard captures.")
+        if summary.get('shards_sealed'):
+            log_message(f"Sealed rank shards: {', '.join(summary['shards_sealed'])}.")
+        log_stats(db)
+    return summary
+
+
+async def daily_maintenance_task(db, page_size=TARGET_PAGE_SIZE):
+    """
+    Runs maintenance_pass every night at 04:30, after the retention job. VACUUM, the
+    first ANALYZE and the dbstat scan can take minutes on a large file, so the pass
+    runs in a worker thread on a connection of its own; `db` is the bot's AsyncDatabase.
+    """
+    shard_dir = db.db_options.get('rank_shards')
+    while True:
+        next_run = datetime.now() + timedelta(seconds=get_seconds_until(4, 30))
+        log_message(f'Waiting until {next_run.strftime("%Y-%m-%d %H:%M")} to run database maintenance.')
+        await asyncio.sleep(get_seconds_until(4, 30))
+
+        try:
+            # The pass can only seal shards that the bot's writer has let go of
+            await db.release_rank_shards()
+            await asyncio.to_thread(maintenance_pass, db.db_name, page_size, shard_dir)
+        except Exception as e:
+            log_message(f'Database maintenance failed: {type(e).__name__}: {e}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('stats', 'run', 'rebuild'))
+    parser.add_argument('--db', default='steam_top_games.db', help='Database file')
+    parser.add_argument('--page-size', type=int, default=TARGET_PAGE_SIZE, help='Target page size in bytes')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f'Database file not found: {args.db}')
+
+    with Database(args.db) as db:
+        if args.command == 'rebuild':
+            print(f'Rebuilt in {rebuild(db, args.page_size):.1f} s.')
+        elif args.command == 'run':
+            print(run_maintenance(db, args.page_size))
+        log_stats(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -199,7 +199,7 @@ async def update_position_holders(old_data, new_data, db, fetched_timestamp):
     if old_data.empty:
         # Insert new data into the database because there's no old data.
         new_data['timestamp'] = fetched_timestamp
-        db.insert_bulk_data(input=new_data, table='PositionHolders')
+        await db.insert_bulk_data(input=new_data, table='PositionHolders')
         return
     
     if not new_data.empty:
@@ -237,14 +237,14 @@ async def update_position_holders(old_data, new_data, db, fetched_timestamp):
     changed_positions['timestamp'] = fetched_timestamp
     new_rows = pd.concat([new_positions, changed_positions, dropped_positions])
 
-    db.insert_bulk_data(input=new_rows, table='PositionHolders')
+    await db.insert_bulk_data(input=new_rows, table='PositionHolders')
     return new_rows
 
 async def update_database_diff(old_data, new_data, db, fetched_timestamp):
 
     if old_data.empty:
         new_data['timestamp'] = fetched_timestamp
-        db.insert_bulk_data(input=new_data, table='ShortPositions')
+        await db.insert_bulk_data(input=new_data, table='ShortPositions')
         return
     
     if not new_data.empty:
@@ -268,7 +268,7 @@ async def update_database_diff(old_data, new_data, db, fetched_timestamp):
     new_rows = pd.concat([new_leis, changed_positions])
 
     # Insert new and updated records
-    db.insert_bulk_data(input=new_rows, table='ShortPositions')
+    await db.insert_bulk_data(input=new_rows, table='ShortPositions')
     return new_rows
 
 async def is_timestamp_updated(session):
@@ -360,8 +360,8 @@ async def update_fi_from_web(db, bot):
                 new_data_agg = await read_aggregate_data(FILE_PATHS['DATA_AGG'], bot)
                 new_data_act = await read_current_data(FILE_PATHS['DATA_ACT'])
 
-                old_data_agg = pd.read_sql('SELECT * FROM ShortPositions', db.conn)
-                old_data_act = pd.read_sql('SELECT * FROM PositionHolders', db.conn)
+                old_data_agg = await db.read_frame('SELECT * FROM ShortPositions')
+                old_data_act = await db.read_frame('SELECT * FROM PositionHolders')
                 
                 await send_embed(old_data_agg, new_data_agg, old_data_act, new_data_act, db, web_timestamp, bot)
                 
@@ -378,7 +378,7 @@ async def manual_update(db, bot):
         await download_file(session,URLS['DATA_AGG'], FILE_PATHS['DATA'])
         try:
             new_data = await read_aggregate_data(FILE_PATHS['DATA_AGG'],bot)
-            old_data = pd.read_sql('SELECT * FROM ShortPositions', db.conn)
+            old_data = await db.read_frame('SELECT * FROM ShortPositions')
 
             update_database_diff(old_data, new_data, db)
 
@@ -387,46 +387,15 @@ async def manual_update(db, bot):
             await report_error_to_channel(e)
 
 
-async def execute_query(db, query):
-    return db.cursor.execute(query).fetchone()
-
-def create_query(company_name, date, is_exact_date=True):
-    if is_exact_date:
-        date_condition = f"date(timestamp) = date('{date}')"
-    else:
-        date_condition = f"date(timestamp) <= date('{date}')"
-
-    return f"""
-        SELECT company_name, position_percent, timestamp
-        FROM ShortPositions
-        WHERE LOWER(company_name) LIKE '%{company_name}%'
-        AND {date_condition}
-        ORDER BY timestamp DESC
-        LIMIT 1
-        """
-        
-async def create_timeseries(db, company_name):
-    # Get the current date
-    now = datetime.now()
-
+async def create_timeseries(db, lei):
     # Calculate the date 3 months ago
     three_months_ago = pd.Timestamp.now() - pd.DateOffset(months=3)
 
-    # Query the database to get the data for the last 3 months
-    query = f"""
-        SELECT timestamp, position_percent
-        FROM ShortPositions
-        WHERE company_name LIKE '{company_name}'
-        AND timestamp >= (
-            SELECT MAX(timestamp) 
-            FROM ShortPositions 
-            WHERE timestamp <= '{three_months_ago.strftime("%Y-%m-%d %H:%M")}'
-        )
-        AND timestamp <= '{now.strftime("%Y-%m-%d %H:%M")}'
-        ORDER BY timestamp
-        """
-    data = pd.read_sql_query(query, db.conn)
+    # Query the database to get the data for the last 3 months (cached until the next FI update)
+    data = await db.get_short_position_history(lei, three_months_ago.strftime("%Y-%m-%d"))
+    return daily_timeseries(data)
 
+def daily_timeseries(data):
     # Convert the timestamp column to datetime
     data['timestamp'] = pd.to_datetime(data['timestamp'])
 
@@ -447,22 +416,16 @@ async def short_command(ctx, db, company_name):
     company_name = company_name.lower()
     now = datetime.now()
     
-    query = f"""
-        SELECT company_name
-        FROM ShortPositions
-        WHERE company_name LIKE '%{company_name}%'
-        LIMIT 1
-        """
-    
     # If the company name is not found in the database, return None to indicate that the company is not tracked
-    if not await execute_query(db, query):
+    company = await db.find_company(company_name)
+    if not company:
         await ctx.send(f'Kan inte hitta någon blankning för {company_name}.')
         return None
     else:
-        company_name = (await execute_query(db, query))[0]
+        company_name = company['name']
 
 
-    daily_data = await create_timeseries(db, company_name)
+    daily_data = await create_timeseries(db, company['lei'])
     image_stream = await plot_timeseries(daily_data, company_name)
     
     # Daily_data can be empty
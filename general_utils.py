@@ -10,6 +10,9 @@ import matplotlib.dates as mdates
 from matplotlib import rcParams
 import io
 
+# Re-exported: name normalization lives with the name index
+from name_index import normalize_game_name_for_search
+
 def log_message(message):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f'[LOG] {timestamp} - {message}')
@@ -76,34 +79,6 @@ def aiohttp_retry(retries=5, base_delay=15.0, max_delay=120.0):
         return wrapper
     return decorator
 
-def normalize_game_name_for_search(text: str) -> str:
-    text = text.lower()
-
-    # Define Roman numeral replacements in order to avoid conflicts (e.g., IX before X, VIII before V)
-    # Using r'\broman\b' for word boundaries.
-    roman_map = [
-        (r'\bviii\b', '8'), # VIII before V, VII, II, I
-        (r'\bvii\b', '7'),  # VII before V, II, I
-        (r'\bvi\b', '6'),   # VI before V, I
-        (r'\bix\b', '9'),   # IX before X, I
-        (r'\biv\b', '4'),   # IV before V, I
-        (r'\bx\b', '10'),   # X after IX
-        (r'\bv\b', '5'),    # V after VIII, VII, VI, IV
-        (r'\biii\b', '3'), # III before II, I
-        (r'\bii\b', '2'),  # II before I
-    ]
-
-    for pattern, replacement in roman_map:
-        text = re.sub(pattern, replacement, text) # Corrected: No longer need to replace \\b
-
-    # Hyphens → spaces
-    text = text.replace('-', ' ')
-    # Remove specified punctuation
-    text = re.sub(r"[:!?'®™©]", "", text)
-    # Collapse multiple spaces to a single space and strip leading/trailing spaces
-    text = re.sub(r'\\s+', ' ', text).strip() # Correcting \\s+ to \s+
-    return text
-
 def generate_gts_placements_plot(aggregated_data, game_name, is_steam=True):
     """
     Generates a plot showing the last month's GTS placements for a specific game.
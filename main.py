@@ -9,26 +9,50 @@ import pytz
 from dotenv import load_dotenv
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-
-# Create an instance of the Database class
-from database import Database
-db = Database('steam_top_games.db')
+# Optional local analytics API (analytics_api.py), off unless a port is set
+ANALYTICS_API_PORT = os.getenv('ANALYTICS_API_PORT')
+ANALYTICS_API_HOST = os.getenv('ANALYTICS_API_HOST', '127.0.0.1')
+# Optional monthly rank shards (rank_shards.py), off unless a directory is set
+RANK_SHARD_DIR = os.getenv('RANK_SHARD_DIR')
+# Days of Steam rank history held in memory for analytics (rank_cube.py); 0 turns it off
+RANK_CUBE_DAYS = int(os.getenv('RANK_CUBE_DAYS', '120'))
+
+# Database access for the bot: writes go through one writer thread, reads through a
+# pool of read-only connections, so SQLite never runs on the event loop
+from async_database import AsyncDatabase
+db = AsyncDatabase('steam_top_games.db', rank_shards=RANK_SHARD_DIR)
 
 # Initialize the bot
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents = intents)
 
-# Create tables
-#loop = asyncio.get_event_loop()
-#loop.run_until_complete(db.create_tables())
-db.create_tables()
+# Start the database and create tables before the bot connects
+from datetime import datetime, timedelta
+from general_utils import log_message
+
+async def load_rank_cube():
+    # Queued on the writer thread; analytics use SQL until the cube is attached
+    start_date = (datetime.now() - timedelta(days=RANK_CUBE_DAYS)).strftime('%Y-%m-%d')
+    cube = await db.load_rank_cube('steam', start_date)
+    log_message(f'Loaded the Steam rank cube from {start_date}: {cube.hour_count} hours, {len(cube.ids)} appids.')
+
+async def setup_hook():
+    await db.start()
+    await db.create_tables()
+    if RANK_CUBE_DAYS > 0:
+        bot.loop.create_task(load_rank_cube())
+bot.setup_hook = setup_hook
 
 # Global Top Sellers command
-from steam import gts_command, gts_weekly_command
+from steam import gts_command, gts_weekly_command, ccu_command, STEAM_TOP_LIST, TOP_SELLER_CRAWLER, CCU_PROVIDER
 @bot.command()
 async def gts(ctx, *, game_name: str = None):
     await gts_command(ctx, db, game_name)
+
+@bot.command()
+async def ccu(ctx, *, game_name: str):
+    await ccu_command(ctx, db, game_name)
     
 @bot.command()
 async def gtsweekly(ctx):
@@ -80,10 +104,12 @@ async def earnings(ctx, *args):
 from mfn import websocket_background_task
 from ig import daily_message_morning, daily_message_evening, current_index
 from placera import placera_updates
-from steam import SteamPipeline
+from steam import SteamPipeline, CCUPipeline
 from pipeline import schedule_pipeline
-from psstore import daily_ps_database_refresh
+from psstore import daily_ps_database_refresh, PS_TOP_LIST
 from fi_blankning import update_fi_from_web
+from retention import daily_retention_task
+from db_maintenance import daily_maintenance_task
 
 # Import and initialize Avanza session
 from avanzaauth import get_avanza_session
@@ -94,12 +120,17 @@ daily_morning_task = None
 daily_evening_task = None
 placera_task = None
 steam_task = None
+ccu_task = None
+top_list_tasks = {}
 fi_task = None
 ps_task = None
+retention_task = None
+maintenance_task = None
+analytics_api = None
 
 @bot.event
 async def on_ready():
-    global websocket_task, daily_morning_task, daily_evening_task, placera_task, steam_task, fi_task, ps_task
+    global websocket_task, daily_morning_task, daily_evening_task, placera_task, steam_task, ccu_task, fi_task, ps_task, retention_task, maintenance_task, analytics_api
 
     print(f"Logged in as {bot.user.name} ({bot.user.id})")
 
@@ -143,6 +174,20 @@ async def on_ready():
     else:
         print('Steam pipeline is already running.')
 
+    if ccu_task is None or ccu_task.done():
+        print('Starting Steam CCU pipeline')
+        ccu_task = bot.loop.create_task(schedule_pipeline(CCUPipeline(db)))
+    else:
+        print('Steam CCU pipeline is already running.')
+
+    for top_list in (STEAM_TOP_LIST, PS_TOP_LIST):
+        task = top_list_tasks.get(top_list.name)
+        if task is None or task.done():
+            print(f'Starting {top_list.name} top list refresh loop')
+            top_list_tasks[top_list.name] = bot.loop.create_task(top_list.run(db))
+        else:
+            print(f'{top_list.name} top list refresh loop is already running.')
+
     if ps_task is None or ps_task.done():
         print('Start PS Daily loop')
         ps_task = bot.loop.create_task(daily_ps_database_refresh(db))
@@ -154,6 +199,24 @@ async def on_ready():
         fi_task = bot.loop.create_task(update_fi_from_web(db, bot))
     else:
         print('FI Blankning loop is already running.')
+
+    if retention_task is None or retention_task.done():
+        print('Start database retention loop')
+        retention_task = bot.loop.create_task(daily_retention_task(db))
+    else:
+        print('Database retention loop is already running.')
+
+    if maintenance_task is None or maintenance_task.done():
+        print('Start database maintenance loop')
+        maintenance_task = bot.loop.create_task(daily_maintenance_task(db))
+    else:
+        print('Database maintenance loop is already running.')
+
+    if ANALYTICS_API_PORT and analytics_api is None:
+        from analytics_api import start_analytics_api
+        analytics_api = await start_analytics_api(db.db_name, ANALYTICS_API_HOST, int(ANALYTICS_API_PORT),
+                                                  rank_shards=RANK_SHARD_DIR)
+        print(f'Analytics API listening on http://{ANALYTICS_API_HOST}:{ANALYTICS_API_PORT}')
     
 @bot.command()
 async def index(ctx):
@@ -162,7 +225,11 @@ async def index(ctx):
 # Close the database connection when the bot is stopped
 @bot.event
 async def on_close():
-    db.close()
+    if analytics_api is not None:
+        await analytics_api.close()
+    await TOP_SELLER_CRAWLER.close()
+    await CCU_PROVIDER.close()
+    await db.close()
     
 # Run the bot, connect to Discord
 bot.run(BOT_TOKEN)
\ No newline at end of file
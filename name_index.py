@@ -0,0 +1,173 @@
+"""
+Game-name normalization and an in-memory search index over translation titles.
+
+NameIndex answers the `!gts <game>` / `!ps <game>` lookups without scanning the
+catalogue. It keeps, per title, the normalized name plus
+
+  * a token -> ids inverted index (word-level matches),
+  * a sorted list of normalized names (prefix matches, by bisection),
+  * a trigram -> ids index (substring matches and fuzzy candidates),
+
+and is updated in place as titles are added or renamed. The match order is the
+one the command handlers always used: every query word matches a whole word, then
+prefix, then substring, then (optionally) a difflib close match; within a step the
+shortest normalized name wins.
+"""
+
+import bisect
+import difflib
+import re
+import threading
+
+_ROMAN_NUMERALS = {
+    'viii': '8', 'vii': '7', 'vi': '6', 'ix': '9', 'iv': '4',
+    'x': '10', 'v': '5', 'iii': '3', 'ii': '2',
+}
+_ROMAN_RE = re.compile(r'\b(viii|vii|vi|ix|iv|x|v|iii|ii)\b')
+_PUNCTUATION_RE = re.compile(r"[:!?'®™©]")
+_WHITESPACE_RE = re.compile(r'\s+')
+
+FUZZY_CUTOFF = 0.75
+FUZZY_CANDIDATES = 50
+
+
+def normalize_game_name_for_search(text: str) -> str:
+    text = text.lower()
+    # Roman numerals as whole words -> digits (e.g. "Final Fantasy VII" -> "final fantasy 7")
+    text = _ROMAN_RE.sub(lambda match: _ROMAN_NUMERALS[match.group(1)], text)
+    # Hyphens → spaces
+    text = text.replace('-', ' ')
+    # Remove specified punctuation
+    text = _PUNCTUATION_RE.sub('', text)
+    # Collapse multiple spaces to a single space and strip leading/trailing spaces
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    def __init__(self):
+        self._titles = {}      # id -> (title, normalized name, insertion order)
+        self._tokens = {}      # token -> set of ids
+        self._trigrams = {}    # trigram -> set of ids
+        self._sorted = []      # sorted (normalized name, order, id)
+        self._next_order = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, item_id, title, normalized=None):
+        """Adds or renames one title. `normalized` may be passed when already known."""
+        if not title:
+            return
+        key = str(item_id)
+        normalized = normalized if normalized is not None else normalize_game_name_for_search(title)
+        with self._lock:
+            previous = self._titles.get(key)
+            if previous is not None:
+                if previous[0] == title:
+                    return
+                self._remove(key, previous)
+                order = previous[2]
+            else:
+                order = self._next_order
+                self._next_order += 1
+            self._titles[key] = (title, normalized, order)
+            if not normalized:
+                return
+            for token in set(normalized.split()):
+                self._tokens.setdefault(token, set()).add(key)
+            for trigram in _trigrams(normalized):
+                self._trigrams.setdefault(trigram, set()).add(key)
+            bisect.insort(self._sorted, (normalized, order, key))
+
+    def _remove(self, key, entry):
+        _, normalized, order = entry
+        for token in set(normalized.split()):
+            self._tokens.get(token, set()).discard(key)
+        for trigram in _trigrams(normalized):
+            self._trigrams.get(trigram, set()).discard(key)
+        position = bisect.bisect_left(self._sorted, (normalized, order, key))
+        if position < len(self._sorted) and self._sorted[position][2] == key:
+            del self._sorted[position]
+
+    def _best(self, keys):
+        # Shortest normalized name first; ties go to the title indexed first.
+        if not keys:
+            return None
+        best = min(keys, key=lambda key: (len(self._titles[key][1]), self._titles[key][2]))
+        return self._titles[best][0]
+
+    def match(self, user_query, fuzzy=True):
+        """Returns the title that best matches user_query, or None."""
+        q = normalize_game_name_for_search(user_query)
+        if not q:
+            return None
+
+        with self._lock:
+            # 1) word-level match: all tokens must match whole words
+            candidates = None
+            for token in set(q.split()):
+                ids = self._tokens.get(token)
+                if not ids:
+                    candidates = set()
+                    break
+                candidates = set(ids) if candidates is None else candidates & ids
+            if candidates:
+                return self._best(candidates)
+
+            # 2) prefix match
+            prefix = []
+            position = bisect.bisect_left(self._sorted, (q,))
+            while position < len(self._sorted) and self._sorted[position][0].startswith(q):
+                prefix.append(self._sorted[position][2])
+                position += 1
+            if prefix:
+                return self._best(prefix)
+
+            # 3) substring match: candidates share every trigram of the query
+            if len(q) >= 3:
+                candidates = None
+                for trigram in _trigrams(q):
+                    ids = self._trigrams.get(trigram, set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+                    if not candidates:
+                        break
+            else:
+                # Too short for trigrams (and without spaces): it lies inside one token.
+                candidates = set()
+                for token, ids in self._tokens.items():
+                    if q in token:
+                        candidates |= ids
+            substring = [key for key in candidates or () if q in self._titles[key][1]]
+            if substring:
+                return self._best(substring)
+
+            if not fuzzy:
+                return None
+
+            # 4) fuzzy match among the titles sharing the most trigrams with the query
+            query_trigrams = _trigrams(q)
+            shared = {}
+            for trigram in query_trigrams:
+                for key in self._trigrams.get(trigram, ()):
+                    shared[key] = shared.get(key, 0) + 1
+            # Rank by trigram Dice similarity, which tracks difflib's ratio closely.
+            similarity = {
+                key: 2 * count / (len(query_trigrams) + max(len(self._titles[key][1]) - 2, 0))
+                for key, count in shared.items()
+            }
+            ranked = sorted(similarity, key=similarity.get, reverse=True)[:FUZZY_CANDIDATES]
+            matcher = difflib.SequenceMatcher()
+            matcher.set_seq2(q)
+            best_key, best_score = None, FUZZY_CUTOFF
+            for key in ranked:
+                matcher.set_seq1(self._titles[key][1])
+                if (matcher.real_quick_ratio() >= best_score and matcher.quick_ratio() >= best_score):
+                    score = matcher.ratio()
+                    if score > best_score or (score == best_score and best_key is None):
+                        best_key, best_score = key, score
+            return self._titles[best_key][0] if best_key is not None else None
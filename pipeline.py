@@ -49,14 +49,14 @@ class BasePipeline(abc.ABC):
         """
         # DB pipeline
         if self.db and self.table:
-            latest_ts = self.db.get_latest_timestamp(self.table)
+            latest_ts = await self.db.get_latest_timestamp(self.table)
             if latest_ts:
                 last_dt = datetime.strptime(latest_ts, '%Y-%m-%d %H')
                 now = datetime.now().replace(minute=0, second=0, microsecond=0)
                 if now - last_dt < timedelta(hours=1):
                     return items
             # insert_bulk_data accepts list of dicts and optional table name
-            self.db.insert_bulk_data(items, table=self.table)
+            await self.db.insert_bulk_data(items, table=self.table)
             return items
 
         # Discord pipeline
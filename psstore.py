@@ -8,8 +8,9 @@ from bs4 import BeautifulSoup
 import discord  # Added import
 
 # Assume these come from your project’s modules.
-from database import Database
-from general_utils import log_message, error_message, aiohttp_retry, get_seconds_until, normalize_game_name_for_search, generate_gts_placements_plot # Updated import
+from async_database import AsyncDatabase
+from general_utils import log_message, error_message, aiohttp_retry, get_seconds_until, generate_gts_placements_plot # Updated import
+from top_list_cache import TopListSnapshot
 
 # --------------------------
 # PS Top Sellers Scraper
@@ -22,15 +23,16 @@ async def fetch_page_content(url: str) -> str:
         async with session.get(url) as response:
             return await response.text()
 
-async def update_ps_top_sellers(db: Database, pages: int = 5) -> list:
+async def update_ps_top_sellers(db: AsyncDatabase, pages: int = 5, write_db: bool = True) -> list:
     """
     Scrapes the PlayStation Store top sellers from the specified number of pages,
-    updates the translation table, and (if an update is due)
+    updates the translation table, and (if write_db is set and an update is due)
     inserts the new data into the PSTopGames table.
     
     Args:
-        db: Database instance
+        db: AsyncDatabase instance
         pages: Number of pages to scrape (default: 5)
+        write_db: Insert the capture into PSTopGames (default: True)
     
     Returns a list of game dictionaries with keys:
     'timestamp', 'place', 'ps_id', 'game_name', and 'discount'.
@@ -71,8 +73,6 @@ async def update_ps_top_sellers(db: Database, pages: int = 5) -> list:
                 # If discount info were available, you could extract it here.
                 discount = ""  # Default to empty string for now.
                 placement_counter += 1
-                # Update or insert the translation mapping for this PS game.
-                db.update_ps_appid(ps_id, game_name)
                 game_data = {
                     'timestamp': timestamp,
                     'place': placement_counter,
@@ -84,8 +84,14 @@ async def update_ps_top_sellers(db: Database, pages: int = 5) -> list:
         # Sleep briefly to avoid overwhelming the server.
         await asyncio.sleep(0.1)
 
+    # Update or insert the translation mappings for all scraped PS games in one batch.
+    await db.sync_translations('ps', [(game['ps_id'], game['game_name']) for game in games])
+
+    if not write_db:
+        return games
+
     # Check if a recent update was already saved (within the last hour)
-    latest_timestamp = db.get_latest_timestamp('PSTopGames')
+    latest_timestamp = await db.get_latest_timestamp('PSTopGames')
     if latest_timestamp is not None:
         latest_timestamp = datetime.strptime(latest_timestamp, '%Y-%m-%d %H')
     current_time = datetime.now().replace(minute=0, second=0, microsecond=0)
@@ -93,75 +99,43 @@ async def update_ps_top_sellers(db: Database, pages: int = 5) -> list:
         return games
 
     # Insert the scraped data into the PSTopGames table
-    db.insert_bulk_data(games, 'PSTopGames')
+    await db.insert_bulk_data(games, 'PSTopGames')
     return games
 
 # --------------------------
 # Command Function for PS Top Sellers
 # --------------------------
 
-def get_best_ps_game_match(user_query, db: Database):
-    """Finds the best match for a user's game query against PS game names."""
-    cursor = db.conn.execute("SELECT DISTINCT game_name FROM PSGameTranslation") # Assuming PSTranslation table
-    original_game_names = [row[0] for row in cursor.fetchall()]
-    if not original_game_names:
-        return None
-
-    q = normalize_game_name_for_search(user_query)
-    if not q:
-        return None
-
-    pairs = []
-    for orig in original_game_names:
-        norm = normalize_game_name_for_search(orig)
-        if norm:
-            pairs.append((norm, orig))
+# Hour of the daily 42-page capture (daily_ps_database_refresh)
+PS_FULL_CAPTURE_HOUR = 21
 
-    # 1) word‐level match: all tokens must match whole words
-    query_tokens = q.split()
-    word_matches = [
-        (norm, orig) for norm, orig in pairs
-        if all(token in norm.split() for token in query_tokens)
-    ]
-    if word_matches:
-        # Prefer shorter matches if multiple word-level matches exist
-        return min(word_matches, key=lambda x: len(x[0]))[1]
-
-    # 2) prefix match
-    prefix = [p for p in pairs if p[0].startswith(q)]
-    if prefix:
-        return min(prefix, key=lambda x: len(x[0]))[1]
-
-    # 3) substring match
-    substr = [p for p in pairs if q in p[0]]
-    if substr:
-        return min(substr, key=lambda x: len(x[0]))[1]
+def refresh_ps_top_list(db: AsyncDatabase):
+    """
+    Fetch for PS_TOP_LIST. Like the live scrape !gtsps used to run, it stores a capture
+    in PSTopGames when none was stored this hour, except in PS_FULL_CAPTURE_HOUR so the
+    5-page capture does not take the place of the daily full one.
+    """
+    return update_ps_top_sellers(db, write_db=datetime.now().hour != PS_FULL_CAPTURE_HOUR)
 
-    # 4) difflib fallback (ensure difflib is imported in general_utils or here)
-    # For simplicity, assuming difflib is available via general_utils or globally
-    # import difflib # Would be needed if not imported elsewhere
-    # names = [p[0] for p in pairs]
-    # close = difflib.get_close_matches(q, names, n=1, cutoff=0.75)
-    # if close:
-    #     # Find the original name corresponding to the normalized close match
-    #     for norm_name, orig_name in pairs:
-    #         if norm_name == close[0]:
-    #             return orig_name
-    # For now, skipping difflib for PS Store to keep it simpler unless specified
+# Current top list for !gtsps, refreshed in the background (see top_list_cache.py)
+PS_TOP_LIST = TopListSnapshot('ps', refresh_ps_top_list)
 
-    return None
+async def get_best_ps_game_match(user_query, db: AsyncDatabase):
+    """Finds the best match for a user's game query against PS game names."""
+    # Word-level, prefix and substring match (see name_index.py); no fuzzy step for PS Store
+    return await db.match_game_name('ps', user_query, fuzzy=False)
 
-async def gtsps_command(ctx, db: Database, game_name: str = None):
+async def gtsps_command(ctx, db: AsyncDatabase, game_name: str = None):
     """
     If a game name is provided, generates a graph of its PS Store placements.
     Otherwise, displays the top 15 PS sellers.
     """
     if game_name is not None:
-        matched_game_name = get_best_ps_game_match(game_name, db)
+        matched_game_name = await get_best_ps_game_match(game_name, db)
         if matched_game_name:
             # You will need a method in your Database class to fetch placement data for a PS game
             # Example: aggregated_data = db.get_ps_gts_placements_for_game(matched_game_name)
-            aggregated_data = db.get_last_month_ps_placements(matched_game_name) # Placeholder, changed method name
+            aggregated_data = await db.get_last_month_ps_placements(matched_game_name) # Placeholder, changed method name
             if aggregated_data and aggregated_data.get("positions") and aggregated_data.get("placements"):
                 image_stream, discord_file = generate_gts_placements_plot(aggregated_data, matched_game_name, is_steam=False)
                 await ctx.send(file=discord_file)
@@ -174,8 +148,11 @@ async def gtsps_command(ctx, db: Database, game_name: str = None):
             return
 
     # No game name provided; display the standard top sellers list.
-    top_games = await update_ps_top_sellers(db)
-    latest_timestamp = db.get_latest_timestamp('PSTopGames')
+    top_games, _ = await PS_TOP_LIST.get(db)
+    if not top_games:
+        await ctx.send("The PS Store top sellers are not available right now, try again in a minute.")
+        return
+    latest_timestamp = await db.get_latest_timestamp('PSTopGames')
     
     # Calculate yesterday's timestamp at hour 21 for comparison
     if latest_timestamp:
@@ -189,7 +166,7 @@ async def gtsps_command(ctx, db: Database, game_name: str = None):
         yesterday_query_timestamp = None
     
     # Get yesterday's games using the calculated yesterday timestamp
-    yesterday_games = db.get_yesterday_top_games(yesterday_query_timestamp, table='PSTopGames')
+    yesterday_games = await db.get_yesterday_top_games(yesterday_query_timestamp, table='PSTopGames')
 
     # --- Debug print statement ---
     if hasattr(ctx, 'is_dummy_context'): # Check if it's the dummy context from __main__
@@ -222,21 +199,21 @@ async def gtsps_command(ctx, db: Database, game_name: str = None):
         response_lines.append(line)
 
     joined_response = '\n'.join(response_lines)
-    await ctx.send(f"**Top 15 PS Games:**\n{joined_response}\n")
+    await ctx.send(f"**Top 15 PS Games** ({PS_TOP_LIST.age_text()}):\n{joined_response}\n")
 
 # --------------------------
 # (Optional) Daily PS Database Refresh
 # --------------------------
 
-async def daily_ps_database_refresh(db: Database):
+async def daily_ps_database_refresh(db: AsyncDatabase):
     while True:
         next_run = datetime.now()
-        next_run += timedelta(seconds=get_seconds_until(21, 0))
+        next_run += timedelta(seconds=get_seconds_until(PS_FULL_CAPTURE_HOUR, 0))
         log_message(f'Waiting until {next_run.strftime("%Y-%m-%d %H:%M")} to update PS database.')
-        await asyncio.sleep(get_seconds_until(21, 0))
+        await asyncio.sleep(get_seconds_until(PS_FULL_CAPTURE_HOUR, 0))
 
         # Update the PS top sellers data in the database.
-        await update_ps_top_sellers(db, pages=42)
+        PS_TOP_LIST.update(await update_ps_top_sellers(db, pages=42))
         print('Database updated with PS top sellers.')
 
 # --------------------------
@@ -244,10 +221,7 @@ async def daily_ps_database_refresh(db: Database):
 # --------------------------
 
 if __name__ == "__main__":
-    # For testing outside of a bot context:
-    # Create an instance of your Database class.
-    db = Database("steam_top_games.db")
-    # Create an asyncio event loop and run the gtsps_command with a dummy context.
+    # For testing outside of a bot context, run gtsps_command with a dummy context.
     class DummyContext:
         async def send(self, message):
             print(message)
@@ -255,7 +229,10 @@ if __name__ == "__main__":
         def __init__(self):
             self.is_dummy_context = True # Add a flag to identify dummy context
             
-    dummy_ctx = DummyContext()
-    asyncio.run(gtsps_command(dummy_ctx, db)) # Test without game name
-    # To test with a game name:
-    # asyncio.run(gtsps_command(dummy_ctx, db, game_name="Spider-Man"))
+    async def run_example():
+        async with AsyncDatabase("steam_top_games.db") as db:
+            await gtsps_command(DummyContext(), db) # Test without game name
+            # To test with a game name:
+            # await gtsps_command(DummyContext(), db, game_name="Spider-Man")
+
+    asyncio.run(run_example())
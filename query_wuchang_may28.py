@@ -54,7 +54,7 @@ def query_wuchang_may28():
             db.cursor.execute("""
                 SELECT DISTINCT timestamp
                 FROM SteamTopGames 
-                WHERE substr(timestamp, 1, 10) = '2025-05-28'
+                WHERE timestamp >= '2025-05-28' AND timestamp < '2025-05-29'
                 ORDER BY timestamp
             """)
             
@@ -84,7 +84,7 @@ def query_wuchang_may28():
                 db.cursor.execute("""
                     SELECT timestamp, place, discount, ccu
                     FROM SteamTopGames 
-                    WHERE appid = ? AND substr(timestamp, 1, 10) = '2025-05-28'
+                    WHERE appid = ? AND timestamp >= '2025-05-28' AND timestamp < '2025-05-29'
                     ORDER BY timestamp
                 """, (appid,))
                 
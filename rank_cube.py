@@ -0,0 +1,264 @@
+"""
+In-memory rank history for multi-game analytics.
+
+A RankCube holds the hourly ranks of one source ('steam' or 'ps') as a dense int16
+matrix with one row per hour and one column per appid / ps_id, where 0 means "not
+charted that hour". It is loaded once from SteamTopGames / PSTopGames (or
+RankSnapshots) and then kept current by the Database it is attached to:
+
+    cube = db.load_rank_cube('steam', start_date='2025-01-01')
+    # = RankCube.load(db, ...) + db.attach_rank_cube(cube): every new capture is
+    # appended via the change bus
+    stats = cube.daily_stats(['2277560', '1771300'])
+    delta_days, ranks = cube.release_aligned(['2277560', '1771300'], ['2025-07-24', '2025-02-04'], 30)
+
+Daily aggregates use the same definitions as DailyPlacementRollup (harmonic mean,
+arithmetic mean, min and max of the charted hours). Memory is hours * ids * 2 bytes,
+e.g. one year of a 500-deep Steam chart with ~6000 distinct appids is about 100 MiB;
+pass start_date to load a shorter window.
+
+main.py loads the Steam cube for the last RANK_CUBE_DAYS days on the bot's writer
+thread; Database.get_games_placements_delta_days (and with it
+get_multiple_games_placements_delta_days) then reads from it whenever it covers the
+requested windows.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import rank_snapshots
+from change_bus import INSERTED
+from database import RANK_SOURCES
+
+HOUR_FORMAT = '%Y-%m-%d %H'
+LOAD_CHUNK = 50000
+
+
+class RankCube:
+    def __init__(self, source, start_date):
+        if source not in RANK_SOURCES:
+            raise ValueError(f"Invalid rank source: {source}")
+        self.source = source
+        self.start = datetime.strptime(start_date, '%Y-%m-%d')
+        self.ids = []
+        self._columns = {}
+        self._ranks = np.zeros((0, 0), dtype=np.int16)
+        self._captured = np.zeros(0, dtype=bool)
+        self.hour_count = 0
+        self._hour_cache = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, db, source='steam', start_date=None):
+        """
+        Builds a cube from the rank rows of `db` (or its RankSnapshots when the database
+        stores snapshots only), starting at start_date ('YYYY-MM-DD', default: first capture).
+        """
+        table, _ = RANK_SOURCES[source]
+        use_snapshots = getattr(db, 'rank_storage', 'rows') == 'snapshots'
+        cursor = db.conn.cursor()
+        try:
+            if start_date is None:
+                if use_snapshots:
+                    cursor.execute("SELECT MIN(timestamp) FROM RankSnapshots WHERE source = ?", (source,))
+                elif getattr(db, 'rank_shards', None) is not None:
+                    # Rows are spread over monthly shards; the catalog knows the first capture
+                    cursor.execute("SELECT MIN(ts) FROM Snapshots WHERE source = ?", (table,))
+                else:
+                    cursor.execute(f"SELECT MIN(timestamp) FROM {table}")
+                first = cursor.fetchone()[0]
+                start_date = first[:10] if first else datetime.now().strftime('%Y-%m-%d')
+            cube = cls(source, start_date)
+
+            if use_snapshots:
+                cursor.execute(
+                    "SELECT timestamp, codec, ids FROM RankSnapshots WHERE source = ? AND timestamp >= ?",
+                    (source, start_date))
+                for timestamp, codec, ids in cursor:
+                    cube.add_capture(timestamp, rank_snapshots.unpack_int32(ids, codec).tolist())
+            else:
+                for rows in db.iter_rank_rows(source, start_date, LOAD_CHUNK):
+                    cube.add_placements(rows)
+        finally:
+            cursor.close()
+        return cube
+
+    # -- building -------------------------------------------------------------
+
+    def _hour_index(self, timestamp):
+        index = self._hour_cache.get(timestamp)
+        if index is None:
+            delta = datetime.strptime(timestamp[:13], HOUR_FORMAT) - self.start
+            index = int(delta.total_seconds() // 3600)
+            self._hour_cache[timestamp] = index
+        return index
+
+    def _column(self, item_id):
+        key = str(item_id)
+        column = self._columns.get(key)
+        if column is None:
+            column = len(self.ids)
+            self._columns[key] = column
+            self.ids.append(key)
+        return column
+
+    def _reserve(self, hours, columns):
+        rows, cols = self._ranks.shape
+        if hours <= rows and columns <= cols:
+            return
+        # Grow geometrically; the hour axis stays a multiple of 24 so days reshape cleanly.
+        new_rows = max(hours, rows * 2) if hours > rows else rows
+        new_rows = -(-new_rows // 24) * 24
+        new_cols = max(columns, cols * 2) if columns > cols else cols
+        ranks = np.zeros((new_rows, new_cols), dtype=np.int16)
+        ranks[:rows, :cols] = self._ranks
+        captured = np.zeros(new_rows, dtype=bool)
+        captured[:len(self._captured)] = self._captured
+        self._ranks, self._captured = ranks, captured
+
+    def add_placements(self, placements):
+        """Adds (timestamp, item_id, place) tuples. Rows before the cube's start are ignored."""
+        with self._lock:
+            hours, columns, places = [], [], []
+            for timestamp, item_id, place in placements:
+                hour = self._hour_index(timestamp)
+                if hour < 0 or not place or place <= 0:
+                    continue
+                hours.append(hour)
+                columns.append(self._column(item_id))
+                places.append(place)
+            if not hours:
+                return
+            hours = np.asarray(hours)
+            self._reserve(int(hours.max()) + 1, len(self.ids))
+            self._ranks[hours, np.asarray(columns)] = np.minimum(places, np.iinfo(np.int16).max)
+            self._captured[hours] = True
+            self.hour_count = max(self.hour_count, int(hours.max()) + 1)
+
+    def on_change(self, event):
+        """Change bus callback (see Database.attach_rank_cube): adds newly inserted captures."""
+        if event.kind == INSERTED:
+            self.add_placements(event.payload)
+
+    def add_capture(self, timestamp, ids_by_place):
+        """Adds one capture given as a list of ids ordered by place (place = index + 1)."""
+        self.add_placements((timestamp, item_id, place) for place, item_id in enumerate(ids_by_place, 1) if item_id)
+
+    # -- queries --------------------------------------------------------------
+
+    @property
+    def day_count(self):
+        return -(-self.hour_count // 24)
+
+    def date(self, day_index):
+        return (self.start + timedelta(days=int(day_index))).strftime('%Y-%m-%d')
+
+    def _day_index(self, date_str):
+        return (datetime.strptime(date_str, '%Y-%m-%d') - self.start).days
+
+    def _gather(self, item_ids, row_start, row_end):
+        """Returns ranks[row_start:row_end] for item_ids, with zero columns for unknown ids."""
+        columns = np.asarray([self._columns.get(str(item_id), -1) for item_id in item_ids], dtype=np.int64)
+        row_start, row_end = max(row_start, 0), max(min(row_end, self._ranks.shape[0]), 0)
+        if not self.ids:
+            return np.zeros((max(row_end - row_start, 0), len(columns)), dtype=np.int16)
+        block = self._ranks[row_start:row_end][:, np.maximum(columns, 0)]
+        block[:, columns < 0] = 0
+        return block
+
+    def series(self, item_id):
+        """Hourly ranks of one id as an int16 vector (0 = not charted), one entry per hour since start."""
+        with self._lock:
+            return self._gather([item_id], 0, self.hour_count)[:, 0]
+
+    def daily_stats(self, item_ids, start_date=None, end_date=None):
+        """
+        Per-day aggregates for every id of item_ids. Returns a dict of arrays shaped
+        (days, ids): 'samples', 'harmonic', 'mean', 'min', 'max' (NaN on days an id was
+        not charted), plus 'dates' and 'captures' (hours captured per day).
+        """
+        with self._lock:
+            first = max(self._day_index(start_date), 0) if start_date else 0
+            last = min(self._day_index(end_date), self.day_count - 1) if end_date else self.day_count - 1
+            days = max(last - first + 1, 0)
+            block = self._gather(item_ids, first * 24, (first + days) * 24)
+            captures = self._captured[first * 24:(first + days) * 24].reshape(days, 24).sum(axis=1)
+        stats = _daily_aggregates(block, days, len(item_ids), [self.date(first + day) for day in range(days)])
+        stats['captures'] = captures
+        return stats
+
+    def daily_harmonic_means(self, item_ids, start_date=None, end_date=None):
+        stats = self.daily_stats(item_ids, start_date, end_date)
+        return stats['dates'], stats['harmonic']
+
+    def daily_min_max(self, item_ids, start_date=None, end_date=None):
+        stats = self.daily_stats(item_ids, start_date, end_date)
+        return stats['dates'], stats['min'], stats['max']
+
+    def rolling_mean(self, item_ids, window_hours=24 * 7):
+        """
+        For every hour, the mean rank over the hours the id was charted among the trailing
+        `window_hours` hours (that hour included), shaped (hours, ids); NaN where the id
+        was not charted at all within the window.
+        """
+        with self._lock:
+            block = self._gather(item_ids, 0, self.hour_count).astype(np.float64)
+        charted = block > 0
+        sums = np.cumsum(block, axis=0)
+        counts = np.cumsum(charted, axis=0)
+        if window_hours < len(block):
+            sums[window_hours:] -= sums[:-window_hours].copy()
+            counts[window_hours:] -= counts[:-window_hours].copy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def release_aligned(self, item_ids, release_dates, days_before=90, days_after=0, stat='harmonic'):
+        """
+        Aligns each id's daily `stat` ('harmonic', 'mean', 'min' or 'max') on its own
+        release date. Returns (delta_days, values) where delta_days runs from
+        -days_before to days_after and values is shaped (len(delta_days), ids).
+        """
+        delta_days = np.arange(-days_before, days_after + 1)
+        stats = self.daily_stats(item_ids)
+        values = stats[stat]
+        release_index = np.asarray([self._day_index(release) for release in release_dates])
+        day_index = release_index[None, :] + delta_days[:, None]
+        valid = (day_index >= 0) & (day_index < len(values))
+        aligned = np.full(day_index.shape, np.nan)
+        columns = np.broadcast_to(np.arange(len(item_ids)), day_index.shape)
+        aligned[valid] = values[day_index[valid], columns[valid]]
+        return delta_days, aligned
+
+    def window_ranks(self, item_ids, start_timestamp, end_timestamp):
+        """{id: [place, ...]} of the charted hours between two 'YYYY-MM-DD HH' timestamps (inclusive)."""
+        with self._lock:
+            first = self._hour_index(start_timestamp)
+            last = self._hour_index(end_timestamp)
+            block = self._gather(item_ids, first, last + 1)
+        return {
+            str(item_id): block[:, i][block[:, i] > 0].tolist()
+            for i, item_id in enumerate(item_ids)
+            if (block[:, i] > 0).any()
+        }
+
+
+def _daily_aggregates(block, days, id_count, dates):
+    ranks = block.reshape(days, 24, id_count).astype(np.float64)
+    charted = ranks > 0
+    samples = charted.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reciprocal_sum = np.where(charted, 1.0 / np.where(charted, ranks, 1.0), 0.0).sum(axis=1)
+        harmonic = np.where(samples > 0, samples / reciprocal_sum, np.nan)
+        mean = np.where(samples > 0, ranks.sum(axis=1) / samples, np.nan)
+    minimum = np.where(samples > 0, np.where(charted, ranks, np.inf).min(axis=1), np.nan)
+    maximum = np.where(samples > 0, ranks.max(axis=1), np.nan)
+    return {
+        'dates': dates,
+        'samples': samples,
+        'harmonic': harmonic,
+        'mean': mean,
+        'min': minimum,
+        'max': maximum,
+    }
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Monthly SQLite shards for the rank history.
+
+With Database(..., rank_shards='rank_shards') the rows of SteamTopGames and PSTopGames
+are written to one file per calendar month (rank_shards/ranks_2025_08.db) instead of
+the main database, so inserts, index maintenance and VACUUM only ever touch the
+current month's B-trees. DailyPlacementRollup, RankSnapshots, the Snapshots catalog
+and all other tables stay in the main file.
+
+A shard is an ordinary SQLite database with the two rank tables and their indexes.
+ShardRouter ATTACHes it to the Database connection (as shard_2025_08) the first time
+a query or insert needs it and detaches the least recently used shard once
+MAX_ATTACHED are attached. Range reads visit the months they overlap in order and
+concatenate the rows, so results ordered by timestamp stay ordered. Rows written
+before sharding was enabled stay in the main tables and are read together with the
+shards until `migrate` moves them.
+
+Shard writes are not atomic with the main file: SQLite commits each attached WAL
+database separately, so a crash during a COMMIT can leave a capture in the shard
+without its Snapshots/DailyPlacementRollup entries, or the reverse. The nightly
+maintenance runs Database.reconcile_rank_shards over the unsealed months, which
+recounts their rows and repairs the catalog and rollup where they disagree.
+
+A month is closed SEAL_AFTER after it ends; inserts into a closed month are refused.
+The nightly maintenance (db_maintenance.py) then seals it: the shard is taken out of
+WAL mode, after which every connection attaches it read-only with immutable=1 (no
+locking or change detection) and memory-mapped.
+
+Usage:
+    python rank_shards.py status --db steam_top_games.db --dir rank_shards
+    python rank_shards.py migrate --db steam_top_games.db --dir rank_shards   # with the bot stopped
+    python rank_shards.py seal --db steam_top_games.db --dir rank_shards
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from database import CONNECTION_PRAGMAS, PS_TOP_GAMES_SCHEMA, STEAM_TOP_GAMES_SCHEMA
+
+# Rank tables held by the shards: table -> columns written by insert (id is assigned by the shard)
+SHARD_TABLES = {
+    'SteamTopGames': ('timestamp', 'place', 'appid', 'discount', 'ccu'),
+    'PSTopGames': ('timestamp', 'place', 'ps_id', 'discount'),
+}
+
+SHARD_SCHEMA = [
+    STEAM_TOP_GAMES_SCHEMA,
+    PS_TOP_GAMES_SCHEMA,
+    # Same indexes as the main tables (migration 1)
+    "CREATE INDEX IF NOT EXISTS idx_steamtopgames_appid_timestamp ON SteamTopGames (appid, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_steamtopgames_timestamp ON SteamTopGames (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_pstopgames_psid_timestamp ON PSTopGames (ps_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_pstopgames_timestamp ON PSTopGames (timestamp)",
+]
+
+SHARD_FILE = re.compile(r'^ranks_(\d{4})_(\d{2})\.db$')
+# SQLite allows 10 attached databases per connection by default
+MAX_ATTACHED = 8
+# Late captures of a month are still accepted for this long after it ends
+SEAL_AFTER = timedelta(days=1)
+MIGRATE_CHUNK_DAYS = 7
+
+
+def month_of(timestamp):
+    """'2025-08-14 21' -> '2025_08'"""
+    return f"{timestamp[:4]}_{timestamp[5:7]}"
+
+
+def _month_start(month):
+    return datetime.strptime(month, '%Y_%m')
+
+
+def _next_month(month):
+    start = _month_start(month)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1).strftime('%Y_%m')
+
+
+class ShardRouter:
+    """Routes rank rows of one Database connection to the monthly shard files in shard_dir."""
+
+    def __init__(self, conn, shard_dir, read_only=False):
+        self.conn = conn
+        self.shard_dir = Path(shard_dir)
+        self.read_only = read_only
+        if not read_only:
+            self.shard_dir.mkdir(parents=True, exist_ok=True)
+        # month -> (alias, attached sealed), least recently used first
+        self._attached = OrderedDict()
+
+    # -- shard files ----------------------------------------------------------
+
+    def path(self, month):
+        return self.shard_dir / f"ranks_{month}.db"
+
+    def months(self):
+        """Months that have a shard file, oldest first."""
+        if not self.shard_dir.is_dir():
+            return []
+        found = []
+        for name in os.listdir(self.shard_dir):
+            match = SHARD_FILE.match(name)
+            if match:
+                found.append(f"{match.group(1)}_{match.group(2)}")
+        return sorted(found)
+
+    @staticmethod
+    def is_closed(month, now=None):
+        """True once the month ended more than SEAL_AFTER ago."""
+        return (now or datetime.now()) >= _month_start(_next_month(month)) + SEAL_AFTER
+
+    def is_sealed(self, month, now=None):
+        """A closed month whose shard has left WAL mode (see seal)."""
+        if not self.is_closed(month, now):
+            return False
+        try:
+            with open(self.path(month), 'rb') as f:
+                header = f.read(20)
+        except FileNotFoundError:
+            return False
+        # Bytes 18-19 are the file format read/write versions: 2 in WAL mode, 1 otherwise
+        return len(header) == 20 and header[18] == 1
+
+    def _create(self, month):
+        conn = sqlite3.connect(self.path(month))
+        try:
+            for statement in SHARD_SCHEMA:
+                conn.execute(statement)
+            if not self.is_closed(month):
+                # The open month is written while the bot's readers query it
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # -- attaching ------------------------------------------------------------
+
+    def attach(self, month, create=False, writable=False):
+        """
+        Attaches the shard of `month` and returns its schema name, or None if it does
+        not exist. Sealed shards are attached immutable unless `writable` (migrate).
+        """
+        entry = self._attached.get(month)
+        sealed = not writable and (entry[1] if entry is not None and entry[1] else self.is_sealed(month))
+        if entry is not None and entry[1] == sealed:
+            self._attached.move_to_end(month)
+            return entry[0]
+        if entry is not None:
+            # Sealed since it was attached (or needed for writing): reattach it
+            self._detach(month)
+
+        if not self.path(month).exists():
+            if not create or self.read_only:
+                return None
+            self._create(month)
+
+        while len(self._attached) >= MAX_ATTACHED:
+            if not self._evict():
+                break
+        alias = f"shard_{month}"
+        uri = self.path(month).absolute().as_uri()
+        if sealed:
+            uri += '?mode=ro&immutable=1'
+        elif self.read_only:
+            uri += '?mode=ro'
+        self.conn.execute("ATTACH DATABASE ? AS " + alias, (uri,))
+        self.conn.execute(f"PRAGMA {alias}.mmap_size = {CONNECTION_PRAGMAS['mmap_size']}")
+        self._attached[month] = (alias, sealed)
+        return alias
+
+    def _detach(self, month):
+        alias, _ = self._attached[month]
+        self.conn.execute(f"DETACH DATABASE {alias}")
+        del self._attached[month]
+
+    def _evict(self):
+        # Shards written by the open transaction cannot be detached until it ends
+        for month in list(self._attached):
+            try:
+                self._detach(month)
+                return True
+            except sqlite3.OperationalError:
+                continue
+        return False
+
+    @staticmethod
+    def schema_month(schema):
+        """'shard_2025_08' -> '2025_08'; None for 'main'."""
+        return schema[len('shard_'):] if schema.startswith('shard_') else None
+
+    def drop(self, month):
+        """
+        Deletes the shard file of `month`. Only for sealed months whose rows retention.py
+        has archived; connections that still have it attached keep reading the open file.
+        """
+        if self.read_only:
+            raise ValueError("Cannot drop a rank shard through a read-only connection")
+        if month in self._attached:
+            self._detach(month)
+        for suffix in ('', '-wal', '-shm'):
+            path = Path(f"{self.path(month)}{suffix}")
+            if path.exists():
+                path.unlink()
+
+    def release_unsealed(self):
+        # A shard can only leave WAL mode (be sealed) once no other connection has it
+        # attached, so readers let go of closed shards that are not sealed yet.
+        for month, (_, sealed) in list(self._attached.items()):
+            if not sealed and self.is_closed(month):
+                self._detach(month)
+
+    def detach_all(self):
+        for month in list(self._attached):
+            self._detach(month)
+
+    # -- routing --------------------------------------------------------------
+
+    def schemas(self, start=None, end=None):
+        """
+        Yields the schema names of the existing shards overlapping start..end
+        (timestamps or dates, inclusive; None = unbounded), oldest first. Shards are
+        attached as the iteration reaches them.
+        """
+        first = month_of(start) if start else None
+        last = month_of(end) if end else None
+        for month in self.months():
+            if (first and month < first) or (last and month > last):
+                continue
+            alias = self.attach(month)
+            if alias is not None:
+                yield alias
+
+    @staticmethod
+    def _with_main(schemas):
+        yield 'main'
+        yield from schemas
+
+    def select(self, table, columns, start=None, end=None, where='', params=(), order_by=None):
+        """
+        Returns the rows of `SELECT columns FROM table WHERE timestamp BETWEEN start AND end
+        {where} ORDER BY order_by` over the main table and every overlapping shard, in
+        that order. `where` is appended as is (start it with ' AND ').
+        """
+        if table not in SHARD_TABLES:
+            raise ValueError(f"Invalid table name: {table}")
+        conditions = []
+        bounds = []
+        if start:
+            conditions.append("timestamp >= ?")
+            bounds.append(start)
+        if end:
+            conditions.append("timestamp <= ?")
+            bounds.append(end)
+        condition = ' AND '.join(conditions) or '1'
+        order = f" ORDER BY {order_by}" if order_by else ''
+
+        rows = []
+        for schema in self._with_main(self.schemas(start, end)):
+            rows.extend(self.conn.execute(
+                f"SELECT {columns} FROM {schema}.{table} WHERE {condition}{where}{order}",
+                (*bounds, *params)).fetchall())
+        if self.read_only:
+            self.release_unsealed()
+        return rows
+
+    def insert(self, table, rows, allow_closed=False):
+        """
+        Inserts rows (tuples in SHARD_TABLES[table] order) into the shards of their
+        months, creating shards as needed. The rows join the caller's transaction, but
+        the commit is not atomic across files: SQLite commits each attached WAL database
+        on its own, so a crash during the COMMIT can keep the shard rows and lose the
+        main file's catalog and rollup updates, or the reverse. Database.reconcile_rank_shards
+        repairs that; the nightly maintenance runs it for the unsealed months.
+        """
+        columns = SHARD_TABLES.get(table)
+        if columns is None:
+            raise ValueError(f"Invalid table name: {table}")
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(month_of(row[0]), []).append(row)
+        for month, month_rows in by_month.items():
+            if not allow_closed and self.is_closed(month):
+                raise ValueError(f"Rank shard {month} is closed; refusing to write {table} rows into it")
+            alias = self.attach(month, create=True, writable=True)
+            self.conn.executemany(
+                f"INSERT INTO {alias}.{table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                month_rows)
+
+    # -- maintenance ----------------------------------------------------------
+
+    def seal(self, now=None):
+        """Seals every closed shard that is still in WAL mode. Returns the sealed months."""
+        if self.read_only:
+            return []
+        sealed = []
+        for month in self.months():
+            if not self.is_closed(month, now) or self.is_sealed(month, now):
+                continue
+            if month in self._attached:
+                self._detach(month)
+            conn = sqlite3.connect(self.path(month), timeout=1)
+            try:
+                # Checkpoints the WAL into the file and removes it; fails while another
+                # connection still has the shard open and is retried on the next run.
+                conn.execute("PRAGMA journal_mode=DELETE")
+            except sqlite3.OperationalError:
+                continue
+            finally:
+                conn.close()
+            sealed.append(month)
+        return sealed
+
+    def migrate(self, log=print):
+        """
+        Moves the rows of the main rank tables into the shards, a week at a time, each
+        chunk in its own transaction. Needs exclusive use of the database: readers
+        with a sealed shard attached would not see the rows added to it.
+        Returns {table: rows moved}.
+        """
+        moved = {}
+        for table, columns in SHARD_TABLES.items():
+            moved[table] = 0
+            first, last = self.conn.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM main.{table}").fetchone()
+            if first is None:
+                continue
+            day = datetime.strptime(first[:10], '%Y-%m-%d')
+            while day.strftime('%Y-%m-%d') <= last[:10]:
+                lower_ts = day.strftime('%Y-%m-%d')
+                # Chunks never cross a month boundary
+                upper = min(day + timedelta(days=MIGRATE_CHUNK_DAYS), _month_start(_next_month(month_of(lower_ts))))
+                upper_ts = upper.strftime('%Y-%m-%d')
+                try:
+                    rows = self.conn.execute(
+                        f"SELECT {', '.join(columns)} FROM main.{table} WHERE timestamp >= ? AND timestamp < ?",
+                        (lower_ts, upper_ts)).fetchall()
+                    if rows:
+                        self.insert(table, rows, allow_closed=True)
+                        self.conn.execute(
+                            f"DELETE FROM main.{table} WHERE timestamp >= ? AND timestamp < ?", (lower_ts, upper_ts))
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                moved[table] += len(rows)
+                if rows:
+                    log(f"{table}: moved {len(rows)} rows of {lower_ts}..{upper_ts} to shard {month_of(lower_ts)}")
+                day = upper
+        return moved
+
+    def status(self):
+        """Returns [{'month', 'bytes', 'closed', 'sealed', table: rows, ...}, ...], oldest first."""
+        report = []
+        for month in self.months():
+            entry = {
+                'month': month,
+                'bytes': self.path(month).stat().st_size,
+                'closed': self.is_closed(month),
+                'sealed': self.is_sealed(month),
+            }
+            alias = self.attach(month)
+            for table in SHARD_TABLES:
+                entry[table] = self.conn.execute(f"SELECT COUNT(*) FROM {alias}.{table}").fetchone()[0]
+            report.append(entry)
+        return report
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('status', 'migrate', 'seal'))
+    parser.add_argument('--db', default='steam_top_games.db', help='Database file')
+    parser.add_argument('--dir', default='rank_shards', help='Shard directory')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f'Database file not found: {args.db}')
+
+    with Database(args.db, rank_shards=args.dir) as db:
+        router = db.rank_shards
+        if args.command == 'migrate':
+            moved = router.migrate()
+            print(f"Moved {sum(moved.values())} rows: {moved}")
+            print(f"Sealed: {router.seal() or 'nothing'}")
+        elif args.command == 'seal':
+            print(f"Sealed: {router.seal() or 'nothing'}")
+        for entry in router.status():
+            counts = ', '.join(f"{table} {entry[table]}" for table in SHARD_TABLES)
+            state = 'sealed' if entry['sealed'] else 'closed' if entry['closed'] else 'open'
+            print(f"{entry['month']}: {entry['bytes'] / 2**20:.1f} MiB, {state}, {counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Packed-array encoding for hourly top-seller snapshots.
+
+A snapshot stores one capture of a top list as a single RankSnapshots row instead
+of one row per rank. The place is implicit (array index + 1) and the ids, discounts
+and CCU values are little-endian int32 arrays, optionally compressed:
+
+    codec   stored bytes                     decode
+    raw     the int32 array as-is            zero-copy np.frombuffer view
+    zlib    zlib-compressed int32 array      one decompress + view
+    zstd    zstandard-compressed (optional)  one decompress + view
+
+Discounts are stored as small integer codes (see encode_discount).
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; raw and zlib always work
+    zstandard = None
+
+CODECS = ('raw', 'zlib', 'zstd')
+INT32_LE = np.dtype('<i4')
+
+# Discount codes: 0 = no discount, 1..100 = percent off, -1 = free to play.
+DISCOUNT_NONE = 0
+DISCOUNT_FREE = -1
+
+_DISCOUNT_RE = re.compile(r'(\d+)\s*%')
+
+
+def encode_discount(discount):
+    """Maps the scraped discount text ('-50%', 'Free', '') to a small integer code."""
+    if not discount:
+        return DISCOUNT_NONE
+    text = str(discount).strip()
+    if text.lower().startswith('free'):
+        return DISCOUNT_FREE
+    match = _DISCOUNT_RE.search(text)
+    return int(match.group(1)) if match else DISCOUNT_NONE
+
+
+def decode_discount(code):
+    """Inverse of encode_discount, returning the text format used in SteamTopGames."""
+    code = int(code)
+    if code == DISCOUNT_FREE:
+        return 'Free'
+    if code == DISCOUNT_NONE:
+        return ''
+    return f'-{code}%'
+
+
+def pack_int32(values, codec='raw'):
+    """Packs a sequence of ints into little-endian int32 bytes using `codec`."""
+    raw = np.asarray(values, dtype=INT32_LE).tobytes()
+    if codec == 'raw':
+        return raw
+    if codec == 'zlib':
+        return zlib.compress(raw, 6)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd codec requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    raise ValueError(f"Invalid snapshot codec: {codec}")
+
+
+def unpack_int32(blob, codec='raw'):
+    """
+    Returns a read-only int32 NumPy view over a packed array. For the raw codec the
+    view shares memory with `blob` (no copy); compressed codecs decompress once.
+    """
+    if blob is None:
+        return None
+    if codec == 'zlib':
+        blob = zlib.decompress(blob)
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd codec requires the 'zstandard' package")
+        blob = zstandard.ZstdDecompressor().decompress(blob)
+    elif codec != 'raw':
+        raise ValueError(f"Invalid snapshot codec: {codec}")
+    return np.frombuffer(blob, dtype=INT32_LE)
+
+
+def _int_id(item_id):
+    # Ids that are not integers (e.g. a PS 'N/A' placeholder) are stored as 0 so
+    # that the remaining ranks keep their positions.
+    try:
+        return int(item_id)
+    except (TypeError, ValueError):
+        return 0
+
+
+def pack_snapshot(games, id_key, place_key, ccu_key=None, codec='raw'):
+    """
+    Packs one capture (a list of game dicts as passed to insert_bulk_data) into
+    (game_count, ids, discounts, ccus) blobs ordered by place. ccus is None when
+    the source has no CCU column. Places are assumed to be contiguous from 1, which
+    is how both scrapers number their captures.
+    """
+    ordered = sorted(games, key=lambda game: game[place_key])
+    ids = pack_int32([_int_id(game[id_key]) for game in ordered], codec)
+    discounts = pack_int32([encode_discount(game.get('discount')) for game in ordered], codec)
+    ccus = pack_int32([game.get(ccu_key) or 0 for game in ordered], codec) if ccu_key else None
+    return len(ordered), ids, discounts, ccus
+
+
+def unpack_snapshot(codec, ids, discounts, ccus):
+    """Decodes a RankSnapshots row into {'ids', 'discounts', 'ccus'} int32 arrays."""
+    return {
+        'ids': unpack_int32(ids, codec),
+        'discounts': unpack_int32(discounts, codec),
+        'ccus': unpack_int32(ccus, codec),
+    }
+
+
+def ranks_over_time(id_arrays, wanted_ids):
+    """
+    Returns {id: [place, ...]} for every id of `wanted_ids`, with one place per
+    snapshot it appears in, in the order of `id_arrays`. All snapshots are matched in
+    a single vectorized pass over their concatenation.
+    """
+    if not id_arrays:
+        return {}
+    wanted = np.asarray([_int_id(item_id) for item_id in wanted_ids], dtype=INT32_LE)
+    lengths = np.fromiter((len(ids) for ids in id_arrays), dtype=np.int64, count=len(id_arrays))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    flat = np.concatenate(id_arrays)
+
+    positions = np.nonzero(np.isin(flat, wanted))[0]
+    places = positions - np.repeat(starts, lengths)[positions] + 1
+
+    ranks = {}
+    for item_id, place in zip(flat[positions].tolist(), places.tolist()):
+        ranks.setdefault(item_id, []).append(place)
+    return ranks
@@ -0,0 +1,138 @@
+"""
+LRU cache for Database read results, invalidated by per-table data versions.
+
+Every table has a process-wide version counter per database file. Database write
+methods bump the counters of the tables they touched once their transaction has
+committed, and cached reads are keyed by
+
+    (method, database, args, versions of the tables the method reads)
+
+so a write makes every affected entry unreachable and a cached result is never older
+than the last committed write made through this process. Writes from other processes
+are not seen; the bot is the only writer of steam_top_games.db.
+
+    @cached_read('SteamTopGames', 'GameTranslation', daily=True)
+    def get_gts_placements(self, game_name): ...
+
+Results are copied on the way in and out, so callers may modify what they get back.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+DEFAULT_MAXSIZE = 512
+
+# (database key, table) -> version, shared by every Database in the process.
+_DATA_VERSIONS = {}
+_VERSIONS_LOCK = threading.Lock()
+
+
+def bump_data_version(db_key, *tables):
+    """Marks `tables` of the database identified by db_key as changed; returns {table: new version}."""
+    with _VERSIONS_LOCK:
+        versions = {}
+        for table in tables:
+            versions[table] = _DATA_VERSIONS[(db_key, table)] = _DATA_VERSIONS.get((db_key, table), 0) + 1
+        return versions
+
+
+def data_versions(db_key, tables):
+    """Returns the current versions of `tables` as a tuple."""
+    with _VERSIONS_LOCK:
+        return tuple(_DATA_VERSIONS.get((db_key, table), 0) for table in tables)
+
+
+def _freeze(value):
+    # Lists, sets and dicts passed as arguments (e.g. a list of appids) become hashable.
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+class ResultCache:
+    """Thread-safe LRU mapping with hit, miss and eviction counters."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, copy.deepcopy(self._entries[key])
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by every Database in the process (AsyncDatabase readers included).
+RESULT_CACHE = ResultCache()
+
+
+def cached_read(*tables, daily=False):
+    """
+    Caches a Database read method on its arguments and the data versions of `tables`.
+    Methods whose result depends on today's date (e.g. "the last 90 days") pass
+    daily=True so their entries also expire at midnight.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = self.result_cache
+            if cache is None:
+                return method(self, *args, **kwargs)
+
+            db_key = self._process_cache_key()
+            try:
+                key = (method.__name__, db_key, _freeze(args), _freeze(kwargs),
+                       data_versions(db_key, tables), date.today() if daily else None)
+                hash(key)
+            except TypeError:
+                return method(self, *args, **kwargs)
+
+            hit, value = cache.get(key)
+            if hit:
+                return value
+            value = method(self, *args, **kwargs)
+            cache.put(key, value)
+            return value
+        return wrapper
+    return decorator
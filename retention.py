@@ -0,0 +1,274 @@
+"""
+Tiered retention for steam_top_games.db.
+
+Recent history stays in SQLite at full resolution; anything older than the
+retention window is moved to date-partitioned Parquet files under ARCHIVE_DIR:
+
+    archive/SteamTopGames/date=2025-03-01/part-0.parquet
+
+  * SteamTopGames / PSTopGames: every hourly row older than the window is archived
+    and deleted. DailyPlacementRollup (checked against the raw rows first) remains
+    the daily-granularity record in the live database, so the placement getters keep
+    covering the full history. With rank shards (rank_shards.py) the rows of the main
+    tables and of unsealed shards are deleted in place; sealed shards are read-only,
+    so their days are archived and the shard file is deleted once its whole month is
+    past the window and archived.
+  * ShortPositions / PositionHolders: only the last row per key and day is kept in
+    the database; the superseded intra-day rows are archived.
+
+read_history() / read_rank_history() union the archive with the live database for
+queries that need the raw rows over a long range.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from database import EPOCH, Database, RANK_TABLE_SOURCES, RANK_V2_TABLES, day_range_bounds, hour_bounds
+from general_utils import log_message, get_seconds_until
+from rank_shards import SHARD_TABLES
+
+ARCHIVE_DIR = 'archive'
+RETENTION_DAYS = 120
+DELETE_CHUNK = 500
+
+# Tables covered by retention: table -> key columns that survive compaction
+# (one row per key and day), or None to archive every row past the window.
+RETENTION_TABLES = {
+    'SteamTopGames': None,
+    'PSTopGames': None,
+    'ShortPositions': ('lei', 'company_name'),
+    'PositionHolders': ('entity_name', 'issuer_name', 'isin'),
+}
+
+
+def _partition_path(archive_dir, table, day):
+    return os.path.join(archive_dir, table, f"date={day}", "part-0.parquet")
+
+
+def _write_partition(archive_dir, table, day, frame):
+    """
+    Writes (or extends) the Parquet partition of one table and day. Rows already in the
+    partition are not duplicated, so re-running after an interrupted job is safe.
+    """
+    path = _partition_path(archive_dir, table, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        # id alone is not unique across rank shards; a row is also identified by its hour
+        frame = pd.concat([pd.read_parquet(path), frame]).drop_duplicates(['id', 'timestamp'], keep='last')
+    tmp_path = f"{path}.tmp"
+    frame.sort_values(['timestamp', 'id']).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _schemas(db, table, start=None, end=None):
+    """The schemas holding rows of `table` between start and end: main, plus rank shards."""
+    return db.rank_schemas(start, end) if table in RANK_TABLE_SOURCES else ['main']
+
+
+def _is_sealed(db, schema):
+    month = db.rank_shards.schema_month(schema) if db.rank_shards is not None else None
+    return month is not None and db.rank_shards.is_sealed(month)
+
+
+def days_to_compact(db, table, cutoff_date, archive_dir=ARCHIVE_DIR):
+    """
+    Returns the dates ('YYYY-MM-DD') of `table` rows older than cutoff_date. Days held
+    by sealed rank shards are left out once archived (see drop_archived_shards).
+    """
+    if db.rank_schema == 'v2' and table in RANK_V2_TABLES:
+        # Whole days of the indexed hour column instead of substr() over the view
+        _, upper = hour_bounds(None, cutoff_date)
+        db.cursor.execute(
+            f"SELECT DISTINCT hour / 24 FROM {RANK_V2_TABLES[table]} WHERE hour <= ? ORDER BY 1", (upper,))
+        return [(EPOCH + timedelta(days=day)).strftime('%Y-%m-%d') for day, in db.cursor.fetchall()]
+    days = set()
+    for schema in _schemas(db, table, None, cutoff_date):
+        db.cursor.execute(
+            f"SELECT DISTINCT substr(timestamp, 1, 10) FROM {schema}.{table} WHERE timestamp < ?", (cutoff_date,))
+        schema_days = {row[0] for row in db.cursor.fetchall() if row[0]}
+        if _is_sealed(db, schema):
+            schema_days -= set(_archived_days(archive_dir, table, min(schema_days, default=''), cutoff_date))
+        days |= schema_days
+    return sorted(days)
+
+
+def compact_day(db, table, day, archive_dir=ARCHIVE_DIR):
+    """
+    Archives and removes the rows of `table` for one day that fall outside the live
+    retention policy. The Parquet partition is written before anything is deleted.
+    Returns the number of rows archived.
+    """
+    lower, upper = day_range_bounds(day, day)
+    frames = []
+    writable = []
+    for schema in _schemas(db, table, lower, lower):
+        source, source_params = db.rank_row_source(table, lower, upper, schema)
+        frame = db.read_frame(f"SELECT * FROM {source} ORDER BY timestamp, id", source_params)
+        if not frame.empty:
+            frames.append(frame)
+            if not _is_sealed(db, schema):
+                writable.append(schema)
+    if not frames:
+        return 0
+    frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    keys = RETENTION_TABLES[table]
+    if keys is None:
+        # Make sure the daily rollup reflects every raw row before they go away.
+        db.refresh_daily_rollup_date(RANK_TABLE_SOURCES[table], day)
+        archived = frame
+    else:
+        archived = frame[frame.duplicated(list(keys), keep='last')]
+        if archived.empty:
+            return 0
+
+    _write_partition(archive_dir, table, day, archived)
+
+    try:
+        if keys is None and db.rank_schema == 'v2' and table in RANK_V2_TABLES:
+            db.cursor.execute(
+                f"DELETE FROM {RANK_V2_TABLES[table]} WHERE hour >= ? AND hour <= ?", hour_bounds(lower, upper))
+        elif keys is None:
+            # Sealed shards are immutable; their rows go with the file (drop_archived_shards)
+            for schema in writable:
+                db.cursor.execute(
+                    f"DELETE FROM {schema}.{table} WHERE timestamp >= ? AND timestamp < ?", (lower, upper))
+        else:
+            ids = archived['id'].tolist()
+            for start in range(0, len(ids), DELETE_CHUNK):
+                chunk = ids[start:start + DELETE_CHUNK]
+                db.cursor.execute(
+                    f"DELETE FROM {table} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    db.invalidate(table)
+    return len(archived)
+
+
+def run_retention(db, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, tables=None):
+    """
+    Applies the retention policy to every table in RETENTION_TABLES (or `tables`),
+    one day at a time. Returns {table: rows archived}.
+    """
+    cutoff_date = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    archived = {}
+    for table in tables or RETENTION_TABLES:
+        archived[table] = sum(
+            compact_day(db, table, day, archive_dir) for day in days_to_compact(db, table, cutoff_date, archive_dir))
+    dropped = drop_archived_shards(db, cutoff_date, archive_dir)
+    if dropped:
+        log_message(f"Retention deleted the archived rank shards {', '.join(dropped)}.")
+    return archived
+
+
+def drop_archived_shards(db, cutoff_date, archive_dir=ARCHIVE_DIR):
+    """
+    Deletes the sealed rank shards whose month ends before cutoff_date and whose days
+    all have an archive partition. Returns the months dropped.
+    """
+    if db.rank_shards is None:
+        return []
+    router = db.rank_shards
+    dropped = []
+    for month in router.months():
+        next_month = (datetime.strptime(month, '%Y_%m').replace(day=28) + timedelta(days=4)).replace(day=1)
+        if next_month.strftime('%Y-%m-%d') > cutoff_date or not router.is_sealed(month):
+            continue
+        schema = router.attach(month)
+        archived = True
+        for table in SHARD_TABLES:
+            db.cursor.execute(f"SELECT DISTINCT substr(timestamp, 1, 10) FROM {schema}.{table}")
+            days = {row[0] for row in db.cursor.fetchall() if row[0]}
+            if days - set(_archived_days(archive_dir, table, min(days, default=''), cutoff_date)):
+                archived = False
+                break
+        if archived:
+            router.drop(month)
+            dropped.append(month)
+    return dropped
+
+
+def _archived_days(archive_dir, table, start_date, end_date):
+    table_dir = os.path.join(archive_dir, table)
+    if not os.path.isdir(table_dir):
+        return []
+    days = []
+    for name in os.listdir(table_dir):
+        if name.startswith('date='):
+            day = name[len('date='):]
+            if start_date <= day <= end_date:
+                days.append(day)
+    return sorted(days)
+
+
+def read_history(db, table, start_date, end_date, archive_dir=ARCHIVE_DIR, **equals):
+    """
+    Returns the rows of `table` between start_date and end_date (inclusive,
+    'YYYY-MM-DD') as one DataFrame, combining archived Parquet partitions with the live
+    database. Keyword arguments filter on column equality, e.g. appid='1234'.
+    """
+    if table not in RETENTION_TABLES:
+        raise ValueError(f"Invalid table name: {table}")
+
+    frames = []
+    for day in _archived_days(archive_dir, table, start_date, end_date):
+        frame = pd.read_parquet(_partition_path(archive_dir, table, day))
+        for column, value in equals.items():
+            frame = frame[frame[column].astype(str) == str(value)]
+        frames.append(frame)
+
+    lower, upper = day_range_bounds(start_date, end_date)
+    conditions = ' AND '.join(f"{column} = ?" for column in equals)
+    for schema in _schemas(db, table, lower, upper):
+        source, source_params = db.rank_row_source(table, lower, upper, schema)
+        frames.append(db.read_frame(
+            f"SELECT * FROM {source}{f' WHERE {conditions}' if conditions else ''}",
+            (*source_params, *equals.values())))
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return db.read_frame(f"SELECT * FROM {table} WHERE 0")
+    history = pd.concat(frames, ignore_index=True)
+    return history.drop_duplicates(['id', 'timestamp']).sort_values(['timestamp', 'id'], ignore_index=True)
+
+
+def read_rank_history(db, table, item_id, start_date, end_date, archive_dir=ARCHIVE_DIR):
+    """Returns [(timestamp, place), ...] for one appid/ps_id across archive and live DB."""
+    id_column = 'appid' if table == 'SteamTopGames' else 'ps_id'
+    history = read_history(db, table, start_date, end_date, archive_dir, **{id_column: str(item_id)})
+    return list(zip(history['timestamp'], history['place'].astype(int)))
+
+
+def retention_pass(db_name, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, **db_options):
+    """
+    run_retention on a Database connection of its own, for a worker thread. Logs what
+    was archived and returns {table: rows archived}.
+    """
+    cutoff_date = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    with Database(db_name, **db_options) as db:
+        archived = run_retention(db, retention_days, archive_dir)
+    for table, rows in archived.items():
+        if rows:
+            log_message(f'Retention archived {rows} {table} rows older than {cutoff_date}.')
+    return archived
+
+
+async def daily_retention_task(db, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+    """
+    Runs the retention policy every night at 04:00. Archiving reads and writes whole
+    days of rows, so the pass runs in a worker thread; `db` is the bot's AsyncDatabase.
+    """
+    while True:
+        next_run = datetime.now() + timedelta(seconds=get_seconds_until(4, 0))
+        log_message(f'Waiting until {next_run.strftime("%Y-%m-%d %H:%M")} to run database retention.')
+        await asyncio.sleep(get_seconds_until(4, 0))
+
+        try:
+            await asyncio.to_thread(retention_pass, db.db_name, retention_days, archive_dir, **db.db_options)
+        except Exception as e:
+            log_message(f'Retention run failed: {type(e).__name__}: {e}')
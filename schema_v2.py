@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Online migration of the rank tables to the integer-keyed v2 schema.
+
+SteamTopGames / PSTopGames store text appids / ps_ids, 'YYYY-MM-DD HH' timestamps and
+a free-text discount on every row. The v2 tables (RANK_V2_SCHEMA in database.py)
+store the same rows as integers:
+
+    SteamRanksV2 (id, hour, place, appid, discount, ccu)   hour = hours since 1970-01-01
+    PSRanksV2    (id, hour, place, ps_id, discount)
+    Discounts    (code, label)
+
+The migration runs while the bot keeps writing:
+
+  1. copy   - rows are copied in id order, chunk_size rows per transaction. The copy
+              resumes from the highest id already in the v2 table, so it can be
+              stopped and restarted at any point.
+  2. flip   - in one transaction: copy the rows written since, drop v2 rows that
+              retention deleted meanwhile, verify row counts and place sums, rename
+              the v1 tables to *_v1 and replace them with views (plus INSTEAD OF
+              INSERT/DELETE triggers) over the v2 tables.
+
+After the flip every query written against SteamTopGames / PSTopGames keeps working
+through the views, and a Database opened afterwards (rank_schema == 'v2') reads its
+hot paths from the v2 tables directly. `revert` moves back to the v1 tables
+(including rows written after the flip); `drop-v1` frees the old tables once the
+new layout has proven itself.
+
+Usage:
+    python schema_v2.py status --db steam_top_games.db
+    python schema_v2.py migrate --db steam_top_games.db [--chunk-size 50000] [--pause 0.05]
+    python schema_v2.py revert --db steam_top_games.db
+    python schema_v2.py drop-v1 --db steam_top_games.db
+    python schema_v2.py compare [--days 90]    # size / latency on a synthetic database
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import Database, RANK_V2_SCHEMA, day_range_bounds
+
+CHUNK_SIZE = 50000
+
+# Hours since the epoch for a 'YYYY-MM-DD HH' column, and back, in SQL
+_HOUR_SQL = "CAST(strftime('%s', {column} || ':00') AS INTEGER) / 3600"
+_TIMESTAMP_SQL = "strftime('%Y-%m-%d %H', {column} * 3600, 'unixepoch')"
+
+V2_TABLES = {
+    'SteamTopGames': {
+        'v2_table': 'SteamRanksV2',
+        'columns': 'id, timestamp, place, appid, discount, ccu',
+        # Rows the integer layout cannot represent
+        'invalid': '''SELECT COUNT(*) FROM {source}
+                      WHERE timestamp IS NULL OR place IS NULL
+                         OR appid IS NULL OR appid = '' OR appid GLOB '*[^0-9]*' ''',
+        'intern': [
+            "INSERT OR IGNORE INTO Discounts (label) SELECT DISTINCT discount FROM ({chunk}) WHERE discount IS NOT NULL",
+        ],
+        'copy': '''
+            INSERT INTO SteamRanksV2 (id, hour, place, appid, discount, ccu)
+            SELECT id, {hour}, place, CAST(appid AS INTEGER),
+                   (SELECT code FROM Discounts WHERE label = chunk.discount), ccu
+            FROM ({chunk}) AS chunk
+        ''',
+        'view': '''
+            CREATE VIEW SteamTopGames AS
+            SELECT r.id AS id, {timestamp} AS timestamp, r.place AS place,
+                   CAST(r.appid AS TEXT) AS appid, d.label AS discount, r.ccu AS ccu
+            FROM SteamRanksV2 AS r
+            LEFT JOIN Discounts AS d ON d.code = r.discount
+        ''',
+        'insert_trigger': '''
+            CREATE TRIGGER steamtopgames_v2_insert INSTEAD OF INSERT ON SteamTopGames BEGIN
+                INSERT OR IGNORE INTO Discounts (label) SELECT new.discount WHERE new.discount IS NOT NULL;
+                INSERT INTO SteamRanksV2 (id, hour, place, appid, discount, ccu)
+                VALUES (new.id, {hour}, new.place, CAST(new.appid AS INTEGER),
+                        (SELECT code FROM Discounts WHERE label = new.discount), new.ccu);
+            END
+        ''',
+        'delete_trigger': '''
+            CREATE TRIGGER steamtopgames_v2_delete INSTEAD OF DELETE ON SteamTopGames BEGIN
+                DELETE FROM SteamRanksV2 WHERE id = old.id;
+            END
+        ''',
+    },
+    'PSTopGames': {
+        'v2_table': 'PSRanksV2',
+        'columns': 'id, timestamp, place, ps_id, discount',
+        # PS ids are numeric, as PSGameTranslation.ps_id (INTEGER PRIMARY KEY) requires
+        'invalid': '''SELECT COUNT(*) FROM {source}
+                      WHERE timestamp IS NULL OR place IS NULL
+                         OR ps_id IS NULL OR ps_id = '' OR ps_id GLOB '*[^0-9]*' ''',
+        'intern': [
+            "INSERT OR IGNORE INTO Discounts (label) SELECT DISTINCT discount FROM ({chunk}) WHERE discount IS NOT NULL",
+        ],
+        'copy': '''
+            INSERT INTO PSRanksV2 (id, hour, place, ps_id, discount)
+            SELECT id, {hour}, place, CAST(ps_id AS INTEGER),
+                   (SELECT code FROM Discounts WHERE label = chunk.discount)
+            FROM ({chunk}) AS chunk
+        ''',
+        'view': '''
+            CREATE VIEW PSTopGames AS
+            SELECT r.id AS id, {timestamp} AS timestamp, r.place AS place,
+                   CAST(r.ps_id AS TEXT) AS ps_id, d.label AS discount
+            FROM PSRanksV2 AS r
+            LEFT JOIN Discounts AS d ON d.code = r.discount
+        ''',
+        'insert_trigger': '''
+            CREATE TRIGGER pstopgames_v2_insert INSTEAD OF INSERT ON PSTopGames BEGIN
+                INSERT OR IGNORE INTO Discounts (label) SELECT new.discount WHERE new.discount IS NOT NULL;
+                INSERT INTO PSRanksV2 (id, hour, place, ps_id, discount)
+                VALUES (new.id, {hour}, new.place, CAST(new.ps_id AS INTEGER),
+                        (SELECT code FROM Discounts WHERE label = new.discount));
+            END
+        ''',
+        'delete_trigger': '''
+            CREATE TRIGGER pstopgames_v2_delete INSTEAD OF DELETE ON PSTopGames BEGIN
+                DELETE FROM PSRanksV2 WHERE id = old.id;
+            END
+        ''',
+    },
+}
+
+
+def _chunk_query(source, after_id, limit):
+    columns = V2_TABLES[source]['columns']
+    return f"SELECT {columns} FROM {source} WHERE id > {int(after_id)} ORDER BY id LIMIT {int(limit)}"
+
+
+def _object_type(db, name):
+    row = db.conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def is_flipped(db):
+    return _object_type(db, 'SteamTopGames') == 'view'
+
+
+def _last_copied_id(db, source):
+    v2_table = V2_TABLES[source]['v2_table']
+    return db.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {v2_table}").fetchone()[0]
+
+
+def _copy_chunk(db, source, chunk_size):
+    """Copies the next chunk_size rows of `source` into its v2 table. Returns the rows copied."""
+    spec = V2_TABLES[source]
+    chunk = _chunk_query(source, _last_copied_id(db, source), chunk_size)
+    for query in spec['intern']:
+        db.cursor.execute(query.format(chunk=chunk))
+    db.cursor.execute(spec['copy'].format(chunk=chunk, hour=_HOUR_SQL.format(column='chunk.timestamp')))
+    return db.cursor.rowcount
+
+
+def status(db):
+    """Returns {table: {'rows', 'copied', 'flipped'}} for both rank tables."""
+    report = {}
+    flipped = is_flipped(db)
+    for source, spec in V2_TABLES.items():
+        v1_table = f"{source}_v1" if flipped else source
+        has_v2 = _object_type(db, spec['v2_table']) == 'table'
+        report[source] = {
+            'rows': db.conn.execute(f"SELECT COUNT(*) FROM {v1_table}").fetchone()[0],
+            'copied': db.conn.execute(f"SELECT COUNT(*) FROM {spec['v2_table']}").fetchone()[0] if has_v2 else 0,
+            'flipped': flipped,
+        }
+    return report
+
+
+def copy_tables(db, chunk_size=CHUNK_SIZE, pause=0.0, progress=None):
+    """
+    Creates the v2 tables and copies every v1 row into them, one chunk per transaction.
+    Raises ValueError if a table holds rows the v2 layout cannot represent.
+    Returns {table: rows copied by this call}.
+    """
+    for statement in RANK_V2_SCHEMA:
+        db.cursor.execute(statement)
+    db.conn.commit()
+
+    for source, spec in V2_TABLES.items():
+        invalid = db.conn.execute(spec['invalid'].format(source=source)).fetchone()[0]
+        if invalid:
+            raise ValueError(f"{source} has {invalid} rows with a missing timestamp/place or a non-integer id")
+
+    copied = {}
+    for source in V2_TABLES:
+        copied[source] = 0
+        while True:
+            try:
+                rows = _copy_chunk(db, source, chunk_size)
+                db.conn.commit()
+            except Exception:
+                db.conn.rollback()
+                raise
+            if rows <= 0:
+                break
+            copied[source] += rows
+            if progress:
+                progress(source, copied[source])
+            if pause:
+                # Leave room for the bot's own writes between chunks.
+                time.sleep(pause)
+    return copied
+
+
+def _verify(db, source, v1_table):
+    v2_table = V2_TABLES[source]['v2_table']
+    expected = db.conn.execute(f"SELECT COUNT(*), COALESCE(SUM(place), 0) FROM {v1_table}").fetchone()
+    actual = db.conn.execute(f"SELECT COUNT(*), COALESCE(SUM(place), 0) FROM {v2_table}").fetchone()
+    if expected != actual:
+        raise RuntimeError(
+            f"{source}: v1 has {expected[0]} rows (place sum {expected[1]}), "
+            f"{v2_table} has {actual[0]} rows (place sum {actual[1]})")
+
+
+def flip(db, chunk_size=CHUNK_SIZE):
+    """
+    Catches up with rows written since copy_tables, verifies both tables and replaces
+    SteamTopGames / PSTopGames with views over the v2 tables, in one transaction.
+    """
+    if is_flipped(db):
+        return
+    try:
+        db.cursor.execute("BEGIN IMMEDIATE")
+        for source, spec in V2_TABLES.items():
+            while _copy_chunk(db, source, chunk_size) > 0:
+                pass
+            # Rows retention removed from v1 after they were copied
+            db.cursor.execute(
+                f"DELETE FROM {spec['v2_table']} WHERE id NOT IN (SELECT id FROM {source})")
+            _verify(db, source, source)
+
+            db.cursor.execute(f"ALTER TABLE {source} RENAME TO {source}_v1")
+            db.cursor.execute(spec['view'].format(timestamp=_TIMESTAMP_SQL.format(column='r.hour')))
+            db.cursor.execute(spec['insert_trigger'].format(hour=_HOUR_SQL.format(column='new.timestamp')))
+            db.cursor.execute(spec['delete_trigger'])
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    db.rank_schema = db._detect_rank_schema()
+    db.invalidate(*V2_TABLES)
+
+
+def migrate(db, chunk_size=CHUNK_SIZE, pause=0.0, progress=None):
+    """copy_tables followed by flip. Returns {table: rows copied}."""
+    copied = copy_tables(db, chunk_size, pause, progress)
+    flip(db, chunk_size)
+    return copied
+
+
+def revert(db):
+    """
+    Restores the v1 tables, including every row written through the views since the
+    flip. The v2 tables are kept, so a later migrate resumes from them.
+    """
+    if not is_flipped(db):
+        return
+    try:
+        db.cursor.execute("BEGIN IMMEDIATE")
+        for source, spec in V2_TABLES.items():
+            v1_table = f"{source}_v1"
+            columns = spec['columns']
+            db.cursor.execute(f'''
+                INSERT INTO {v1_table} ({columns})
+                SELECT {columns} FROM {source}
+                WHERE id > (SELECT COALESCE(MAX(id), 0) FROM {v1_table})
+            ''')
+            db.cursor.execute(
+                f"DELETE FROM {v1_table} WHERE id NOT IN (SELECT id FROM {spec['v2_table']})")
+            db.cursor.execute(f"DROP VIEW {source}")
+            db.cursor.execute(f"ALTER TABLE {v1_table} RENAME TO {source}")
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    db.rank_schema = db._detect_rank_schema()
+    db.invalidate(*V2_TABLES)
+
+
+def drop_v1(db):
+    """Drops the *_v1 tables left by flip. The space is reused by SQLite (or freed by VACUUM)."""
+    if not is_flipped(db):
+        raise RuntimeError('The rank tables have not been migrated to v2')
+    for source in V2_TABLES:
+        db.cursor.execute(f"DROP TABLE IF EXISTS {source}_v1")
+    db.conn.commit()
+
+
+def _object_bytes(db, names):
+    placeholders = ','.join('?' * len(names))
+    return db.conn.execute(
+        f"SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN ({placeholders})", names).fetchone()[0]
+
+
+def _table_and_indexes(db, table):
+    rows = db.conn.execute(
+        "SELECT name FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index')", (table,))
+    return [name for name, in rows]
+
+
+def _time_calls(calls, repeat):
+    timings = {}
+    for label, call in calls:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best * 1000
+    return timings
+
+
+def compare(days=90, repeat=20):
+    """
+    Builds a synthetic database, times the raw-row getters, migrates it and times them
+    again. Returns {'bytes': {...}, 'v1_ms': {...}, 'v2_ms': {...}, 'migrate_s': seconds}.
+    """
+    from db_benchmark import populate_synthetic_ranks, synthetic_steam_capture
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with Database(os.path.join(tmp, 'schema_v2.db'), cache_results=False) as db:
+            db.create_tables()
+            populate_synthetic_ranks(db, days)
+            latest = db.get_latest_timestamp('SteamTopGames')
+            top_appids = [appid for appid, in db.conn.execute(
+                "SELECT appid FROM SteamTopGames WHERE timestamp = ? ORDER BY place LIMIT 25", (latest,))]
+            next_hour = (datetime.strptime(latest, '%Y-%m-%d %H') + timedelta(hours=1)).strftime('%Y-%m-%d %H')
+            yesterday = (datetime.strptime(latest, '%Y-%m-%d %H') - timedelta(days=1)).strftime('%Y-%m-%d')
+            day_lower, day_upper = day_range_bounds(yesterday, yesterday)
+
+            def calls():
+                return (
+                    ('get_yesterday_top_games(Steam)', lambda: db.get_yesterday_top_games(latest)),
+                    ('get_yesterday_top_games(PS)', lambda: db.get_yesterday_top_games(latest, 'PSTopGames')),
+                    ('get_last_week_ranks', lambda: db.get_last_week_ranks(latest, top_appids)),
+                    # One-day range read (refresh_daily_rollup_date, retention, exports)
+                    ('one-day range (_rank_rows)', lambda: db._rank_rows(
+                        'SteamTopGames', 'COUNT(*), SUM(place)', day_lower, day_upper)),
+                    # The same range through SteamTopGames itself, a view after the flip
+                    ('one-day range (table/view)', lambda: db.conn.execute(
+                        "SELECT COUNT(*), SUM(place) FROM SteamTopGames WHERE timestamp >= ? AND timestamp <= ?",
+                        (day_lower, day_upper)).fetchall()),
+                )
+
+            sizes = {'v1': sum(_object_bytes(db, _table_and_indexes(db, table)) for table in V2_TABLES)}
+            v1_ms = _time_calls(calls(), repeat)
+
+            start = time.perf_counter()
+            migrate(db)
+            migrate_s = time.perf_counter() - start
+
+            sizes['v2'] = sum(_object_bytes(db, _table_and_indexes(db, table))
+                              for table in ('SteamRanksV2', 'PSRanksV2', 'Discounts'))
+            v2_ms = _time_calls(calls(), repeat)
+
+            # One capture written through the compatibility view
+            capture = synthetic_steam_capture(next_hour, [int(appid) for appid in top_appids])
+            start = time.perf_counter()
+            db.insert_bulk_data(capture)
+            v2_ms['insert_bulk_data(via view)'] = (time.perf_counter() - start) * 1000
+            return {'bytes': sizes, 'v1_ms': v1_ms, 'v2_ms': v2_ms, 'migrate_s': migrate_s}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('status', 'migrate', 'revert', 'drop-v1', 'compare'))
+    parser.add_argument('--db', default='steam_top_games.db', help='Database file')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows copied per transaction')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+    parser.add_argument('--days', type=int, default=90, help='Days of synthetic history for compare')
+    parser.add_argument('--repeat', type=int, default=20, help='Timing repetitions for compare')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        print(f"Comparing v1 and v2 rank tables over {args.days} days of synthetic history...")
+        report = compare(args.days, args.repeat)
+        v1_bytes, v2_bytes = report['bytes']['v1'], report['bytes']['v2']
+        print(f"  size: v1 {v1_bytes / 2**20:.2f} MiB, v2 {v2_bytes / 2**20:.2f} MiB "
+              f"({100 * (1 - v2_bytes / v1_bytes):.0f}% smaller)")
+        print(f"  migration: {report['migrate_s']:.2f} s")
+        for label, v2_ms in report['v2_ms'].items():
+            v1_ms = report['v1_ms'].get(label)
+            before = f"{v1_ms:8.2f} ms" if v1_ms is not None else f"{'-':>11}"
+            print(f"  {label:<32} v1 {before}   v2 {v2_ms:8.2f} ms")
+        return
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f'Database file not found: {args.db}')
+
+    with Database(args.db) as db:
+        if args.command == 'status':
+            for table, info in status(db).items():
+                print(f"{table}: {info['copied']}/{info['rows']} rows copied, flipped: {info['flipped']}")
+        elif args.command == 'migrate':
+            copied = migrate(db, args.chunk_size, args.pause,
+                             progress=lambda table, rows: print(f"  {table}: {rows} rows copied"))
+            print(f"Migrated ({', '.join(f'{table}: {rows}' for table, rows in copied.items())} rows copied). "
+                  "Restart the bot to use the v2 read paths.")
+        elif args.command == 'revert':
+            revert(db)
+            print('Rank tables restored to v1.')
+        else:
+            drop_v1(db)
+            print('Dropped SteamTopGames_v1 and PSTopGames_v1.')
+
+
+if __name__ == '__main__':
+    main()
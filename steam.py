@@ -1,12 +1,13 @@
 from datetime import datetime, timedelta
-from general_utils import get_seconds_until, normalize_game_name_for_search, generate_gts_placements_plot
-import aiohttp
-from bs4 import BeautifulSoup
-from database import Database
+from general_utils import get_seconds_until, generate_gts_placements_plot
+from async_database import AsyncDatabase
 import database
-from general_utils import log_message, error_message, aiohttp_retry
+from general_utils import log_message, error_message
 from matplotlib import rcParams
 from pipeline import BasePipeline
+from steam_ccu import SteamCCUProvider
+from steam_crawler import SteamTopSellerCrawler
+from top_list_cache import TopListSnapshot
 import os
 import asyncio
 import numpy as np
@@ -14,130 +15,45 @@ import matplotlib.pyplot as plt
 import io
 import discord
 import re
-import difflib
 
 STEAM_API_KEY = os.getenv('STEAM_API_KEY')
 
-@aiohttp_retry()
-async def fetch_ccu(appid):
-    url = f"http://api.steampowered.com/ISteamUserStats/GetNumberOfCurrentPlayers/v1/?key={STEAM_API_KEY}&appid={appid}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            data = await response.json()
-    if data['response']['result'] == 1:
-        ccu = data['response']['player_count']
-    else:
-        ccu = 0
-    return ccu
-
-def get_best_game_match(user_query, db):
-    cursor = db.conn.execute("SELECT game_name FROM GameTranslation")
-    original_game_names = [row[0] for row in cursor.fetchall()]
-    if not original_game_names:
-        return None
-
-    q = normalize_game_name_for_search(user_query)
-    if not q:
-        return None
-
-    pairs = []
-    for orig in original_game_names:
-        norm = normalize_game_name_for_search(orig)
-        if norm:
-            pairs.append((norm, orig))
-
-    # 1) word‐level match: all tokens must match whole words
-    query_tokens = q.split()
-    word_matches = [
-        (norm, orig) for norm, orig in pairs
-        if all(token in norm.split() for token in query_tokens)
-    ]
-    if word_matches:
-        word_matches.sort(key=lambda x: len(x[0]))
-        return word_matches[0][1]
-
-    # 2) prefix match
-    prefix = [p for p in pairs if p[0].startswith(q)]
-    if prefix:
-        return min(prefix, key=lambda x: len(x[0]))[1]
-
-    # 3) substring match
-    substr = [p for p in pairs if q in p[0]]
-    if substr:
-        return min(substr, key=lambda x: len(x[0]))[1]
-
-    # 4) difflib fallback
-    names = [p[0] for p in pairs]
-    close = difflib.get_close_matches(q, names, n=1, cutoff=0.75)
-    if close:
-        return next(orig for norm, orig in pairs if norm == close[0])
-
-    return None
-
-
-async def update_steam_top_sellers(db: Database, write_db: bool = True) -> list: # Changed dict to list
-    # Phase 1: paginate and collect metadata (no CCU or DB writes)
-    preliminary = []
-    current_rank = 0
-    latest_ts = db.get_latest_timestamp('SteamTopGames')
+# Shared by every capture so requests reuse pooled connections
+TOP_SELLER_CRAWLER = SteamTopSellerCrawler()
+CCU_PROVIDER = SteamCCUProvider(STEAM_API_KEY)
+
+async def get_best_game_match(user_query, db):
+    # Word-level, prefix, substring, then difflib-style fuzzy match (see name_index.py)
+    return await db.match_game_name('steam', user_query)
+
+
+async def update_steam_top_sellers(db: AsyncDatabase, write_db: bool = True) -> list: # Changed dict to list
+    # Phase 1: fetch every chart page concurrently (no CCU or DB writes)
+    latest_ts = await db.get_latest_timestamp('SteamTopGames')
     latest_dt = None
     if latest_ts:
         latest_dt = datetime.strptime(latest_ts, '%Y-%m-%d %H')
     now_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
 
-    async with aiohttp.ClientSession() as session:
-        for page in range(5):
-            start = page * 100
-            url = (
-                "https://store.steampowered.com/search/results/"
-                f"?query&start={start}&count=100&dynamic_data=&sort_by=_ASC"
-                "&supportedlang=english&snr=1_7_7_globaltopsellers_7"
-                "&filter=globaltopsellers&infinite=1"
-            )
-            try:
-                async with session.get(url) as resp:
-                    resp.raise_for_status()
-                    html = (await resp.json()).get("results_html", "")
-            except Exception as e:
-                error_message(f"Steam page {page+1} fetch error: {e}")
-                if page < 4: await asyncio.sleep(0.1)
-                continue
-
-            soup = BeautifulSoup(html, 'html.parser')
-            for d in soup.select('.search_result_row'):
-                appid = d.get('data-ds-appid')
-                if not appid:
-                    continue
-                title = d.select_one('.title').text.strip() if d.select_one('.title') else "Unknown"
-                disc = d.select_one('.discount_pct')
-                price = d.select_one('.discount_final_price, .search_price')
-                discount = disc.text.strip() if disc else ("Free" if price and "free" in price.text.lower() else "")
-                current_rank += 1
-                preliminary.append({
-                    'rank': current_rank,
-                    'appid': appid,
-                    'title': title,
-                    'discount': discount
-                })
-            if page < 4:
-                await asyncio.sleep(0.1)
+    capture = await TOP_SELLER_CRAWLER.crawl()
+    preliminary = capture['games']
+    log_message(f"Fetched {len(preliminary)} Steam top sellers from "
+                f"{TOP_SELLER_CRAWLER.pages - len(capture['missing_pages'])} pages in {capture['elapsed_s']:.2f} s.")
+    for error in capture['errors']:
+        await error_message(f"Steam top sellers {error}")
 
     if not preliminary:
         log_message("No top-seller metadata fetched.")
         return []
 
-    # Phase 2: update translations once per unique appid/title
-    for appid, title in {(g['appid'], g['title']) for g in preliminary}:
-        db.update_appid(appid, title)
-
-    # Phase 3: fetch CCU concurrently
-    appids = list({g['appid'] for g in preliminary})
-    tasks = [fetch_ccu(a) for a in appids]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    ccu_map = {
-        appid: (res if not isinstance(res, Exception) else 0)
-        for appid, res in zip(appids, results)
-    }
+    # Phase 2: update translations for every appid/title in one batch
+    await db.sync_translations('steam', [(g['appid'], g['title']) for g in preliminary])
+
+    # Phase 3: CCU from the bulk charts table, per-appid requests only for the rest
+    ccu_map, ccu_report = await CCU_PROVIDER.ccu_for(g['appid'] for g in preliminary)
+    log_message(f"CCU for {len(ccu_map)} apps in {ccu_report['elapsed_s']:.2f} s: "
+                f"{ccu_report['from_bulk']} from the charts table, {ccu_report['fallback']} fetched one by one "
+                f"({ccu_report['fallback_failed']} failed).")
 
     # Phase 4: assemble final games list
     ts = datetime.now().strftime('%Y-%m-%d %H')
@@ -158,9 +74,15 @@ async def update_steam_top_sellers(db: Database, write_db: bool = True) -> list:
         log_message(f"Recent update at {latest_ts}, skipping DB write.")
         return games
 
+    if capture['missing_pages']:
+        # Ranks after a missing page are still right, but the capture would read as
+        # those titles dropping off the chart for an hour.
+        await error_message(f"Steam pages {capture['missing_pages']} missing, skipping DB write.")
+        return games
+
     if games:
         if write_db:
-            db.insert_bulk_data(games)
+            await db.insert_bulk_data(games)
             log_message(f"Inserted {len(games)} SteamTopGames records.")
         else:
             log_message(f"Fetched {len(games)} SteamTopGames records (no DB write).")
@@ -168,6 +90,9 @@ async def update_steam_top_sellers(db: Database, write_db: bool = True) -> list:
         log_message("No games to insert after processing.")
     return games
 
+# Current top list for !gts and !gtsweekly, refreshed in the background (see top_list_cache.py)
+STEAM_TOP_LIST = TopListSnapshot('steam', lambda db: update_steam_top_sellers(db, write_db=False))
+
 async def gts_command(ctx, db, game_name: str = None):
     """
     If a game name is provided, the command will generate a graph
@@ -176,10 +101,10 @@ async def gts_command(ctx, db, game_name: str = None):
     """
     # If a game name is provided, try to generate a placements graph.
     if game_name is not None:
-        matched_game_name = get_best_game_match(game_name, db)
+        matched_game_name = await get_best_game_match(game_name, db)
         if matched_game_name:
             # Fetch data for the plot
-            aggregated_data = db.get_gts_placements(matched_game_name)
+            aggregated_data = await db.get_gts_placements(matched_game_name)
             if aggregated_data and aggregated_data.get("positions") and aggregated_data.get("placements"):
                 image_stream, discord_file = generate_gts_placements_plot(aggregated_data, matched_game_name, is_steam=True)
                 await ctx.send(file=discord_file)
@@ -198,9 +123,12 @@ async def gts_command(ctx, db, game_name: str = None):
         else:
             return str(ccu)
 
-    top_games = await update_steam_top_sellers(db, write_db=False)
-    latest_timestamp = db.get_latest_timestamp('SteamTopGames')
-    yesterday_games = db.get_yesterday_top_games(latest_timestamp)
+    top_games, _ = await STEAM_TOP_LIST.get(db)
+    if not top_games:
+        await ctx.send("The Steam top sellers are not available right now, try again in a minute.")
+        return
+    latest_timestamp = await db.get_latest_timestamp('SteamTopGames')
+    yesterday_games = await db.get_yesterday_top_games(latest_timestamp)
     
     # Limit to the top 15 games.
     top_games = top_games[:15]
@@ -238,62 +166,41 @@ async def gts_command(ctx, db, game_name: str = None):
     
     joined_response = '\n'.join(response_lines)
     
-    await ctx.send(f"**Top 15 Global Sellers on Steam:**\n{joined_response}")
+    await ctx.send(f"**Top 15 Global Sellers on Steam** ({STEAM_TOP_LIST.age_text()}):\n{joined_response}")
     
-async def gts_weekly_command(ctx, db: Database):
-    top_games = await update_steam_top_sellers(db, write_db=False)
-    latest_timestamp = db.get_latest_timestamp('SteamTopGames')
-    last_week_ranks = db.get_last_week_ranks(latest_timestamp, [game['appid'] for game in top_games[:25]])
-
-    number_of_days = {}
-    # Calculate the 7-day average rank for each game
-    game_avg_ranks_7d = {}
-    for appid, ranks in last_week_ranks.items():
-        game_avg_ranks_7d[appid] = sum(ranks) / len(ranks)
-        number_of_days[appid] = len(ranks)
-
-    # Calculate the 3-day average rank for each game
-    game_avg_ranks_3d = {}
-    for appid, ranks in last_week_ranks.items():
-        game_avg_ranks_3d[appid] = sum(ranks[-3:]) / min(len(ranks), 3)
-
-    # Sort the games based on their 7-day average rank
-    sorted_games = sorted(top_games, key=lambda game: game_avg_ranks_7d.get(game['appid'], float('inf')))
+async def gts_weekly_command(ctx, db: AsyncDatabase):
+    top_games, _ = await STEAM_TOP_LIST.get(db)
+    if not top_games:
+        await ctx.send("The Steam top sellers are not available right now, try again in a minute.")
+        return
+    top_games = top_games[:25]
+    # 3/7-day mean places and trends are kept current at ingest (RollingRankStats)
+    rank_stats = await db.get_rolling_rank_stats('steam', [game['appid'] for game in top_games])
+
+    def mean_7d(game):
+        stats = rank_stats.get(game['appid'])
+        return stats['mean_7d'] if stats and stats['mean_7d'] is not None else float('inf')
+
+    trend_symbols = {
+        'new': ':new:',
+        'up': ':small_red_triangle:',
+        'down': ':small_red_triangle_down:',
+        'steady': ':small_orange_diamond:',
+    }
 
     response = []
-
-    for game in sorted_games[:25]:
-        # Construct the line for each game
-        place = sorted_games.index(game) + 1
-        title = game['title']
-        discount = game['discount']
-        ccu = game['ccu']
-
-        avg_rank_7d = game_avg_ranks_7d.get(game['appid'], None)
-        avg_rank_3d = game_avg_ranks_3d.get(game['appid'], None)
-
-        if avg_rank_7d is not None and avg_rank_3d is not None:
-            # Determine the trend symbol based on the comparison of 3-day and 7-day average ranks
-            if abs(avg_rank_3d - avg_rank_7d) <= 1:
-                trend_symbol = ':small_orange_diamond:'
-            elif avg_rank_3d < avg_rank_7d:
-                trend_symbol = ':small_red_triangle:'
-            else:
-                trend_symbol = ':small_red_triangle_down:'
-                
-            if number_of_days[game['appid']] < 7:
-                trend_symbol = ':new:'
-
-            line = f"{place}. {trend_symbol} {title}"
+    for place, game in enumerate(sorted(top_games, key=mean_7d), 1):
+        stats = rank_stats.get(game['appid'])
+        trend_symbol = trend_symbols.get(stats['trend']) if stats else None
+        if trend_symbol:
+            line = f"{place}. {trend_symbol} {game['title']}"
         else:
-            line = f"{place}. {title}"
-
-
+            line = f"{place}. {game['title']}"
         response.append(line)
 
     joined_response = '\n'.join(response)
-    await ctx.send(f"**Top 25 Global Sellers on Steam, last week average:**\n{joined_response}")
-async def daily_steam_database_refresh(db: Database):
+    await ctx.send(f"**Top 25 Global Sellers on Steam, last week average** ({STEAM_TOP_LIST.age_text()}):\n{joined_response}")
+async def daily_steam_database_refresh(db: AsyncDatabase):
     while True:
         log_time = datetime.now()
         log_time += timedelta(seconds=get_seconds_until(21,0))
@@ -314,15 +221,76 @@ class SteamPipeline(BasePipeline):
 
     async def fetch(self):
         # fetch and store inside update_steam_top_sellers
-        return await update_steam_top_sellers(self.db)
+        games = await update_steam_top_sellers(self.db)
+        STEAM_TOP_LIST.update(games)
+        return games
 
     async def store(self, items):
         # skip BasePipeline.store since update_steam_top_sellers already wrote to DB
         return items
 
+class CCUPipeline(BasePipeline):
+    """Pipeline recording the hourly concurrent players of every app in the Steam charts table."""
+    def __init__(self, db):
+        super().__init__(name="steam_ccu", db=db, table="SteamCCU", interval_hours=1)
+
+    async def fetch(self):
+        return await CCU_PROVIDER.bulk_table()
+
+    async def store(self, items):
+        # One row per (appid, hour); a second run within the hour replaces its counts
+        rows = await self.db.insert_ccu(datetime.now().strftime('%Y-%m-%d %H'), items)
+        log_message(f"Stored CCU for {rows} Steam apps.")
+        return items
+
+
+async def ccu_command(ctx, db: AsyncDatabase, game_name: str):
+    """
+    Plots the last month's hourly concurrent players of a Steam game, with its peak,
+    average and 24h/7d changes.
+    """
+    matched_game_name = await get_best_game_match(game_name, db)
+    if not matched_game_name:
+        await ctx.send(f"Could not find a match for game: '{game_name}'.")
+        return
+    summary = await db.get_ccu_summary(matched_game_name)
+    if not summary or len(summary['ccu']) < 2:
+        await ctx.send(f"Could not find enough CCU data to generate a plot for '{matched_game_name}'.")
+        return
+
+    def format_delta(delta):
+        return "N/A" if delta is None else f"{delta:+,}"
+
+    times = [datetime.strptime(ts, '%Y-%m-%d %H') for ts in summary['timestamps']]
+    rcParams.update({'font.size': 7})
+    plt.rcParams['font.family'] = ['sans-serif']
+    plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica', 'DejaVu Sans']
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.plot(times, summary['ccu'], linestyle='-', color='#7289DA', linewidth=1)
+    ax.fill_between(times, summary['ccu'], color='#7289DA', alpha=0.2)
+    ax.set_title(f"{matched_game_name.upper()}, LAST MONTH STEAM CONCURRENT PLAYERS", fontsize=6, weight='bold', loc='left')
+    ax.set_ylim(bottom=0)
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda y, _: f"{int(y):,}"))
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    fig.autofmt_xdate()
+    plt.tight_layout()
+
+    image_stream = io.BytesIO()
+    fig.savefig(image_stream, format='png')
+    image_stream.seek(0)
+    plt.close(fig)
+
+    await ctx.send(
+        f"**{matched_game_name}** CCU: {summary['current']:,} ({summary['latest']}:00), "
+        f"peak {summary['peak']:,}, average {summary['average']:,.0f}, "
+        f"24h {format_delta(summary['delta_24h'])}, 7d {format_delta(summary['delta_7d'])}",
+        file=discord.File(fp=image_stream, filename="ccu_plot.png"))
+
+
 if __name__ == "__main__":
     # Example usage (optional, for testing)
-    # db = Database("steam_top_games.db")
+    # db = AsyncDatabase("steam_top_games.db")  # await db.start() before use
     # class DummyContext:
     #     async def send(self, message=None, file=None):
     #         if message:
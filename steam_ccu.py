@@ -0,0 +1,127 @@
+"""
+Concurrent player counts (CCU) for a list of Steam appids.
+
+ISteamChartsService/GetGamesByConcurrentPlayers returns the current player count of
+the most played apps (thousands of them) in one response. SteamCCUProvider pulls that
+table once per call and only asks GetNumberOfCurrentPlayers for the appids it does
+not contain: usually pre-orders, DLC and small titles. Those per-appid requests share
+one pooled session and at most FALLBACK_CONCURRENCY run at a time.
+
+    provider = SteamCCUProvider(os.getenv('STEAM_API_KEY'))
+    ccus, report = await provider.ccu_for(['730', '2277560'])
+    report  # {'bulk_apps', 'from_bulk', 'fallback', 'fallback_failed', 'elapsed_s'}
+    await provider.close()
+
+Appids whose count cannot be fetched get 0, as before.
+"""
+
+import asyncio
+import random
+import time
+
+import aiohttp
+
+CHARTS_URL = "https://api.steampowered.com/ISteamChartsService/GetGamesByConcurrentPlayers/v1/"
+CURRENT_PLAYERS_URL = "https://api.steampowered.com/ISteamUserStats/GetNumberOfCurrentPlayers/v1/"
+FALLBACK_CONCURRENCY = 16
+RETRIES = 3
+RETRY_DELAY = 1.0
+TIMEOUT = 20
+
+
+class SteamCCUProvider:
+    def __init__(self, api_key, fallback_concurrency=FALLBACK_CONCURRENCY, retries=RETRIES,
+                 retry_delay=RETRY_DELAY, timeout=TIMEOUT):
+        self.api_key = api_key
+        self.fallback_concurrency = fallback_concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self._session = None
+        self._loop = None
+
+    async def _get_session(self):
+        # Sessions belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit_per_host=self.fallback_concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_json(self, url, params):
+        session = await self._get_session()
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with session.get(url, params=params) as resp:
+                    resp.raise_for_status()
+                    return await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1) * (0.5 + random.random()))
+
+    async def bulk_table(self):
+        """
+        Returns {appid: current players} for every app in the charts table. Rows without an
+        appid are skipped and a missing or null count reads as 0.
+        """
+        data = await self._get_json(CHARTS_URL, {'key': self.api_key, 'format': 'json'})
+        ranks = data.get('response', data).get('ranks')
+        if ranks is None:
+            raise ValueError(f"Unexpected GetGamesByConcurrentPlayers payload: {str(data)[:200]}")
+        return {
+            str(row['appid']): int(row.get('concurrent_in_game') or 0)
+            for row in ranks
+            if isinstance(row, dict) and row.get('appid') is not None
+        }
+
+    async def fetch_one(self, appid):
+        """Current players of one appid; 0 if Steam reports no count for it."""
+        data = await self._get_json(CURRENT_PLAYERS_URL, {'key': self.api_key, 'appid': appid})
+        response = data.get('response', {})
+        return response.get('player_count', 0) if response.get('result') == 1 else 0
+
+    async def ccu_for(self, appids):
+        """
+        Returns ({appid: ccu} for every appid, report). The bulk table is fetched once;
+        appids missing from it (or all of them, if it fails) use the bounded fallback.
+        """
+        start = time.perf_counter()
+        appids = list(dict.fromkeys(str(appid) for appid in appids))
+        try:
+            table = await self.bulk_table()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError, AttributeError):
+            table = {}
+
+        ccus = {appid: table[appid] for appid in appids if appid in table}
+        missing = [appid for appid in appids if appid not in table]
+        semaphore = asyncio.Semaphore(self.fallback_concurrency)
+
+        async def fallback(appid):
+            async with semaphore:
+                return await self.fetch_one(appid)
+
+        results = await asyncio.gather(*(fallback(appid) for appid in missing), return_exceptions=True)
+        failed = 0
+        for appid, result in zip(missing, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                failed += 1
+                result = 0
+            ccus[appid] = result
+
+        return ccus, {
+            'bulk_apps': len(table),
+            'from_bulk': len(appids) - len(missing),
+            'fallback': len(missing),
+            'fallback_failed': failed,
+            'elapsed_s': time.perf_counter() - start,
+        }
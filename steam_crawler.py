@@ -0,0 +1,151 @@
+"""
+Concurrent crawler for the Steam global top sellers chart.
+
+The chart is served 100 rows at a time by store.steampowered.com/search/results.
+SteamTopSellerCrawler requests every page of a capture at once over one shared
+aiohttp session, whose connector pools keep-alive connections and caps the number of
+concurrent connections per host. Each page is retried on its own. The rows are put
+together in page order, whatever order the pages arrive in, and ranked 1, 2, 3, ...
+over the rows that have an appid, as the sequential scraper did (bundles have none
+and are skipped). A page that cannot be fetched is reported in missing_pages; the
+ranks after it are then shifted, which is why such captures are not stored.
+
+    crawler = SteamTopSellerCrawler()
+    capture = await crawler.crawl()
+    capture['games']          # [{'rank', 'appid', 'title', 'discount'}, ...] by rank
+    capture['missing_pages']  # pages that failed every attempt
+    capture['elapsed_s']      # wall-clock time of the whole capture
+    await crawler.close()
+
+A full capture takes about as long as the slowest single page.
+"""
+
+import asyncio
+import random
+import time
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+SEARCH_URL = (
+    "https://store.steampowered.com/search/results/"
+    "?query&start={start}&count={count}&dynamic_data=&sort_by=_ASC"
+    "&supportedlang=english&snr=1_7_7_globaltopsellers_7"
+    "&filter=globaltopsellers&infinite=1"
+)
+PAGES = 5
+PAGE_SIZE = 100
+PER_HOST = 5
+RETRIES = 3
+# A capture is taken once an hour; page retries back off briefly instead of the
+# minutes aiohttp_retry waits between attempts.
+RETRY_DELAY = 1.0
+PAGE_TIMEOUT = 20
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PageFetchError(Exception):
+    """A page failed every attempt."""
+
+
+def parse_results_page(html):
+    """Turns one results_html fragment into rows, in chart order; crawl() ranks them."""
+    soup = BeautifulSoup(html, 'html.parser')
+    rows = []
+    for d in soup.select('.search_result_row'):
+        appid = d.get('data-ds-appid')
+        if not appid:
+            continue
+        title = d.select_one('.title').text.strip() if d.select_one('.title') else "Unknown"
+        disc = d.select_one('.discount_pct')
+        price = d.select_one('.discount_final_price, .search_price')
+        discount = disc.text.strip() if disc else ("Free" if price and "free" in price.text.lower() else "")
+        rows.append({
+            'appid': appid,
+            'title': title,
+            'discount': discount,
+        })
+    return rows
+
+
+class SteamTopSellerCrawler:
+    def __init__(self, pages=PAGES, page_size=PAGE_SIZE, per_host=PER_HOST, retries=RETRIES,
+                 retry_delay=RETRY_DELAY, timeout=PAGE_TIMEOUT):
+        self.pages = pages
+        self.page_size = page_size
+        self.per_host = per_host
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self._session = None
+        self._loop = None
+
+    async def _get_session(self):
+        # Sessions belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit_per_host=self.per_host, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def fetch_page(self, page):
+        """Returns (rows, attempts) for one page; raises PageFetchError after the last retry."""
+        session = await self._get_session()
+        offset = page * self.page_size
+        url = SEARCH_URL.format(start=offset, count=self.page_size)
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with session.get(url) as resp:
+                    if resp.status in RETRY_STATUSES:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status, message=resp.reason)
+                    resp.raise_for_status()
+                    html = (await resp.json(content_type=None)).get("results_html", "")
+                # BeautifulSoup is slow enough to stall the other pages; parse off the loop
+                return await asyncio.to_thread(parse_results_page, html), attempt
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRY_STATUSES:
+                    raise PageFetchError(f"page {page + 1}: HTTP {e.status}") from e
+                last_error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                last_error = e
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1) * (0.5 + random.random()))
+        raise PageFetchError(f"page {page + 1}: {type(last_error).__name__}: {last_error}") from last_error
+
+    async def crawl(self):
+        """
+        Fetches every page concurrently. Returns {'games', 'missing_pages', 'errors',
+        'attempts', 'elapsed_s'}; games are in page order and ranked contiguously.
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self.fetch_page(page) for page in range(self.pages)), return_exceptions=True)
+
+        games, missing, errors, attempts = [], [], [], {}
+        for page, result in enumerate(results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                missing.append(page + 1)
+                errors.append(str(result))
+                continue
+            rows, attempts[page + 1] = result
+            games.extend(rows)
+        for rank, game in enumerate(games, 1):
+            game['rank'] = rank
+        return {
+            'games': games,
+            'missing_pages': missing,
+            'errors': errors,
+            'attempts': attempts,
+            'elapsed_s': time.perf_counter() - start,
+        }
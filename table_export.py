@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Streaming export of the history tables to CSV, Parquet or Arrow IPC.
+
+Rows are read with a chunked cursor (fetchmany) over a sargable timestamp range
+and written out chunk by chunk, so memory use depends on --chunk-size and not on
+the size of the export. By default the output is partitioned per day:
+
+    exports/ShortPositions/date=2025-07-25/part-0.parquet
+    exports/ShortPositions/date=2025-07-26/part-0.parquet
+
+Parquet and Arrow IPC output need pyarrow. Rows that retention.py has already moved
+out of the database are not included; they are in ARCHIVE_DIR in the same layout.
+
+Usage:
+    python table_export.py ShortPositions PositionHolders --start 2025-07-25 --end 2025-08-25
+    python table_export.py SteamTopGames --start 2025-08-01 --end 2025-08-31 --format parquet
+    python table_export.py PSTopGames --start 2025-08-01 --end 2025-08-01 --format arrow --no-partition
+"""
+
+import argparse
+import csv
+import os
+
+from database import RANK_TABLE_SOURCES, Database, day_range_bounds
+
+EXPORT_TABLES = ('ShortPositions', 'PositionHolders', 'SteamTopGames', 'PSTopGames')
+FORMATS = {'csv': 'csv', 'parquet': 'parquet', 'arrow': 'arrow'}  # format -> file extension
+CHUNK_SIZE = 10000
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow export require the 'pyarrow' package") from None
+    return pyarrow
+
+
+def _arrow_schema(db, table):
+    """Builds a fixed Arrow schema from the declared SQLite column types."""
+    pa = _import_pyarrow()
+    fields = []
+    for _, name, declared_type, *_ in db.conn.execute(f"PRAGMA table_info({table})"):
+        declared_type = (declared_type or '').upper()
+        if 'INT' in declared_type:
+            arrow_type = pa.int64()
+        elif declared_type in ('REAL', 'FLOAT', 'DOUBLE'):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowWriter:
+    """Writes chunks as record batches to a Parquet file or an Arrow IPC file."""
+
+    def __init__(self, path, schema, fmt):
+        pa = _import_pyarrow()
+        self._pa = pa
+        self._schema = schema
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, schema)
+        else:
+            self._writer = pa.ipc.new_file(path, schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        batch = self._pa.record_batch(
+            [self._pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema)
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+def _open_writer(path, columns, schema, fmt):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if fmt == 'csv':
+        return _CsvWriter(path, columns)
+    return _ArrowWriter(path, schema, fmt)
+
+
+def iter_chunks(db, table, start_date, end_date, chunk_size=CHUNK_SIZE):
+    """
+    Yields (columns, rows) chunks of `table` between start_date and end_date
+    (inclusive, 'YYYY-MM-DD'), ordered by timestamp and id.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Invalid table name: {table}")
+    lower, upper = day_range_bounds(start_date, end_date)
+    # Rank rows may be spread over monthly shards (rank_shards.py), oldest first
+    schemas = db.rank_schemas(lower, upper) if table in RANK_TABLE_SOURCES else ['main']
+    for schema in schemas:
+        source, source_params = db.rank_row_source(table, lower, upper, schema)
+        cursor = db.conn.cursor()
+        try:
+            # upper is the day after end_date, which sorts before all of its timestamps
+            cursor.execute(f"SELECT * FROM {source} ORDER BY timestamp, id", source_params)
+            columns = [description[0] for description in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield columns, rows
+        finally:
+            cursor.close()
+
+
+def export_table(db, table, start_date, end_date, output, fmt='csv', partition_by_day=True,
+                 chunk_size=CHUNK_SIZE):
+    """
+    Exports one table. With partition_by_day `output` is a directory and one file is
+    written per day under output/<table>/date=YYYY-MM-DD/; otherwise `output` is the
+    file to write. Returns {path: row count}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid export format: {fmt}")
+    schema = _arrow_schema(db, table) if fmt != 'csv' else None
+
+    written = {}
+    writer = path = None
+    try:
+        for columns, rows in iter_chunks(db, table, start_date, end_date, chunk_size):
+            if not partition_by_day:
+                if writer is None:
+                    path = output
+                    writer = _open_writer(path, columns, schema, fmt)
+                    written[path] = 0
+                writer.write(rows)
+                written[path] += len(rows)
+                continue
+
+            # Rows arrive ordered by timestamp, so each day is one contiguous run.
+            ts_index = columns.index('timestamp')
+            start = 0
+            while start < len(rows):
+                day = rows[start][ts_index][:10]
+                end = start
+                while end < len(rows) and rows[end][ts_index][:10] == day:
+                    end += 1
+                day_path = os.path.join(output, table, f"date={day}", f"part-0.{FORMATS[fmt]}")
+                if day_path != path:
+                    if writer is not None:
+                        writer.close()
+                    path = day_path
+                    writer = _open_writer(path, columns, schema, fmt)
+                    written[path] = 0
+                writer.write(rows[start:end])
+                written[path] += end - start
+                start = end
+
+        if not partition_by_day and writer is None:
+            # An empty range still produces the (header-only) file that was asked for.
+            columns = [row[1] for row in db.conn.execute(f"PRAGMA table_info({table})")]
+            path = output
+            writer = _open_writer(path, columns, schema, fmt)
+            written[path] = 0
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('tables', nargs='+', choices=EXPORT_TABLES, help='Tables to export')
+    parser.add_argument('--start', required=True, help='First day to export (YYYY-MM-DD)')
+    parser.add_argument('--end', required=True, help='Last day to export (YYYY-MM-DD, inclusive)')
+    parser.add_argument('--db', default='steam_top_games.db', help='Database file')
+    parser.add_argument('--format', default='csv', choices=FORMATS, help='Output format')
+    parser.add_argument('--output', default='exports', help='Output directory')
+    parser.add_argument('--no-partition', action='store_true',
+                        help='Write one file per table instead of one per day')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per chunk')
+    parser.add_argument('--rank-shards', help='Monthly rank shard directory, if sharding is enabled')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f'Database file not found: {args.db}')
+
+    with Database(args.db, read_only=True, rank_shards=args.rank_shards) as db:
+        for table in args.tables:
+            output = args.output
+            if args.no_partition:
+                output = os.path.join(args.output, f"{table}_{args.start}_{args.end}.{FORMATS[args.format]}")
+            written = export_table(db, table, args.start, args.end, output, args.format,
+                                   partition_by_day=not args.no_partition, chunk_size=args.chunk_size)
+            print(f'Exported {sum(written.values())} {table} rows to {len(written)} file(s) under {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+In-memory "current top list" snapshots for the store chart commands.
+
+Scraping a store chart takes seconds and hundreds of requests, so the !gts, !gtsweekly
+and !gtsps lists are served from a TopListSnapshot instead of a live scrape. A
+background task refreshes each snapshot on a short cadence; commands read the last
+snapshot and show its age. Refreshes are single-flight: while one is running, every
+other caller (a burst of commands, or the background task) waits for that same
+refresh instead of starting its own.
+
+    snapshot = TopListSnapshot('steam', lambda db: update_steam_top_sellers(db, write_db=False))
+    bot.loop.create_task(snapshot.run(db))     # refresh every REFRESH_INTERVAL seconds
+
+    games, fetched_at = await snapshot.get(db)  # refreshes first only if missing or stale
+    snapshot.age_text()                         # 'updated 4 min ago'
+
+A failed or empty refresh keeps the previous snapshot.
+"""
+
+import asyncio
+import time
+import traceback
+from datetime import datetime
+
+from general_utils import log_message
+
+REFRESH_INTERVAL = 15 * 60
+# A command refreshes the list itself only if the background task has fallen this far behind
+MAX_AGE = 60 * 60
+
+
+class TopListSnapshot:
+    def __init__(self, name, fetch, refresh_interval=REFRESH_INTERVAL, max_age=MAX_AGE):
+        self.name = name
+        self.fetch = fetch  # async fetch(db) -> list of games
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.items = None
+        self.fetched_at = None
+        self._fetched_monotonic = None
+        self._inflight = None
+        self.refreshes = 0
+        self.failures = 0
+        self.joined = 0
+
+    def age(self):
+        """Seconds since the snapshot was taken, None if there is none."""
+        if self._fetched_monotonic is None:
+            return None
+        return time.monotonic() - self._fetched_monotonic
+
+    def age_text(self):
+        age = self.age()
+        if age is None:
+            return "not updated yet"
+        if age < 60:
+            return "updated just now"
+        if age < 3600:
+            return f"updated {int(age // 60)} min ago"
+        return f"updated {age / 3600:.1f} h ago"
+
+    def update(self, items):
+        """Replaces the snapshot with a list fetched elsewhere, e.g. by the hourly pipeline."""
+        if items:
+            self.items = list(items)
+            self.fetched_at = datetime.now()
+            self._fetched_monotonic = time.monotonic()
+
+    async def _refresh(self, db):
+        start = time.perf_counter()
+        try:
+            items = await self.fetch(db)
+        except Exception:
+            self.failures += 1
+            log_message(f"Refreshing the {self.name} top list failed, keeping the previous snapshot.")
+            traceback.print_exc()
+            return self.items
+        self.refreshes += 1
+        if not items:
+            self.failures += 1
+            log_message(f"Refreshing the {self.name} top list returned nothing, keeping the previous snapshot.")
+            return self.items
+        self.update(items)
+        log_message(f"Refreshed the {self.name} top list ({len(items)} games) in {time.perf_counter() - start:.2f} s.")
+        return self.items
+
+    async def refresh(self, db):
+        """Refreshes the snapshot, or joins the refresh already in flight. Returns the items."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._refresh(db))
+        else:
+            self.joined += 1
+        # A cancelled caller must not cancel the refresh the others are waiting for
+        return await asyncio.shield(self._inflight)
+
+    async def get(self, db):
+        """
+        Returns (items, fetched_at). Refreshes first only when there is no snapshot or it
+        is older than max_age; items is None if no list could be fetched at all.
+        """
+        age = self.age()
+        if age is None or age > self.max_age:
+            await self.refresh(db)
+        return self.items, self.fetched_at
+
+    async def run(self, db):
+        """Background task: refreshes the snapshot every refresh_interval seconds."""
+        while True:
+            age = self.age()
+            if age is not None and age < self.refresh_interval:
+                await asyncio.sleep(self.refresh_interval - age)
+                continue
+            await self.refresh(db)
+            age = self.age()
+            if age is None or age >= self.refresh_interval:
+                # The refresh failed; retry sooner than the normal cadence, but not in a loop
+                await asyncio.sleep(min(60, self.refresh_interval))
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'games': len(self.items) if self.items else 0,
+            'age_s': self.age(),
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'joined': self.joined,
+        }
@@ -51,33 +51,17 @@ def create_wuchang_plot_delta_days():
     from general_utils import generate_comparison_placements_plot_delta_days
     
     with Database(db_name) as db:
-        # Get data for primary game
-        primary_data = db.get_game_placements_delta_days(
-            primary_game_name, 
-            primary_release_date, 
-            days_before_release
-        )
-        
-        # Get data for comparison game
-        comparison_data = db.get_game_placements_delta_days(
-            comparison_game_name, 
-            comparison_release_date, 
-            days_before_release
-        )
-        
-        # Combine the data
-        games_data = {}
-        if primary_data:
-            games_data[primary_game_name] = primary_data
-            print(f"Found data for {primary_game_name}: {len(primary_data['delta_days'])} data points")
-        else:
-            print(f"No data found for {primary_game_name}")
-            
-        if comparison_data:
-            games_data[comparison_game_name] = comparison_data
-            print(f"Found data for {comparison_game_name}: {len(comparison_data['delta_days'])} data points")
-        else:
-            print(f"No data found for {comparison_game_name}")
+        # Get data for both games in one batched lookup
+        games_data = db.get_multiple_games_placements_delta_days([
+            {'game_name': primary_game_name, 'release_date_str': primary_release_date},
+            {'game_name': comparison_game_name, 'release_date_str': comparison_release_date},
+        ], days_before_release)
+
+        for game_name in (primary_game_name, comparison_game_name):
+            if game_name in games_data:
+                print(f"Found data for {game_name}: {len(games_data[game_name]['delta_days'])} data points")
+            else:
+                print(f"No data found for {game_name}")
 
     if len(games_data) >= 2:
         plot_buffer = generate_comparison_placements_plot_delta_days(